@@ -0,0 +1,72 @@
+"""
+Times the walk which indexes a synthetic template tree (see tree.py) with a .composerignore applied.
+Usage: python benchmarks/bench_ignore.py [--dirs 500] [--files-per-dir 100]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from composition.ignore import IgnoreMatcher  # noqa: E402
+from composition.tree import AppTree  # noqa: E402
+
+PATTERNS = [
+    "# Synthetic ignore file",
+    "*.log",
+    "!important.log",
+    "/build/",
+    "**/node_modules/",
+    "docs/**/*.md",
+    "*.tmp",
+]
+
+
+def make_tree(root, dirs, files_per_dir):
+    for d in range(dirs):
+        directory = os.path.join(root, f"group{d % 10}", f"dir{d}")
+        if d % 50 == 0:
+            directory = os.path.join(directory, "node_modules")
+        os.makedirs(directory, exist_ok=True)
+        for f in range(files_per_dir):
+            extension = [".yaml", ".log", ".txt", ".tmp", ".configmap"][f % 5]
+            open(os.path.join(directory, f"file{f}{extension}"), "w").close()
+    os.makedirs(os.path.join(root, "build"), exist_ok=True)
+    open(os.path.join(root, "build", "output.bin"), "w").close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dirs", type=int, default=500)
+    parser.add_argument("--files-per-dir", type=int, default=100)
+    args = parser.parse_args()
+    workspace = tempfile.mkdtemp()
+    try:
+        source = os.path.join(workspace, "source")
+        make_tree(source, args.dirs, args.files_per_dir)
+        print(f"Tree: {args.dirs} directories, {args.dirs * args.files_per_dir} files")
+
+        start = time.perf_counter()
+        matcher = IgnoreMatcher(PATTERNS, source)
+        print(f"Compile matcher: {(time.perf_counter() - start) * 1000:.2f}ms")
+
+        start = time.perf_counter()
+        tree = AppTree(source, matcher)
+        with_ignore = time.perf_counter() - start
+
+        start = time.perf_counter()
+        AppTree(source)
+        plain = time.perf_counter() - start
+
+        indexed = sum(len(files) for _, files in tree.directories.values())
+        print(f"Tree walk with ignore: {with_ignore:.2f}s ({indexed} files indexed)")
+        print(f"Tree walk without ignore: {plain:.2f}s")
+    finally:
+        shutil.rmtree(workspace)
+
+
+if __name__ == "__main__":
+    main()
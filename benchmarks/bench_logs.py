@@ -0,0 +1,64 @@
+"""
+Measures log throughput in lines per second against a fake log producer, comparing the old line by line logging
+with the raw pass-through and the multiplexed stream used for several sub-apps.
+Usage: python benchmarks/bench_logs.py [--lines 500000] [--streams 4]
+"""
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from composition import cli_backend, logstream  # noqa: E402
+
+
+def producer(lines):
+    line = "2023-02-25T14:03:47.982Z web_1 | GET /api/v1/status 200 0.41ms user-agent=benchmark"
+    return [sys.executable, "-c",
+            f"import sys\nline = {line!r} + '\\n'\nfor _ in range({lines} // 1000): sys.stdout.write(line * 1000)"]
+
+
+def timed(name, lines, function):
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    sys.stderr.write(f"{name:<35} {lines / elapsed:>14,.0f} lines/s\n")
+
+
+def baseline(lines):
+    # What docker-compose logs manages on its own
+    subprocess.run(producer(lines), stdout=subprocess.DEVNULL, check=True)
+
+
+def logged(lines):
+    # The old behaviour: every line decoded and sent through logging
+    process = subprocess.Popen(producer(lines), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    with process.stdout:
+        cli_backend.log_subprocess_output(process.stdout)
+    process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=500000)
+    parser.add_argument("--streams", type=int, default=4)
+    args = parser.parse_args()
+    devnull = open(os.devnull, "w")
+    logging.basicConfig(level=logging.INFO, stream=devnull)
+    sys.stdout = devnull
+    timed("producer only", args.lines, lambda: baseline(args.lines))
+    timed("logging each line (old)", args.lines, lambda: logged(args.lines))
+    timed("raw pass-through", args.lines, lambda: cli_backend.unbuffered_command(*producer(args.lines), raw=True))
+    per_stream = args.lines // args.streams
+    targets = [(f"app/subapp-{i}", producer(per_stream)) for i in range(args.streams)]
+    timed(f"multiplexed ({args.streams} streams)", per_stream * args.streams,
+          lambda: logstream.stream_logs(targets))
+    timed(f"multiplexed with --grep", per_stream * args.streams,
+          lambda: logstream.stream_logs(targets, grep="status 500"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Times how long the composer CLI takes to start for commands that never touch docker.
+Usage: python benchmarks/bench_startup.py [--runs 20] [--max-ms 250]
+Exits with a non-zero code if the median of any command is above --max-ms, so it can be used in CI.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMANDS = [["version"], ["list", "-q"], ["--help"]]
+
+
+def time_command(args, env, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-m", "composition.composer", *args], env=env, cwd=ROOT,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--max-ms", type=float, default=None)
+    args = parser.parse_args()
+    home = tempfile.mkdtemp()
+    # No docker-compose on the PATH, none of these commands should need it
+    env = dict(os.environ, HOME=home, PATH=os.path.dirname(sys.executable), PYTHONPATH=ROOT)
+    interpreter = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], env=env, check=True)
+        interpreter.append((time.perf_counter() - start) * 1000)
+    print(f"{'COMMAND':<20} {'MEDIAN':>10} {'MIN':>10} {'MAX':>10}")
+    print(f"{'(python -c pass)':<20} {statistics.median(interpreter):>8.1f}ms {min(interpreter):>8.1f}ms "
+          f"{max(interpreter):>8.1f}ms")
+    failed = False
+    for command in COMMANDS:
+        timings = time_command(command, env, args.runs)
+        median = statistics.median(timings)
+        print(f"{' '.join(command):<20} {median:>8.1f}ms {min(timings):>8.1f}ms {max(timings):>8.1f}ms")
+        if args.max_ms is not None and median > args.max_ms:
+            failed = True
+    if failed:
+        print(f"Startup time is above {args.max_ms}ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
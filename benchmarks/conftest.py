@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The fake docker-compose and app generator are shared with the tests
+sys.path.insert(0, os.path.join(ROOT, "test"))
+sys.path.insert(0, ROOT)
+
+import fake_compose  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def composer_home(monkeypatch, tmp_path):
+    home = tmp_path / "home"
+    home.mkdir()
+    monkeypatch.setenv("HOME", str(home))
+    from composition.storage import create_storage_if_not_exist
+    create_storage_if_not_exist()
+    return home
+
+
+@pytest.fixture
+def fake_docker(monkeypatch, tmp_path):
+    """Puts the fake docker-compose first on the PATH, returns the file its calls are recorded in."""
+    calls = str(tmp_path / "calls.log")
+    bin_dir = str(tmp_path / "bin")
+    fake_compose.install(bin_dir, log_lines=int(os.environ.get("BENCH_LOG_LINES", 1000)), calls=calls)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    from composition import cli_backend
+    monkeypatch.setattr(cli_backend, "_compose_binary", None)
+    return calls
@@ -0,0 +1,61 @@
+"""
+Times composer's main paths at several app sizes against the fake docker-compose, so scaling regressions show up
+without a docker daemon.
+Usage: python -m pytest benchmarks [--benchmark-compare] [-k large]
+"""
+import itertools
+import os
+
+import pytest
+
+from apptree import generate_app
+from composition import directory, storage
+from composition.models import Context
+from composition.uninstall import uninstall_application
+
+SIZES = {
+    "small": dict(subapps=1, depth=1, configmaps=2, files=10, values=10),
+    "medium": dict(subapps=10, depth=2, configmaps=10, files=50, values=100),
+    "large": dict(subapps=50, depth=3, configmaps=20, files=100, values=1000),
+}
+ids = itertools.count()
+
+
+@pytest.fixture(params=list(SIZES))
+def app(request, tmp_path, monkeypatch, fake_docker):
+    root = generate_app(str(tmp_path / "app"), **SIZES[request.param])
+    monkeypatch.chdir(root)
+    return root
+
+
+def install(application_id=None):
+    application_id = application_id or f"bench-{next(ids)}"
+    directory.handle_install(application_id=application_id, always_pull="false")
+    return application_id
+
+
+def test_install(benchmark, app):
+    benchmark.pedantic(install, rounds=3, iterations=1)
+
+
+@pytest.mark.parametrize("installed", [10, 100, 1000])
+def test_list(benchmark, installed):
+    # Listing only depends on how many applications are installed, so their records are written directly
+    for i in range(installed):
+        os.makedirs(storage.get_compose_loc(f"bench-{i}"))
+        storage.append_to_app_config({"name": "parent", "version": "1.0.0", "guid": "guid", "timestamp": float(i),
+                                      "compose_name": "/app/template.yaml"}, f"bench-{i}")
+    applications = benchmark(Context.get_applications)
+    assert len(applications) == installed
+
+
+def test_logs(benchmark, app, capfd):
+    application_id = install()
+    benchmark(directory.handle_logs, [application_id])
+    assert "log line" in capfd.readouterr().out
+
+
+def test_uninstall(benchmark, app):
+    benchmark.pedantic(lambda application_id: uninstall_application([application_id], False, False),
+                       setup=lambda: ((install(),), {}), rounds=3, iterations=1)
+    assert Context.get_applications() == []
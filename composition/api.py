@@ -1,79 +1,42 @@
 import logging
 import os.path
-import subprocess
-import sys
 
-from composition import storage
+from composition import storage, tracing
+from composition.backend import get_backend
 from composition.models import Status
 
 
-def is_compose_installed():
-    return compose_cmd("docker-compose", "version").returncode == 0
-
-
-def compose_cmd(*args, shell=True):
-    logging.debug(f"Running command: {args}")
-    return subprocess.run(args, capture_output=True, text=True, shell=shell)
-
-
-def compose_up(app_name, path, application_id):
-    out = compose_cmd(f"docker-compose", "-f", path, "up", "-d", shell=False)
-    if out.returncode != 0 or "error" in out.stderr.lower():
-        storage.update_status(application_id, Status.ERROR)
-        logging.error(f"Error: {out.stderr}")
+def compose_up(app_name, path):
+    with tracing.span("up", subapp=app_name):
+        succeeded = get_backend().up(path)
+    if not succeeded:
         logging.error(f"docker-compose up has failed for app {app_name}")
-        sys.exit(1)
-    logging.debug(out)
+        return False
+    return True
 
 
 def compose_down(path, application_id, force=False):
     path = os.path.join(path, "docker-compose.yaml")
-    if force:
-        out = compose_cmd("docker-compose", "-f", path, "down", "--timeout=0", shell=False)
-    else:
-        out = compose_cmd("docker-compose", "-f", path, "down", shell=False)
-    if out.returncode != 0 or "error" in out.stderr.lower():
+    with tracing.span("down", path=path):
+        succeeded = get_backend().down(path, force)
+    if not succeeded:
         storage.update_status(application_id, Status.ERROR)
-        logging.warning(f"Error: {out.stderr}")
         logging.warning(f"docker-compose down has failed for app {application_id}")
         logging.warning("Still removing application, but some containers might still persist")
-    logging.debug(out)
-
+        return False
+    return True
 
-def unbuffered_command(*command_line_args):
-    process = subprocess.Popen(command_line_args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    with process.stdout:
-        log_subprocess_output(process.stdout)
-    return process.wait()  # 0 means success
 
-
-def log_subprocess_output(pipe):
-    for line in iter(pipe.readline, b''):  # b'\n'- separated lines
-        logging.info(line.decode().rstrip('\n'))
-
-
-def compose_logs(path, follow, service):
-    path = os.path.join(path, "docker-compose.yaml")
-    command_to_run = ["docker-compose", "-f", path, "logs"]
-    if follow:
-        command_to_run.append("--follow")
-    if service is not None:
-        command_to_run.append(service)
-    out = unbuffered_command(*command_to_run)
-    if out != 0:
+def compose_logs(targets, follow, service, tail=None, since=None, grep=None):
+    """Streams the logs of several composes at once, targets is a list of (prefix, path) or (prefix, path, services)
+    to only include those services rather than `service` (or everything). Only lines matching grep are output."""
+    targets = [(target[0], os.path.join(target[1], "docker-compose.yaml"),
+                target[2] if len(target) > 2 else [service] if service is not None else None) for target in targets]
+    if not get_backend().logs(targets, follow, tail=tail, since=since, grep=grep):
         logging.error("An error has occurred retrieving logs from application.")
 
 
 def cmd(path, arg_list):
     path = os.path.join(path, "docker-compose.yaml")
-    command_to_run = ["docker-compose", "-f", path] + arg_list
-    logging.debug(f"Running command: {command_to_run}")
-    out = unbuffered_command(*command_to_run)
-    if out != 0:
+    if not get_backend().cmd(path, arg_list):
         logging.error(f"An error has occurred running command {arg_list}.")
-
-
-def compose_pull(path):
-    command_to_run = ["docker-compose", "-f", path, "pull", "--ignore-pull-failures"]
-    logging.info("Always pull is enabled. Pulling latest images. Will ignore failures of local images.")
-    unbuffered_command(*command_to_run)
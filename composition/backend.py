@@ -0,0 +1,74 @@
+import importlib
+import logging
+import os
+import sys
+import threading
+
+from composition.models import Context
+
+# Every container runtime backend, selected with --backend or the COMPOSER_BACKEND environment variable
+BACKENDS = {
+    "cli": "composition.cli_backend.CliBackend",
+    "engine": "composition.engine_backend.EngineBackend",
+}
+DEFAULT_BACKEND = "cli"
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+class ComposeBackend:
+    """The operations composer needs from a container runtime. `path` is always a rendered docker-compose.yaml,
+    every method returns True if it succeeded."""
+    name = None
+
+    def check(self):
+        """Exits if the backend can't be used, so an install or upgrade finds out before it changes anything."""
+
+    def up(self, path):
+        raise NotImplementedError
+
+    def down(self, path, force=False):
+        raise NotImplementedError
+
+    def image_exists(self, image):
+        """True if the image is already available locally."""
+        raise NotImplementedError
+
+    def pull_image(self, image):
+        raise NotImplementedError
+
+    def logs(self, targets, follow=False, tail=None, since=None, grep=None):
+        """targets is a list of (prefix, path, services), the logs of all of them are streamed at once. services is
+        a list of the service names to include, or None for all of them."""
+        raise NotImplementedError
+
+    def cmd(self, path, arg_list):
+        raise NotImplementedError
+
+    def containers(self, label):
+        """Every container, running or not, which has the label, as dicts of their "labels", "state" (e.g. running
+        or exited) and "status" (e.g. "Up 5 seconds (healthy)"). None if they could not be listed. The labels
+        include at least composer's own and com.docker.compose.service."""
+        raise NotImplementedError
+
+    def events(self, label, since):
+        """A source (with chunks() and stop(), see logstream) of docker's container events, as lines of JSON, for
+        containers with the label from the unix time since onwards. It carries on until stopped."""
+        raise NotImplementedError
+
+
+def get_backend_name():
+    return Context.backend or os.environ.get("COMPOSER_BACKEND") or DEFAULT_BACKEND
+
+
+def get_backend():
+    name = get_backend_name()
+    with _backends_lock:
+        if name not in _backends:
+            if name not in BACKENDS:
+                logging.error(f"Unknown backend '{name}', must be one of: {', '.join(BACKENDS)}")
+                sys.exit(1)
+            module_name, class_name = BACKENDS[name].rsplit(".", 1)
+            _backends[name] = getattr(importlib.import_module(module_name), class_name)()
+        return _backends[name]
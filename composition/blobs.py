@@ -0,0 +1,230 @@
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from composition import locking
+from composition.models import RESERVED_DIRECTORIES
+
+# Linux ioctl to make a copy-on-write clone of a file (btrfs, xfs etc.)
+FICLONE = 0x40049409
+
+
+def get_blob_dir():
+    return os.path.join(Path.home(), ".composer", "blobs")
+
+
+def get_blob_path(digest):
+    return os.path.join(get_blob_dir(), digest[:2], digest[2:])
+
+
+def hash_file(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class BlobStore:
+    """Stores files once by the hash of their content, copies of them are then hard links (or reflinks) to the stored
+    blob. Hashes are cached by path, size and modification time so unchanged files are not re-read.
+
+    A hard linked copy is the blob itself, so anything writing to it in place changes every other copy too. Paths a
+    container can write to are therefore copied instead of linked, and a blob is only reused while it still matches
+    its digest."""
+
+    def __init__(self):
+        self.cache_path = os.path.join(Path.home(), ".composer", "cache", "hashes.json")
+        self.hashes = None
+        self.changed = False
+        # Switched off after the first failure, most filesystems do not support reflinks
+        self.use_reflink = True
+
+    def load_hashes(self):
+        if self.hashes is None:
+            try:
+                with open(self.cache_path, "r") as f:
+                    self.hashes = json.loads(f.read())
+            except (OSError, ValueError):
+                self.hashes = {}
+        return self.hashes
+
+    def save_hashes(self):
+        if not self.changed:
+            return
+        from composition.storage import write_file
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        write_file(self.cache_path, json.dumps(self.hashes))
+        self.changed = False
+
+    def get_hash(self, path):
+        hashes = self.load_hashes()
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        signature = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+        cached = hashes.get(key)
+        if cached is not None and cached[:3] == signature:
+            return cached[3]
+        digest = hash_file(path)
+        hashes[key] = signature + [digest]
+        self.changed = True
+        return digest
+
+    def record(self, path, digest):
+        """Caches the digest of a file which is known without reading it, e.g. one just copied from a blob."""
+        stat = os.stat(path)
+        self.load_hashes()[os.path.abspath(path)] = [stat.st_size, stat.st_mtime_ns, stat.st_ino, digest]
+        self.changed = True
+
+    def store(self, path):
+        digest = self.get_hash(path)
+        blob_path = get_blob_path(digest)
+        # A blob which has been written to through one of its links no longer has this content, so it is replaced
+        if not os.path.exists(blob_path) or self.get_hash(blob_path) != digest:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(blob_path), prefix=".tmp-")
+            os.close(fd)
+            shutil.copy2(path, temp_path)
+            os.replace(temp_path, blob_path)
+            self.record(blob_path, digest)
+        return blob_path, digest
+
+    def materialise(self, source, target, link=True):
+        """Copies source to target through the blob store. Reflinks are copy on write so are always used when
+        possible, otherwise target is a hard link to the blob unless link is False."""
+        blob_path, digest = self.store(source)
+        if self.use_reflink and try_reflink(blob_path, target):
+            self.record(target, digest)
+            return
+        self.use_reflink = False
+        try:
+            if not link:
+                raise OSError(errno.EPERM, "Not linking a writable file")
+            os.link(blob_path, target)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM, errno.ENOTSUP):
+                raise
+            shutil.copy2(blob_path, target)
+        self.record(target, digest)
+
+    def materialise_tree(self, source_dir, target_dir, tree, skip=(), copy=()):
+        """Recreates source_dir at target_dir (like copytree) from the files indexed in the tree, apart from the
+        relative paths in skip which are about to be written separately. Files at or under the relative paths in
+        copy (e.g. writable bind mounts) are never hard linked."""
+        skip = {os.path.normpath(path) for path in skip}
+        copy = {os.path.normpath(path) for path in copy}
+        os.makedirs(target_dir)
+        # Shared so installs run side by side, but a prune can't remove a blob before it has been linked
+        with locking.blobs_lock(shared=True):
+            for directory, dirs, files in tree.walk_from(source_dir, include_skipped=True):
+                relative_dir = os.path.relpath(directory, source_dir)
+                for d in dirs:
+                    os.mkdir(os.path.join(target_dir, relative_dir, d))
+                for f in files:
+                    relative = os.path.normpath(os.path.join(relative_dir, f))
+                    if relative in skip:
+                        continue
+                    self.materialise(os.path.join(directory, f), os.path.join(target_dir, relative),
+                                     link=not is_under(relative, copy))
+        self.save_hashes()
+
+    def get_used_digests(self):
+        """The digests of every file stored for an installed application. Cached hashes of files which are no longer
+        installed are forgotten along the way."""
+        home = os.path.join(Path.home(), ".composer")
+        used = set()
+        seen = set()
+        for name in os.listdir(home):
+            if name in RESERVED_DIRECTORIES or not os.path.isdir(os.path.join(home, name)):
+                continue
+            for directory, _, files in os.walk(os.path.join(home, name)):
+                for f in files:
+                    path = os.path.join(directory, f)
+                    if os.path.islink(path) or not os.path.isfile(path):
+                        continue
+                    try:
+                        used.add(self.get_hash(path))
+                    except OSError:
+                        # e.g. written by a container as another user, so never one of ours
+                        continue
+                    seen.add(os.path.abspath(path))
+        hashes = self.load_hashes()
+        blob_prefix = get_blob_dir() + os.sep
+        for key in [key for key in hashes if key.startswith(home + os.sep) and not key.startswith(blob_prefix)
+                    and key not in seen]:
+            del hashes[key]
+            self.changed = True
+        return used
+
+
+def is_under(relative, paths):
+    return any(path == "." or relative == path or relative.startswith(path + os.sep) for path in paths)
+
+
+def copy_links(directory, paths):
+    """Replaces hard links under the relative paths of directory with copies of their own, for paths which have
+    become writable since they were linked."""
+    for path in paths:
+        path = os.path.join(directory, path)
+        if os.path.isfile(path):
+            candidates = [path]
+        else:
+            candidates = [os.path.join(d, f) for d, _, files in os.walk(path) for f in files]
+        for candidate in candidates:
+            if os.path.islink(candidate) or os.stat(candidate).st_nlink == 1:
+                continue
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(candidate), prefix=".tmp-")
+            os.close(fd)
+            shutil.copy2(candidate, temp_path)
+            os.replace(temp_path, candidate)
+
+
+def try_reflink(source, target):
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    with open(source, "rb") as src:
+        try:
+            with open(target, "wb") as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            if os.path.exists(target):
+                os.unlink(target)
+            return False
+    shutil.copystat(source, target)
+    return True
+
+
+def prune():
+    """Removes blobs which no installed application uses any more. A blob which is still hard linked is in use, any
+    other (e.g. after reflinks or copies) is kept while an installed file has the same content."""
+    from composition.storage import get_blob_store
+    blob_dir = get_blob_dir()
+    if not os.path.exists(blob_dir):
+        return 0
+    store = get_blob_store()
+    used = None
+    removed = 0
+    with locking.blobs_lock():
+        for directory, _, files in os.walk(blob_dir):
+            for f in files:
+                path = os.path.join(directory, f)
+                if os.stat(path).st_nlink > 1:
+                    continue
+                if used is None:
+                    used = store.get_used_digests()
+                if os.path.basename(directory) + f in used:
+                    continue
+                os.unlink(path)
+                if store.load_hashes().pop(os.path.abspath(path), None) is not None:
+                    store.changed = True
+                removed += 1
+        store.save_hashes()
+    logging.debug(f"Removed {removed} unused blobs.")
+    return removed
@@ -0,0 +1,214 @@
+import json
+import logging
+import os.path
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+from composition import logstream, storage
+from composition.backend import ComposeBackend
+from composition.models import APPLICATION_LABEL, SERVICE_LABEL, SERVICE_NAME_LABEL, SUBAPP_LABEL
+
+# The most output copied from a command to stdout at once
+OUTPUT_CHUNK_SIZE = 64 * 1024
+# How long a successful docker-compose check is trusted for before running `docker-compose version` again
+COMPOSE_CHECK_TTL = 24 * 60 * 60
+# The labels listed by containers(). Each is asked for on its own, as docker ps joins all of them with commas which
+# label values (e.g. traefik rules) can contain too
+CONTAINER_LABELS = (APPLICATION_LABEL, SUBAPP_LABEL, SERVICE_NAME_LABEL, SERVICE_LABEL)
+
+_compose_binary = None
+_docker_binary = None
+_compose_lock = threading.Lock()
+
+
+def get_compose():
+    """Path of the docker-compose binary, checked the first time a command actually needs it."""
+    global _compose_binary
+    with _compose_lock:
+        if _compose_binary is None:
+            _compose_binary = find_compose()
+    return _compose_binary
+
+
+def find_compose():
+    binary = shutil.which("docker-compose")
+    if binary is None:
+        logging.error("[ERROR] docker-compose is not installed")
+        logging.error("Exiting.")
+        sys.exit(1)
+    mtime = os.stat(binary).st_mtime
+    cache_path = os.path.join(storage.get_cache_dir(), "compose.json")
+    cached = read_compose_cache(cache_path)
+    if cached and cached["path"] == binary and cached["mtime"] == mtime \
+            and time.time() - cached["checked"] < COMPOSE_CHECK_TTL:
+        logging.debug(f"Using cached docker-compose {cached['version']} at {binary}")
+        return binary
+    out = subprocess.run([binary, "version"], capture_output=True, text=True)
+    if out.returncode != 0:
+        logging.error(f"[ERROR] docker-compose at {binary} is not working: {out.stderr}")
+        logging.error("Exiting.")
+        sys.exit(1)
+    version = out.stdout.strip().splitlines()[0] if out.stdout.strip() else ""
+    storage.write_file(cache_path, json.dumps({"path": binary, "version": version, "mtime": mtime,
+                                               "checked": time.time()}))
+    return binary
+
+
+def get_docker(required=True):
+    """Path of the docker binary, used for working with individual images. If it isn't required None is returned
+    when it isn't installed, rather than exiting."""
+    global _docker_binary
+    with _compose_lock:
+        if _docker_binary is None:
+            _docker_binary = shutil.which("docker")
+            if _docker_binary is None and required:
+                logging.error("[ERROR] docker is not installed, it is needed to pull images")
+                logging.error("Exiting.")
+                sys.exit(1)
+    return _docker_binary
+
+
+def read_compose_cache(cache_path):
+    try:
+        with open(cache_path, "r") as f:
+            return json.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def compose_cmd(*args):
+    command = [get_compose(), *args]
+    logging.debug(f"Running command: {command}")
+    return subprocess.run(command, capture_output=True, text=True)
+
+
+def unbuffered_command(*command_line_args, raw=False):
+    """Runs a command, either logging its output line by line or, with raw, copying it straight to stdout."""
+    process = subprocess.Popen(command_line_args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    try:
+        with process.stdout:
+            if raw:
+                copy_subprocess_output(process.stdout)
+            else:
+                log_subprocess_output(process.stdout)
+    except KeyboardInterrupt:
+        process.terminate()
+        process.wait()
+        # Stop the whole command, e.g. `cmd` would otherwise go on to run in the next sub-app
+        raise
+    return process.wait()  # 0 means success
+
+
+def log_subprocess_output(pipe):
+    for line in iter(pipe.readline, b''):  # b'\n'- separated lines
+        logging.info(line.decode().rstrip('\n'))
+
+
+def copy_subprocess_output(pipe):
+    # Whatever is available is copied in one go, rather than paying for decoding and logging each line
+    out = sys.stdout.buffer
+    fd = pipe.fileno()
+    for chunk in iter(lambda: os.read(fd, OUTPUT_CHUNK_SIZE), b''):
+        out.write(chunk)
+        out.flush()
+
+
+def compose_logs_command(path, follow, services, tail=None, since=None):
+    command_to_run = [get_compose(), "-f", path, "logs"]
+    if follow:
+        command_to_run.append("--follow")
+    if tail is not None:
+        command_to_run.append(f"--tail={tail}")
+    if since is not None:
+        command_to_run.append(f"--since={since}")
+    if services is not None:
+        command_to_run.extend(services)
+    return command_to_run
+
+
+class CliBackend(ComposeBackend):
+    """Runs the docker-compose binary for every operation."""
+    name = "cli"
+
+    def check(self):
+        get_compose()
+
+    def up(self, path):
+        out = compose_cmd("-f", path, "up", "-d")
+        logging.debug(out)
+        if out.returncode != 0 or "error" in out.stderr.lower():
+            logging.error(f"Error: {out.stderr}")
+            return False
+        return True
+
+    def down(self, path, force=False):
+        if force:
+            out = compose_cmd("-f", path, "down", "--timeout=0")
+        else:
+            out = compose_cmd("-f", path, "down")
+        logging.debug(out)
+        if out.returncode != 0 or "error" in out.stderr.lower():
+            logging.warning(f"Error: {out.stderr}")
+            return False
+        return True
+
+    # Both of these run in the pull workers, where a missing docker only fails the pull
+    def image_exists(self, image):
+        docker = get_docker(required=False)
+        if docker is None:
+            return False
+        out = subprocess.run([docker, "image", "inspect", image], capture_output=True, text=True)
+        return out.returncode == 0
+
+    def pull_image(self, image):
+        docker = get_docker(required=False)
+        if docker is None:
+            logging.warning(f"Failed to pull {image}: docker is not installed")
+            return False
+        out = subprocess.run([docker, "pull", "--quiet", image], capture_output=True, text=True)
+        if out.returncode != 0:
+            logging.warning(f"Failed to pull {image}: {out.stderr.strip()}")
+            return False
+        return True
+
+    def logs(self, targets, follow=False, tail=None, since=None, grep=None):
+        commands = [(prefix, compose_logs_command(path, follow, services, tail, since))
+                    for prefix, path, services in targets]
+        if len(commands) == 1 and grep is None:
+            # Nothing to interleave or filter, so pass the output straight through
+            prefix, command = commands[0]
+            logging.info(f"Logs for: {prefix}")
+            return unbuffered_command(*command, raw=True) == 0
+        return logstream.stream_logs(commands, grep=grep)
+
+    def cmd(self, path, arg_list):
+        command_to_run = [get_compose(), "-f", path] + arg_list
+        logging.debug(f"Running command: {command_to_run}")
+        return unbuffered_command(*command_to_run, raw=True) == 0
+
+    def containers(self, label):
+        out = subprocess.run([get_docker(), "ps", "--all", "--no-trunc", "--filter", f"label={label}",
+                              "--format", "\t".join(["{{.State}}", "{{.Status}}"] +
+                                                     [f'{{{{.Label "{label}"}}}}' for label in CONTAINER_LABELS])],
+                             capture_output=True, text=True)
+        if out.returncode != 0:
+            logging.error(f"Error: {out.stderr.strip()}")
+            return None
+        return [parse_ps_line(line) for line in out.stdout.splitlines() if line.strip()]
+
+    def events(self, label, since):
+        return logstream.CommandSource([get_docker(), "events", "--since", f"{since:.6f}", "--filter", "type=container",
+                                        "--filter", f"label={label}", "--format", "{{json .}}"])
+
+
+def parse_ps_line(line):
+    # The state, status and then the value of each of CONTAINER_LABELS, empty when a container doesn't have it
+    fields = (line.split("\t", len(CONTAINER_LABELS) + 1) + [""] * (len(CONTAINER_LABELS) + 2))
+    return {
+        "state": fields[0].strip(),
+        "status": fields[1].strip(),
+        "labels": {label: value for label, value in zip(CONTAINER_LABELS, fields[2:]) if value},
+    }
@@ -0,0 +1,86 @@
+"""The `composer` entry point. Commands are handed to a running composerd (see daemon.py) over its unix socket when
+there is one, and are otherwise run in this process. Only the standard library is imported before that decision, so
+a call served by the daemon never pays for loading click, jinja2 or yaml."""
+import json
+import os
+import socket
+import sys
+
+from composition import VERSION
+
+SOCKET_NAME = "composerd.sock"
+# Set to run every command in process, even when composerd is running
+NO_DAEMON_VARIABLE = "COMPOSER_NO_DAEMON"
+
+
+def get_socket_path():
+    return os.path.join(os.path.expanduser("~"), ".composer", SOCKET_NAME)
+
+
+def connect(socket_path):
+    """A connection to composerd, or None if it isn't running."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def forwarded_environment():
+    # All of it, so e.g. PATH, DOCKER_HOST and DOCKER_CONTEXT pick the same docker-compose and daemon as in process
+    return dict(os.environ)
+
+
+def run_in_daemon(args, socket_path=None):
+    """Runs the command in composerd with this process' stdin, stdout and stderr, returning its exit code, or None if
+    it has to be run in process instead."""
+    if os.environ.get(NO_DAEMON_VARIABLE) or not hasattr(socket, "send_fds"):
+        return None
+    sock = connect(socket_path or get_socket_path())
+    if sock is None:
+        return None
+    with sock:
+        request = {"version": VERSION, "args": args, "cwd": os.getcwd(), "env": forwarded_environment()}
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            # The daemon writes straight to our terminal (or pipes) through copies of the file descriptors
+            socket.send_fds(sock, [json.dumps(request).encode() + b"\n"], [0, 1, 2])
+        except OSError:
+            return None
+        try:
+            reply = read_reply(sock)
+        except KeyboardInterrupt:
+            # Closing the connection interrupts the command in the daemon
+            return 130
+    if reply is None:
+        sys.stderr.write("composerd closed the connection before the command finished.\n")
+        return 1
+    if "fallback" in reply:
+        return None
+    return reply["exit"]
+
+
+def read_reply(sock):
+    data = b""
+    while not data.endswith(b"\n"):
+        chunk = sock.recv(4096)
+        if not chunk:
+            return None
+        data += chunk
+    return json.loads(data)
+
+
+def main():
+    code = run_in_daemon(sys.argv[1:])
+    if code is None:
+        from composition.composer import entrypoint
+        entrypoint()
+        return
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,17 @@
 #!/usr/bin/python3
 import logging
+import re
 import sys
 
 import click
 
-from composition import api, template_cmd, VERSION
-from composition.cmd import cmd
-from composition.install import install_application
-from composition.list_apps import list_applications, setup_default_logging_format
-from composition.logs import logs
-from composition.models import Context
+from composition import VERSION, tracing
+from composition.list_apps import setup_default_logging_format
+from composition.models import Context, DEFAULT_PARALLEL
 from composition.storage import create_storage_if_not_exist
-from composition.subapps import subapps
-from composition.uninstall import uninstall_application
+
+# The command implementations are imported inside each command so that jinja2, yaml etc. are only loaded by the
+# commands that need them. Likewise docker-compose is only checked the first time a command runs it.
 
 
 @click.command("install", context_settings={'show_default': True})
@@ -25,11 +24,70 @@ from composition.uninstall import uninstall_application
                                               "foo: bar in values.yaml, these will always take precedent over files",
               multiple=True)
 @click.option("--always_pull", "-p", default=None, help="If set will override the settings in app.yaml to dictate if the application should always pull the latest containers.")
-def install(template="template.yaml", value=None, id=None, set=None, always_pull=None):
+@click.option("--parallel", default=DEFAULT_PARALLEL, type=click.IntRange(min=1),
+              help="The maximum number of sub-applications to start at the same time. Order can be set with "
+                   "dependsOn in app.yaml, the parent application is always started last.")
+@click.option("--max-depth", default=None, type=click.IntRange(min=0),
+              help="Only look for sub-applications (app.yaml files) this many directories deep.")
+@click.option("--pull-parallel", default=4, type=click.IntRange(min=1),
+              help="The maximum number of images to pull at the same time when always pulling.")
+@click.option("--manifest", "-m", default=None,
+              help="Install every instance (id, values and sets) listed in this YAML file, rendering and starting "
+                   "them together. --parallel then limits how many instances start at the same time.")
+@click.option("--wait", default=False, flag_value=True,
+              help="Wait for every service to be running, and healthy if it has a healthcheck, failing as soon as "
+                   "one exits or becomes unhealthy.")
+@click.option("--timeout", default=300, type=click.IntRange(min=1), help="How many seconds --wait waits for.")
+@click.option("--single-project", default=False, flag_value=True,
+              help="Merge every sub-application into one compose project, started, stopped etc. with a single "
+                   "docker-compose call. Sub-application dependsOn becomes depends_on between their services.")
+def install(template="template.yaml", value=None, id=None, set=None, always_pull=None, parallel=DEFAULT_PARALLEL, max_depth=None,
+            pull_parallel=4, manifest=None, wait=False, timeout=300, single_project=False):
     """
     Install a docker-compose application using a given template.
     """
-    install_application(template, value, application_id=id, manual_values=set, always_pull=always_pull)
+    if manifest is not None:
+        if id is not None or set:
+            raise click.UsageError("--id and --set can't be used with --manifest, put them in the manifest instead.")
+        if wait or single_project:
+            raise click.UsageError("--wait and --single-project can't be used with --manifest.")
+        from composition.manifest import install_manifest
+        install_manifest(manifest, template, always_pull=always_pull, parallel=parallel, max_depth=max_depth,
+                         pull_parallel=pull_parallel)
+        return
+    from composition.install import install_application
+    install_application(template, value, application_id=id, manual_values=set, always_pull=always_pull,
+                        parallel=parallel, max_depth=max_depth, pull_parallel=pull_parallel,
+                        wait_timeout=timeout if wait else None, single_project=single_project)
+
+
+@click.command("upgrade", context_settings={'show_default': True})
+@click.argument("id")
+@click.option("--template", "-t", default="template.yaml", help="The name of the template file to install")
+@click.option("--value", "-v", default=["values.yaml"], help="A list of values YAML files to generate templates from",
+              multiple=True)
+@click.option("--set", "-s", default=[], help="An individual value to set e.g. --set foo=bar would be the same as "
+                                              "foo: bar in values.yaml, these will always take precedent over files",
+              multiple=True)
+@click.option("--always_pull", "-p", default=None, help="If set will override the settings in app.yaml to dictate if the application should always pull the latest containers.")
+@click.option("--parallel", default=DEFAULT_PARALLEL, type=click.IntRange(min=1),
+              help="The maximum number of sub-applications to restart at the same time.")
+@click.option("--max-depth", default=None, type=click.IntRange(min=0),
+              help="Only look for sub-applications (app.yaml files) this many directories deep.")
+@click.option("--pull-parallel", default=4, type=click.IntRange(min=1),
+              help="The maximum number of images to pull at the same time when always pulling.")
+@click.option("--wait", default=False, flag_value=True,
+              help="Wait for the services of the restarted sub-applications to be running, and healthy if they have "
+                   "a healthcheck, failing as soon as one exits or becomes unhealthy.")
+@click.option("--timeout", default=300, type=click.IntRange(min=1), help="How many seconds --wait waits for.")
+def upgrade(id, template="template.yaml", value=None, set=None, always_pull=None, parallel=DEFAULT_PARALLEL, max_depth=None,
+            pull_parallel=4, wait=False, timeout=300):
+    """
+    Upgrade an installed application with new values, only restarting the sub-applications which have changed.
+    """
+    from composition.upgrade import upgrade_application
+    upgrade_application(id, template, value, manual_values=set, always_pull=always_pull, parallel=parallel,
+                        max_depth=max_depth, pull_parallel=pull_parallel, wait_timeout=timeout if wait else None)
 
 
 @click.command("delete", context_settings={
@@ -41,13 +99,15 @@ def install(template="template.yaml", value=None, id=None, set=None, always_pull
 @click.option("--force", "-f", default=False, flag_value=True,
               help="Causes the docker-compose down api called to use the force/timeout=0 flag.")
 @click.option("--all", "-a", default=False, flag_value=True, help="Delete all of the installed applications.")
-def delete(ctx, force=False, all=False):
+@click.option("--parallel", default=4, type=click.IntRange(min=1),
+              help="The maximum number of applications to delete at the same time.")
+def delete(ctx, force=False, all=False, parallel=4):
     """
         Uninstalls a given applications (by id unless using --all), removing it completely.
     """
     # Alias for uninstall
-
-    uninstall_application(ctx.args, force, all)
+    from composition.uninstall import uninstall_application
+    uninstall_application(ctx.args, force, all, parallel=parallel)
 
 
 @click.command("uninstall", context_settings={
@@ -59,11 +119,14 @@ def delete(ctx, force=False, all=False):
 @click.option("--force", "-f", default=False, flag_value=True,
               help="Causes the docker-compose down api called to use the force/timeout=0 flag.")
 @click.option("--all", "-a", default=False, flag_value=True, help="Delete all of the installed applications.")
-def uninstall(ctx, force=False, all=False):
+@click.option("--parallel", default=4, type=click.IntRange(min=1),
+              help="The maximum number of applications to delete at the same time.")
+def uninstall(ctx, force=False, all=False, parallel=4):
     """
     Uninstalls a given applications (by id unless using --all), removing it completely.
     """
-    uninstall_application(ctx.args, force, all)
+    from composition.uninstall import uninstall_application
+    uninstall_application(ctx.args, force, all, parallel=parallel)
 
 
 @click.command("template", context_settings={'show_default': True})
@@ -73,21 +136,38 @@ def uninstall(ctx, force=False, all=False):
 @click.option("--set", "-s", default=[], help="An individual value to set e.g. --set foo=bar would be the same as "
                                               "foo: bar in values.yaml, these will always take precedent over files",
               multiple=True)
-def template_func(template="template.yaml", value=None, set=None):
+@click.option("--output-dir", "-o", default=None, type=click.Path(file_okay=False),
+              help="Render the docker-compose file and config maps of every sub-application into this directory, "
+                   "keeping their paths, instead of printing the template.")
+def template_func(template="template.yaml", value=None, set=None, output_dir=None):
     """
     Prints the output docker_compose.yaml once the values have been applied. Can be used to produce a compose for use
     outside of the composer install environment
     """
-    template_cmd.template(template, value, manual_values=set)
+    from composition import template_cmd
+    template_cmd.template(template, value, manual_values=set, output_dir=output_dir)
 
 
 @click.command("list")
 @click.option("--quiet", "-q", default=False, flag_value=True, help="Print the application name only.")
-def list_all(quiet=False):
+@click.option("--live", default=False, flag_value=True,
+              help="Show the status of each application's containers right now, rather than when it was installed.")
+def list_all(quiet=False, live=False):
     """
     list installed applications
     """
-    list_applications(quiet)
+    from composition.list_apps import list_applications
+    list_applications(quiet, live)
+
+
+@click.command("reindex")
+def reindex():
+    """
+    Rebuild the index of installed applications from the contents of ~/.composer
+    """
+    from composition import registry
+    count = registry.rebuild()
+    logging.info(f"Indexed {count} installed applications.")
 
 
 @click.command("version")
@@ -98,6 +178,25 @@ def version():
     logging.info(f"composer version {VERSION} (pip package docker-composition)")
 
 
+def validate_pattern(value):
+    if value is not None:
+        try:
+            re.compile(value)
+        except re.error as e:
+            raise click.BadParameter(f"not a valid regular expression: {e}")
+    return value
+
+
+def validate_since(value):
+    if value is not None:
+        from composition.engine_backend import parse_since
+        try:
+            parse_since(value)
+        except ValueError:
+            raise click.BadParameter("not a timestamp (e.g. 2013-01-02T13:23:37Z) or relative time (e.g. 42m)")
+    return value
+
+
 @click.command("logs", context_settings={
     'show_default': True,
     "ignore_unknown_options": True,
@@ -108,11 +207,17 @@ def version():
 @click.option("--application", "-a", default=None,
               help="Get the logs for a specific installed composer application ie. name in the app.yaml.")
 @click.option("--follow", "-f", default=False, flag_value=True, help="Follow the applications logs for updates.")
-def logs_cmd(ctx, service=None, application=None, follow=False):
+@click.option("--tail", "-n", default=None, help="Number of lines to show from the end of the logs of each container.")
+@click.option("--since", default=None, callback=lambda ctx, param, value: validate_since(value),
+              help="Only show logs since a timestamp (e.g. 2013-01-02T13:23:37Z) or relative time (e.g. 42m).")
+@click.option("--grep", "-g", default=None, callback=lambda ctx, param, value: validate_pattern(value),
+              help="Only show log lines matching this regular expression.")
+def logs_cmd(ctx, service=None, application=None, follow=False, tail=None, since=None, grep=None):
     """
     Gets the logs for a given application.
     """
-    logs(ctx.args, follow, service, application)
+    from composition.logs import logs
+    logs(ctx.args, follow, service, application, tail=tail, since=since, grep=grep)
 
 
 @click.command("cmd", context_settings={
@@ -127,6 +232,7 @@ def other_cmd(ctx, application=None):
     """
     Send a command to docker-compose for any other docker compose functions. Format: compose cmd <application_id> <commands> (optional --application=<app_name>)
     """
+    from composition.cmd import cmd
     cmd(ctx.args, application)
 
 
@@ -140,15 +246,29 @@ def subapps_cmd(ctx):
     """
         List the sub-applications under a single application
     """
+    from composition.subapps import subapps
     subapps(ctx.args)
 
 
 @click.group()
 @click.option("--verbose", "-v", default=False, flag_value=True, help="Set log level to DEBUG flag/verbose.")
 @click.option("--level", "-l", default="INFO", type=click.Choice(['DEBUG', 'INFO', 'ERROR']))
-def cli(verbose, level):
+@click.option("--backend", "-b", default=None, type=click.Choice(["cli", "engine"]),
+              help="How to talk to docker: 'cli' runs docker-compose, 'engine' uses the Docker Engine API socket. "
+                   "Defaults to $COMPOSER_BACKEND or cli.")
+@click.option("--timings", default=False, flag_value=True,
+              help="Print how long each phase (render, copy, pull, up etc.) took for every sub-app.")
+@click.option("--trace", default=None, type=click.Path(dir_okay=False, writable=True),
+              help="Write a trace of every phase to this file, in Chrome's trace event format.")
+@click.pass_context
+def cli(ctx, verbose, level, backend, timings, trace):
     try:
         Context.verbose = verbose
+        Context.backend = backend
+        if timings or trace is not None:
+            tracing.enable()
+            # Reported when the context closes, which failed commands (that sys.exit) do as well
+            ctx.call_on_close(lambda: tracing.report(timings, trace))
         if verbose:
             level = logging.DEBUG
         # Set the default logging
@@ -158,27 +278,27 @@ def cli(verbose, level):
         setup_default_logging_format()
         # Create the temporary storage if it does not exist
         create_storage_if_not_exist()
-        # Check docker-compose is installed
-        if not api.is_compose_installed():
-            logging.error("[ERROR] docker-compose is not installed")
-            logging.error("Exiting.")
-            sys.exit(1)
     except KeyboardInterrupt:
         logging.info("Exiting on keyboard interrupt.")
         sys.exit(0)
 
 
-def entrypoint():
-    # Register the cli commands
+def register_commands():
     cli.add_command(install)
+    cli.add_command(upgrade)
     cli.add_command(delete)
     cli.add_command(uninstall)
     cli.add_command(list_all)
     cli.add_command(template_func)
     cli.add_command(version)
+    cli.add_command(reindex)
     cli.add_command(logs_cmd)
     cli.add_command(other_cmd)
     cli.add_command(subapps_cmd)
+
+
+def entrypoint():
+    register_commands()
     # Call the cli
     cli()
 
@@ -0,0 +1,230 @@
+"""composerd, a long running composer process which keeps composer and its dependencies imported and runs the
+commands sent to it by `composer` (see client.py) over a unix socket.
+
+Each request carries the client's arguments, working directory, environment and its stdin, stdout and stderr file
+descriptors. Every command runs in a child forked from the warmed up daemon, which takes on the client's working
+directory, environment and descriptors so its output (including that of any docker-compose it runs) goes straight to
+the client. Commands therefore run side by side, a long `install --wait` or `logs -f` never holds up anyone else, and
+nothing a command changes is left behind in the daemon. That includes the in memory caches (compiled templates, parsed
+values, the compose backend found on the client's PATH), so only the imports are saved, along with the caches on disk
+which every composer process shares."""
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+import click
+
+from composition import VERSION, client, storage
+from composition.list_apps import setup_default_logging_format
+
+# Largest request accepted, the arguments of a command
+MAX_REQUEST_SIZE = 1024 * 1024
+# Seconds a client has to send its request, so a stuck one can't hold up the others
+REQUEST_TIMEOUT = 5
+# The commands set the root log level as they please, composerd's own messages are always shown
+logger = logging.getLogger("composerd")
+logger.setLevel(logging.INFO)
+
+
+def serve(socket_path):
+    storage.create_storage_if_not_exist()
+    sock = client.connect(socket_path)
+    if sock is not None:
+        sock.close()
+        logger.error(f"composerd is already running on {socket_path}")
+        sys.exit(1)
+    if os.path.exists(socket_path):
+        # Left behind by a composerd which didn't shut down cleanly
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Only this user can connect, anyone who can is able to run commands as us
+    umask = os.umask(0o177)
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(umask)
+    server.listen(64)
+    warm_up()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    signal.signal(signal.SIGCHLD, lambda *_: reap())
+    logger.info(f"composerd {VERSION} listening on {socket_path}")
+    try:
+        while True:
+            try:
+                conn, _ = server.accept()
+                with conn:
+                    handle(conn, server)
+            except Exception:
+                logger.exception("Failed to handle a request.")
+    except KeyboardInterrupt:
+        logger.info("Exiting on keyboard interrupt.")
+    finally:
+        server.close()
+        os.unlink(socket_path)
+
+
+def warm_up():
+    """Imports everything the commands load lazily, so the first request is as quick as the rest."""
+    from composition import composer, directory, install, list_apps, rendering, template_cmd, upgrade  # noqa: F401
+    import jinja2.meta  # noqa: F401
+    import yaml  # noqa: F401
+    composer.register_commands()
+
+
+def handle(conn, server):
+    conn.settimeout(REQUEST_TIMEOUT)
+    request, fds = receive_request(conn)
+    try:
+        if request is None:
+            return
+        if request.get("version") != VERSION:
+            # The client is from a different install, it has to run the command itself
+            send_reply(conn, {"fallback": f"composerd is version {VERSION}"})
+            return
+        flush()
+        if os.fork() == 0:
+            run_child(request, fds, conn, server)
+    finally:
+        for fd in fds:
+            os.close(fd)
+
+
+def run_child(request, fds, conn, server):
+    """Runs the request in a forked child, which exits once it has replied and never returns."""
+    code = 1
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        # Otherwise reap would take the exit status of the docker-compose commands the child runs
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        server.close()
+        conn.settimeout(None)
+        start = time.time()
+        code = run_request(request, fds, conn)
+        duration = (time.time() - start) * 1000
+        logger.info(f"composer {' '.join(request['args'])} exited with {code} in {duration:.0f}ms")
+        send_reply(conn, {"exit": code})
+    except BaseException:
+        logger.exception("Failed to run a request.")
+    finally:
+        flush()
+        os._exit(code)
+
+
+def reap():
+    """Collects the exit status of every finished child."""
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+
+
+def receive_request(conn):
+    data, fds, _, _ = socket.recv_fds(conn, MAX_REQUEST_SIZE, 3)
+    while data and not data.endswith(b"\n") and len(data) < MAX_REQUEST_SIZE:
+        chunk = conn.recv(MAX_REQUEST_SIZE)
+        if not chunk:
+            break
+        data += chunk
+    if len(fds) != 3 or not data.endswith(b"\n"):
+        logger.warning("Ignoring an incomplete request.")
+        return None, fds
+    try:
+        return json.loads(data), fds
+    except ValueError:
+        logger.warning("Ignoring a malformed request.")
+        return None, fds
+
+
+def send_reply(conn, reply):
+    try:
+        conn.sendall(json.dumps(reply).encode() + b"\n")
+    except OSError:
+        # The client has gone
+        pass
+
+
+def run_request(request, fds, conn):
+    """Runs the command as though this process had been started by the client. Only the descriptors are put back
+    afterwards, so composerd's own messages go to its log, as the process exits once it has replied."""
+    saved_fds = [os.dup(fd) for fd in (0, 1, 2)]
+    done = threading.Event()
+    watcher = threading.Thread(target=watch_client, args=(conn, done), daemon=True)
+    try:
+        for fd, client_fd in zip((0, 1, 2), fds):
+            os.dup2(client_fd, fd)
+        os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request["env"])
+        watcher.start()
+        return run_command(request["args"])
+    finally:
+        done.set()
+        flush()
+        for fd, saved_fd in zip((0, 1, 2), saved_fds):
+            os.dup2(saved_fd, fd)
+            os.close(saved_fd)
+        # e.g. `list` switches to its column format
+        setup_default_logging_format()
+        try:
+            # Wakes the watcher
+            conn.shutdown(socket.SHUT_RD)
+        except OSError:
+            pass
+        if watcher.ident is not None:
+            watcher.join()
+
+
+def run_command(args):
+    from composition.composer import cli
+    try:
+        cli.main(args, prog_name="composer")
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        logging.error(e.code)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    except Exception:
+        logging.exception("composer failed with an unexpected error.")
+        return 1
+    return 0
+
+
+def watch_client(conn, done):
+    # The client sends nothing more, so the connection closing means it has gone (e.g. Ctrl+C on `logs -f`)
+    try:
+        conn.recv(1)
+    except OSError:
+        pass
+    if not done.is_set():
+        signal.pthread_kill(threading.main_thread().ident, signal.SIGINT)
+
+
+def flush():
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except (OSError, ValueError):
+            pass
+
+
+@click.command()
+def main():
+    """
+        Runs composerd, which serves composer commands from memory. `composer` uses it whenever it is running.
+    """
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    serve(client.get_socket_path())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,13 @@
-import json
 import logging
 import os
 import sys
-from os.path import exists
 from pathlib import Path
 
-from composition import install, api
-from composition.models import Application, generate_name
+from composition import install, api, project, pull, scheduler, storage, tracing, wait
+from composition.models import Application, generate_name, DEFAULT_PARALLEL, RESERVED_DIRECTORIES, Status
 from composition.storage import get_yaml
+from composition.backend import get_backend
+from composition.tree import AppTree
 
 
 def get_app_details(template):
@@ -29,42 +29,75 @@ def get_app_details(template):
     return app_details
 
 
-def handle_install(template="template.yaml", values=None, application_id=None, manual_values=None, always_pull=None):
+def handle_install(template="template.yaml", values=None, application_id=None, manual_values=None, always_pull=None,
+                   parallel=DEFAULT_PARALLEL, max_depth=None, pull_parallel=4, wait_timeout=None, single_project=False):
+    """Installs the app in the current directory. With a wait_timeout it then waits up to that many seconds for
+    every service to be running (and healthy). With single_project the sub-apps are merged into one compose project
+    and started together, see project.py."""
     if values is None:
         values = ["values.yaml"]
     if manual_values is None:
         manual_values = []
     if application_id is None:
         application_id = generate_name()
+    if application_id in RESERVED_DIRECTORIES:
+        logging.error(f"'{application_id}' is reserved by composer, please use a different application id.")
+        sys.exit(1)
     logging.debug(f"Values: {values}")
-    found_paths = find_file_paths('app.yaml')
+    # Before anything is rendered or stored, so a missing docker-compose doesn't leave a half installed app behind
+    get_backend().check()
 
     app_details = get_app_details(template)
     app_name = app_details["name"]
     version = app_details["version"]
-    for p in found_paths:
-        recursive_install(template, p, application_id, values, manual_values, always_pull)
+    # Walk the app directory once, every later stage reads from the index
+    with tracing.span("discover"):
+        tree = AppTree(os.getcwd(), storage.get_ignore_matcher(), max_depth=max_depth)
+    # The values are the same for every sub-app, so only read them once
+    with tracing.span("values"):
+        all_values = install.consolidate_values(values, manual_values)
+    logging.debug(f"Values to apply: {all_values}")
+    # Render and store every sub-app before starting any of them
+    subapps = []
+    for app_root in tree.app_roots:
+        subapp = recursive_install(template, Path(app_root, "app.yaml"), application_id, all_values, tree)
+        if subapp is not None:
+            subapps.append(subapp)
+    # Images shared between sub-apps are only pulled once, and all before anything is started
+    pull.prepull(subapps, always_pull, parallel=pull_parallel)
+    if single_project:
+        started = project.start_project(application_id, subapps, parent_directory=os.getcwd())
+    else:
+        started = scheduler.start_subapps(subapps, application_id, install.start_subapp,
+                                          parallel=parallel, parent_directory=os.getcwd())
+    if not started:
+        sys.exit(1)
     # Create the application (it automatically registers itself)
     app = Application(os.getcwd(), app_name, version=version, application_id=application_id)
+    if wait_timeout is not None and not wait.wait_for_application(application_id, subapps, wait_timeout):
+        storage.update_status(application_id, Status.ERROR)
+        sys.exit(1)
     logging.info(f"Successfully created installed {app.id}")
     logging.info("To view installed applications use `composer list`")
 
 
 def handle_delete(application_id, force=False):
-    location = get_compose_path(application_id)
-    guids = get_application_guids(location)
-    for guid in guids:
-        compose_location = os.path.join(location, guid)
-        api.compose_down(compose_location, application_id, force)
+    return bring_down(storage.load_app_config(get_compose_path(application_id)), application_id, force)
+
+
+def bring_down(config, application_id, force=False):
+    """Runs docker-compose down for every sub-app of the loaded config, returning True if they all succeeded."""
+    if config.project is not None:
+        return api.compose_down(config.location, application_id, force)
+    succeeded = True
+    for subapp in config.teardown_order():
+        succeeded = api.compose_down(config.compose_location(subapp), application_id, force) and succeeded
+    return succeeded
 
 
 def get_application_guids(location):
-    with open(os.path.join(location, "config.json"), 'rb') as f:
-        config = json.loads(f.read())
-    guids = [c["guid"] for c in config["apps"]]
     # Reverse the list of guids so the parent is destroyed last
-    guids.reverse()
-    return guids
+    return [subapp.guid for subapp in storage.load_app_config(location).teardown_order()]
 
 
 def get_compose_path(application_id):
@@ -76,64 +109,64 @@ def get_compose_path(application_id):
 
 
 def get_name_from_guid(location, guid):
-    with open(os.path.join(location, "config.json"), 'rb') as f:
-        config = json.loads(f.read())
-    app_id = [c["name"] for c in config["apps"] if c["guid"] == guid][0]
-    return app_id
-
-
-def handle_logs(application_id, follow=False, service=None, application=None):
-    location = get_compose_path(application_id)
-    guids = get_application_guids(location)
-    for guid in guids:
-        compose_location = os.path.join(location, guid)
-        application_name = get_name_from_guid(location, guid)
-        if application is not None and application != application_name:
-            logging.debug(f"Skipping logs for {application_name}")
-            # If the user has specified to look for a specific app.yaml name, then skip if its doesn't match
+    return storage.load_app_config(location).get(guid).name
+
+
+def handle_logs(application_id_list, follow=False, service=None, application=None, tail=None, since=None, grep=None):
+    # Every sub-app of every application is streamed at the same time
+    targets = []
+    for application_id in application_id_list:
+        config = storage.load_app_config(get_compose_path(application_id))
+        if config.project is not None:
+            # A single project, so the sub-apps are picked out by their services
+            services = None
+            if application is not None or service is not None:
+                services = config.project_services(config.select(application), service)
+                if not services:
+                    continue
+            targets.append((application_id, config.location, services))
             continue
-        logging.info(f"Logs for: {application_name}")
-        api.compose_logs(compose_location, follow, service)
+        # If the user has specified to look for a specific app.yaml name, then only that one is included
+        for subapp in config.select(application):
+            targets.append((f"{application_id}/{subapp.name}", config.compose_location(subapp)))
+    if not targets:
+        logging.error("No applications found to get logs for.")
+        sys.exit(1)
+    api.compose_logs(targets, follow, service, tail=tail, since=since, grep=grep)
 
 
 def handle_cmd(application_id, arg_list, application=None):
     logging.debug(f"Application {application_id}, Arguments {arg_list}")
-    location = get_compose_path(application_id)
-    guids = get_application_guids(location)
-    for guid in guids:
-        compose_location = os.path.join(location, guid)
-        application_name = get_name_from_guid(location, guid)
-        if application is not None and application != application_name:
-            logging.debug(f"Skipping logs for {application_name}")
-            # If the user has specified to look for a specific app.yaml name, then skip if its doesn't match
-            continue
+    config = storage.load_app_config(get_compose_path(application_id))
+    if config.project is not None:
+        # A single project, so the sub-app is picked out by its services
+        services = config.project_services(config.select(application)) if application is not None else []
+        if application is not None and not services:
+            return
+        logging.info(f"Running 'docker-compose {' '.join(arg_list + services)}'")
+        api.cmd(config.location, arg_list + services)
+        return
+    # If the user has specified to look for a specific app.yaml name, then only run it for that one
+    for subapp in config.select(application):
         logging.info(f"Running 'docker-compose {' '.join(arg_list)}'")
-        api.cmd(compose_location, arg_list)
+        api.cmd(config.compose_location(subapp), arg_list)
 
 
 def handle_list_subapps(application_id):
-    location = get_compose_path(application_id)
-    guids = get_application_guids(location)
-    for guid in guids:
-        application_name = get_name_from_guid(location, guid)
-        logging.info(application_name)
-
-
-def find_file_paths(target_regex, base=None):
-    if base is None:
-        base = os.getcwd()
-    if not os.path.exists(base):
-        logging.error(f"Path {base} does not existing.")
-        sys.exit(1)
-    found_paths = []
-    for path in Path(base).rglob(target_regex):
-        found_paths.append(path)
-    return found_paths
+    config = storage.load_app_config(get_compose_path(application_id))
+    for subapp in config.teardown_order():
+        logging.info(subapp.name)
 
 
-def recursive_install(template, p: Path, application_id, values, manual_values, always_pull):
-    if values is None:
-        values = ["values.yaml"]
+def recursive_install(template, p: Path, application_id, all_values, tree):
+    app_details = get_subapp_details(template, p, tree)
+    if app_details is None:
+        return
+    logging.debug(f"Found {os.path.join(os.path.dirname(p), template)} performing action INSTALL.")
+    return install.generate_template(os.path.dirname(p), template, app_details, application_id, all_values, tree)
+
+
+def get_subapp_details(template, p: Path, tree):
     app_details = get_yaml(p)
     if app_details is None:
         logging.error(f"Invalid app.yaml file at location {p}, skipping.")
@@ -143,8 +176,7 @@ def recursive_install(template, p: Path, application_id, values, manual_values,
     logging.debug(f"Handling Path: {directory}")
     # Check if the template.yaml is in the current directory
     template_location = os.path.join(directory, template)
-    if not exists(template_location):
+    if not tree.has_file(os.path.dirname(template_location), os.path.basename(template_location)):
         logging.error(f"Could not find file {template_location}, skipping.")
         return
-    logging.debug(f"Found {template_location} performing action INSTALL.")
-    install.generate_template(directory, template, app_details, application_id, values, manual_values, always_pull)
+    return app_details
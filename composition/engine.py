@@ -0,0 +1,168 @@
+import http.client
+import json
+import os
+import queue
+import socket
+import struct
+from urllib.parse import urlencode, quote
+
+DEFAULT_SOCKET = "/var/run/docker.sock"
+# Idle keep-alive connections kept open to the daemon
+POOL_SIZE = 8
+# Requests which can safely be sent again, whether or not the daemon acted on them the first time
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE"}
+# How a keep-alive connection which the daemon has already closed fails, before any of the response is read
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+
+
+class EngineError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"Docker Engine API error {status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class EngineConnectionError(EngineError):
+    """The daemon couldn't be reached, or the connection to it failed part way through a request."""
+
+    def __init__(self, socket_path, error):
+        super().__init__(None, f"Cannot reach the Docker daemon at {socket_path} ({error})")
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+def get_socket_path():
+    docker_host = os.environ.get("DOCKER_HOST", "")
+    if docker_host.startswith("unix://"):
+        return docker_host[len("unix://"):]
+    return DEFAULT_SOCKET
+
+
+class EngineClient:
+    """A small Docker Engine API client over the daemon's unix socket. Connections are HTTP/1.1 keep-alive and
+    reused from a pool, apart from streamed responses (logs, events) which get a connection of their own."""
+
+    def __init__(self, socket_path=None, pool_size=POOL_SIZE):
+        self.socket_path = socket_path or get_socket_path()
+        self.pool = queue.LifoQueue(maxsize=pool_size)
+
+    def connection(self):
+        """A connection to use, and whether it has been used before."""
+        try:
+            return self.pool.get_nowait(), True
+        except queue.Empty:
+            return UnixHTTPConnection(self.socket_path), False
+
+    def release(self, conn):
+        try:
+            self.pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def request(self, method, path, query=None, body=None):
+        """Makes a request and returns the decoded JSON response (or the raw bytes when it isn't JSON). Raises an
+        EngineError for any error status, or an EngineConnectionError if the daemon can't be reached."""
+        url, data, headers = build_request(path, query, body)
+        conn, reused = self.connection()
+        try:
+            try:
+                conn.request(method, url, body=data, headers=headers)
+                response = conn.getresponse()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                # The daemon may have closed an idle keep-alive connection, in which case it never saw the request
+                # and it is retried once on a new connection. Otherwise it might have been acted on, so is only
+                # repeated if that is harmless
+                if not reused or not (method in IDEMPOTENT_METHODS or isinstance(e, STALE_CONNECTION_ERRORS)):
+                    raise
+                conn = UnixHTTPConnection(self.socket_path)
+                conn.request(method, url, body=data, headers=headers)
+                response = conn.getresponse()
+            content = response.read()
+        except (http.client.HTTPException, OSError) as e:
+            conn.close()
+            raise EngineConnectionError(self.socket_path, e) from e
+        if response.will_close:
+            conn.close()
+        else:
+            self.release(conn)
+        return decode_response(response, content)
+
+    def stream(self, method, path, query=None, body=None):
+        """Makes a request whose response is read as it arrives, returns the open response."""
+        url, data, headers = build_request(path, query, body)
+        conn = UnixHTTPConnection(self.socket_path)
+        try:
+            conn.request(method, url, body=data, headers=headers)
+            # Kept so a reader blocked on the stream can be interrupted with a shutdown
+            sock = conn.sock
+            response = conn.getresponse()
+        except (http.client.HTTPException, OSError) as e:
+            conn.close()
+            raise EngineConnectionError(self.socket_path, e) from e
+        if response.status >= 400:
+            content = response.read()
+            conn.close()
+            decode_response(response, content)
+        response.sock = sock
+        return response
+
+
+def build_request(path, query, body):
+    url = quote(path)
+    if query:
+        url += "?" + urlencode({key: value if isinstance(value, str) else json.dumps(value)
+                                for key, value in query.items() if value is not None})
+    headers = {}
+    data = None
+    if body is not None:
+        data = json.dumps(body)
+        headers["Content-Type"] = "application/json"
+    return url, data, headers
+
+
+def decode_response(response, content):
+    is_json = response.getheader("Content-Type", "").startswith("application/json")
+    if response.status >= 400:
+        message = content.decode(errors="replace")
+        if is_json:
+            try:
+                message = json.loads(content).get("message", message)
+            except ValueError:
+                pass
+        raise EngineError(response.status, message)
+    if is_json and content:
+        return json.loads(content)
+    return content
+
+
+def demultiplex(response):
+    """Yields the output of a non-tty container log stream, which frames stdout and stderr with an 8 byte header."""
+    while True:
+        header = read_exactly(response, 8)
+        if not header:
+            return
+        _, size = struct.unpack(">BxxxL", header)
+        payload = read_exactly(response, size)
+        if payload:
+            yield payload
+
+
+def read_exactly(response, size):
+    data = b""
+    while len(data) < size:
+        chunk = response.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
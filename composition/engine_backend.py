@@ -0,0 +1,458 @@
+import hashlib
+import http.client
+import json
+import logging
+import os
+import re
+import shlex
+import socket
+import sys
+import threading
+import time
+from datetime import datetime
+
+from composition import logstream, storage
+from composition.backend import ComposeBackend
+from composition.engine import EngineClient, EngineConnectionError, EngineError, demultiplex
+from composition.models import SERVICE_LABEL
+
+PROJECT_LABEL = "com.docker.compose.project"
+CONFIG_HASH_LABEL = "com.docker.compose.config-hash"
+# Service keys the engine backend understands, anything else is ignored with a warning
+SUPPORTED_KEYS = {
+    "image", "command", "entrypoint", "environment", "env_file", "labels", "ports", "volumes", "restart",
+    "container_name", "working_dir", "user", "hostname", "tty", "stdin_open", "depends_on", "healthcheck",
+    "privileged", "extra_hosts", "dns", "cap_add", "cap_drop",
+}
+
+
+class EngineBackend(ComposeBackend):
+    """Talks to the Docker Engine API over its unix socket instead of running docker-compose. It understands the
+    commonly used parts of a compose file (see SUPPORTED_KEYS) and names and labels everything the same way as
+    docker-compose, so either backend can manage an application. `cmd` is passed on to docker-compose."""
+    name = "engine"
+
+    def __init__(self, client=None):
+        self.client = client or EngineClient()
+        self.cli = None
+        self.lock = threading.Lock()
+
+    def check(self):
+        try:
+            self.client.request("GET", "/_ping")
+        except EngineError as e:
+            logging.error(f"Error: {e.message}")
+            sys.exit(1)
+
+    def up(self, path):
+        services = load_services(path)
+        project = get_project_name(path)
+        building = [name for name, service in services.items() if "build" in service]
+        if building:
+            logging.error(f"The engine backend can't build images ({', '.join(building)}), use --backend cli.")
+            return False
+        try:
+            network = self.ensure_network(project)
+            existing = {c["Labels"].get(SERVICE_LABEL): c for c in self.list_containers(project)}
+            for name in service_order(services):
+                config = container_config(project, os.path.dirname(path), name, services[name], network)
+                container = existing.get(name)
+                if container is not None and container["Labels"].get(CONFIG_HASH_LABEL) != \
+                        config["Labels"][CONFIG_HASH_LABEL]:
+                    # The service has changed so recreate it, as docker-compose would
+                    self.remove_container(container["Id"], force=False)
+                    container = None
+                if container is None:
+                    container_id = self.create_container(container_name(project, name, services[name]), config)
+                elif container["State"] == "running":
+                    continue
+                else:
+                    container_id = container["Id"]
+                self.client.request("POST", f"/containers/{container_id}/start")
+        except EngineError as e:
+            logging.error(f"Error: {e.message}")
+            return False
+        return True
+
+    def down(self, path, force=False):
+        project = get_project_name(path)
+        try:
+            for container in self.list_containers(project):
+                self.remove_container(container["Id"], force)
+            networks = self.client.request("GET", "/networks",
+                                           {"filters": {"label": [f"{PROJECT_LABEL}={project}"]}})
+            for network in networks:
+                self.client.request("DELETE", f"/networks/{network['Id']}")
+        except EngineError as e:
+            logging.warning(f"Error: {e.message}")
+            return False
+        return True
+
+    def image_exists(self, image):
+        try:
+            self.client.request("GET", f"/images/{image}/json")
+        except EngineError as e:
+            if e.status != 404:
+                logging.warning(f"Error: {e.message}")
+            return False
+        return True
+
+    def pull_image(self, image):
+        try:
+            self.fetch_image(image)
+        except EngineError as e:
+            logging.warning(f"Failed to pull {image}: {e.message}")
+            return False
+        return True
+
+    def logs(self, targets, follow=False, tail=None, since=None, grep=None):
+        sources = []
+        for prefix, path, services in targets:
+            try:
+                containers = [container for service in services or [None]
+                              for container in self.list_containers(get_project_name(path), service)]
+            except EngineError as e:
+                logging.error(f"Error: {e.message}")
+                return False
+            for container in containers:
+                query = {"stdout": "1", "stderr": "1", "follow": "1" if follow else "0", "tail": tail or "all",
+                         "since": parse_since(since)}
+                source = ContainerLogSource(self.client, container["Id"], query)
+                sources.append((f"{prefix} | {container['Labels'].get(SERVICE_LABEL)}", source))
+        if not sources:
+            return True
+        return logstream.stream_logs(sources, grep=grep)
+
+    def cmd(self, path, arg_list):
+        # Arbitrary docker-compose commands have no Engine API equivalent
+        with self.lock:
+            if self.cli is None:
+                from composition.cli_backend import CliBackend
+                self.cli = CliBackend()
+        return self.cli.cmd(path, arg_list)
+
+    def containers(self, label):
+        try:
+            found = self.client.request("GET", "/containers/json", {"all": "1", "filters": {"label": [label]}})
+        except EngineError as e:
+            logging.error(f"Error: {e.message}")
+            return None
+        return [{"state": container.get("State"), "status": container.get("Status"),
+                 "labels": container.get("Labels") or {}} for container in found]
+
+    def events(self, label, since):
+        return EventSource(self.client, {"since": f"{since:.6f}",
+                                         "filters": {"type": ["container"], "label": [label]}})
+
+    def list_containers(self, project, service=None):
+        labels = [f"{PROJECT_LABEL}={project}"]
+        if service is not None:
+            labels.append(f"{SERVICE_LABEL}={service}")
+        return self.client.request("GET", "/containers/json", {"all": "1", "filters": {"label": labels}})
+
+    def ensure_network(self, project):
+        name = f"{project}_default"
+        networks = self.client.request("GET", "/networks", {"filters": {"name": [name]}})
+        if not any(network["Name"] == name for network in networks):
+            self.client.request("POST", "/networks/create", body={
+                "Name": name,
+                "Labels": {PROJECT_LABEL: project, "com.docker.compose.network": "default"}
+            })
+        return name
+
+    def create_container(self, name, config):
+        try:
+            return self.client.request("POST", "/containers/create", {"name": name}, config)["Id"]
+        except EngineError as e:
+            if e.status != 404:
+                raise
+        # The image isn't available locally yet
+        self.fetch_image(config["Image"])
+        return self.client.request("POST", "/containers/create", {"name": name}, config)["Id"]
+
+    def remove_container(self, container_id, force):
+        self.client.request("POST", f"/containers/{container_id}/stop", {"t": "0"} if force else None)
+        self.client.request("DELETE", f"/containers/{container_id}")
+
+    def fetch_image(self, image):
+        logging.debug(f"Pulling {image}")
+        name, tag = split_image(image)
+        # The progress of a pull is streamed as one JSON object per line
+        with self.client.stream("POST", "/images/create", {"fromImage": name, "tag": tag}) as progress:
+            while True:
+                try:
+                    line = progress.readline()
+                except (http.client.HTTPException, OSError) as e:
+                    raise EngineConnectionError(self.client.socket_path, e) from e
+                if not line:
+                    break
+                try:
+                    error = json.loads(line).get("error")
+                except ValueError:
+                    continue
+                if error is not None:
+                    # Errors part way through a pull are reported here rather than in the status
+                    raise EngineError(500, error)
+
+
+class ContainerLogSource:
+    """A container's log stream for logstream.stream_logs."""
+
+    def __init__(self, client, container_id, query):
+        self.client = client
+        self.container_id = container_id
+        self.query = query
+        self.response = None
+        self.returncode = None
+
+    def chunks(self):
+        try:
+            info = self.client.request("GET", f"/containers/{self.container_id}/json")
+            self.response = self.client.stream("GET", f"/containers/{self.container_id}/logs", self.query)
+        except EngineError as e:
+            logging.error(f"Error: {e.message}")
+            self.returncode = 1
+            return
+        with self.response:
+            if info["Config"].get("Tty"):
+                yield from iter(lambda: self.response.read1(logstream.READ_SIZE), b"")
+            else:
+                yield from demultiplex(self.response)
+        self.returncode = 0
+
+    def stop(self):
+        if self.response is not None:
+            try:
+                self.response.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class EventSource:
+    """The engine's event stream, see ComposeBackend.events."""
+
+    def __init__(self, client, query):
+        self.client = client
+        self.query = query
+        self.response = None
+        self.returncode = None
+
+    def chunks(self):
+        try:
+            self.response = self.client.stream("GET", "/events", self.query)
+        except EngineError as e:
+            logging.error(f"Error: {e.message}")
+            self.returncode = 1
+            return
+        with self.response:
+            yield from iter(lambda: self.response.read1(logstream.READ_SIZE), b"")
+        self.returncode = 0
+
+    def stop(self):
+        if self.response is not None:
+            try:
+                self.response.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def load_services(path):
+    compose = storage.get_yaml(path) or {}
+    return compose.get("services") or {}
+
+
+def get_project_name(path):
+    # docker-compose names the project after the directory holding the compose file
+    return re.sub(r"[^a-z0-9_-]", "", os.path.basename(os.path.dirname(os.path.abspath(path))).lower())
+
+
+def container_name(project, name, service):
+    return service.get("container_name") or f"{project}-{name}-1"
+
+
+def service_order(services):
+    """Service names ordered so that each comes after everything in its depends_on."""
+    ordered = []
+    visiting = set()
+
+    def visit(name):
+        if name in ordered or name not in services:
+            return
+        if name in visiting:
+            raise EngineError(400, f"Circular depends_on involving service {name}")
+        visiting.add(name)
+        for dependency in services[name].get("depends_on") or []:
+            visit(dependency)
+        visiting.discard(name)
+        ordered.append(name)
+
+    for service_name in services:
+        visit(service_name)
+    return ordered
+
+
+def container_config(project, directory, name, service, network):
+    ignored = set(service) - SUPPORTED_KEYS - {"build"}
+    if ignored:
+        logging.warning(f"The engine backend ignores {', '.join(sorted(ignored))} in service {name}.")
+    labels = to_dict(service.get("labels"))
+    labels.update({
+        PROJECT_LABEL: project,
+        SERVICE_LABEL: name,
+        "com.docker.compose.container-number": "1",
+        "com.docker.compose.oneoff": "False",
+        CONFIG_HASH_LABEL: hashlib.sha256(json.dumps(service, sort_keys=True, default=str).encode()).hexdigest(),
+    })
+    host_config = {
+        "Binds": [to_bind(project, directory, volume) for volume in service.get("volumes") or []],
+        "PortBindings": {},
+        "NetworkMode": network,
+    }
+    exposed_ports = {}
+    for port in service.get("ports") or []:
+        host_ip, host_port, container_port = parse_port(port)
+        exposed_ports[container_port] = {}
+        host_config["PortBindings"].setdefault(container_port, []).append({"HostIp": host_ip, "HostPort": host_port})
+    if "restart" in service:
+        restart = str(service["restart"]).split(":")
+        host_config["RestartPolicy"] = {"Name": restart[0]}
+        if len(restart) > 1:
+            host_config["RestartPolicy"]["MaximumRetryCount"] = int(restart[1])
+    for key, engine_key in [("privileged", "Privileged"), ("extra_hosts", "ExtraHosts"), ("dns", "Dns"),
+                            ("cap_add", "CapAdd"), ("cap_drop", "CapDrop")]:
+        if key in service:
+            value = service[key]
+            host_config[engine_key] = [f"{k}:{v}" for k, v in value.items()] if isinstance(value, dict) else value
+    config = {
+        "Image": service.get("image"),
+        "Labels": labels,
+        "Env": get_environment(directory, service),
+        "ExposedPorts": exposed_ports,
+        "HostConfig": host_config,
+        "NetworkingConfig": {"EndpointsConfig": {network: {"Aliases": [name]}}},
+    }
+    for key, engine_key in [("command", "Cmd"), ("entrypoint", "Entrypoint")]:
+        if key in service:
+            value = service[key]
+            config[engine_key] = shlex.split(value) if isinstance(value, str) else [str(v) for v in value]
+    for key, engine_key in [("working_dir", "WorkingDir"), ("user", "User"), ("hostname", "Hostname"),
+                            ("tty", "Tty"), ("stdin_open", "OpenStdin")]:
+        if key in service:
+            config[engine_key] = service[key]
+    if "healthcheck" in service:
+        config["Healthcheck"] = to_healthcheck(service["healthcheck"])
+    return config
+
+
+def to_dict(value):
+    if isinstance(value, dict):
+        return {str(k): str(v) for k, v in value.items()}
+    result = {}
+    for item in value or []:
+        key, _, val = str(item).partition("=")
+        result[key] = val
+    return result
+
+
+def get_environment(directory, service):
+    environment = {}
+    env_files = service.get("env_file") or []
+    for env_file in [env_files] if isinstance(env_files, str) else env_files:
+        with open(os.path.join(directory, env_file)) as f:
+            for line in f.read().splitlines():
+                line = line.strip()
+                if line and not line.startswith("#") and "=" in line:
+                    key, _, val = line.partition("=")
+                    environment[key] = val
+    values = service.get("environment") or {}
+    if isinstance(values, dict):
+        for key, val in values.items():
+            if val is None:
+                val = os.environ.get(key)
+            if val is not None:
+                environment[key] = str(val).lower() if isinstance(val, bool) else str(val)
+    else:
+        for item in values:
+            key, sep, val = str(item).partition("=")
+            if sep:
+                environment[key] = val
+            elif key in os.environ:
+                environment[key] = os.environ[key]
+    return [f"{key}={val}" for key, val in environment.items()]
+
+
+def to_bind(project, directory, volume):
+    if isinstance(volume, dict):
+        source, target = volume.get("source", ""), volume["target"]
+        mode = "ro" if volume.get("read_only") else "rw"
+        if volume.get("type", "volume") == "volume" and source:
+            return f"{project}_{source}:{target}:{mode}"
+        return f"{resolve_path(directory, source)}:{target}:{mode}"
+    parts = str(volume).split(":")
+    if len(parts) == 1:
+        # An anonymous volume
+        return parts[0]
+    source = parts[0]
+    if source.startswith((".", "/", "~")):
+        parts[0] = resolve_path(directory, source)
+    else:
+        parts[0] = f"{project}_{source}"
+    return ":".join(parts)
+
+
+def resolve_path(directory, source):
+    return os.path.normpath(os.path.join(directory, os.path.expanduser(source)))
+
+
+def parse_port(port):
+    if isinstance(port, dict):
+        return "", str(port.get("published", "")), f"{port['target']}/{port.get('protocol', 'tcp')}"
+    port, _, protocol = str(port).partition("/")
+    parts = port.split(":")
+    container_port = f"{parts[-1]}/{protocol or 'tcp'}"
+    if len(parts) == 1:
+        return "", "", container_port
+    if len(parts) == 2:
+        return "", parts[0], container_port
+    return parts[0], parts[1], container_port
+
+
+def to_healthcheck(healthcheck):
+    if healthcheck.get("disable"):
+        return {"Test": ["NONE"]}
+    test = healthcheck.get("test", [])
+    result = {"Test": ["CMD-SHELL", test] if isinstance(test, str) else test}
+    for key, engine_key in [("interval", "Interval"), ("timeout", "Timeout"), ("start_period", "StartPeriod")]:
+        if key in healthcheck:
+            result[engine_key] = int(parse_duration(healthcheck[key]) * 1e9)
+    if "retries" in healthcheck:
+        result["Retries"] = int(healthcheck["retries"])
+    return result
+
+
+def parse_duration(duration):
+    """Seconds in a compose duration such as 1m30s or 500ms."""
+    if isinstance(duration, (int, float)):
+        return float(duration)
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001, "us": 0.000001}
+    matches = re.findall(r"([\d.]+)(h|ms|us|m|s)", duration)
+    return sum(float(amount) * units[unit] for amount, unit in matches)
+
+
+def parse_since(since):
+    if since is None:
+        return None
+    if re.fullmatch(r"[\d.]+", since):
+        return since
+    if re.fullmatch(r"([\d.]+(h|ms|us|m|s))+", since):
+        return str(int(time.time() - parse_duration(since)))
+    return str(int(datetime.fromisoformat(since.replace("Z", "+00:00")).timestamp()))
+
+
+def split_image(image):
+    if "@" in image:
+        return image, None
+    name, _, tag = image.rpartition(":")
+    if not name or "/" in tag:
+        return image, "latest"
+    return name, tag
@@ -0,0 +1,100 @@
+import os
+import re
+
+
+class IgnoreMatcher:
+    """Compiled .composerignore rules, using the same rules as a .gitignore file:
+    - blank lines and lines starting with # are skipped
+    - a leading ! re-includes a path ignored by an earlier rule
+    - a trailing / only matches directories
+    - a leading or middle / anchors the pattern to the root, otherwise it matches at any depth
+    - * and ? do not match /, ** matches any number of directories
+    The last rule that matches a path wins."""
+
+    def __init__(self, patterns, root):
+        self.root = root
+        self.rules = []
+        for pattern in patterns:
+            rule = compile_rule(pattern)
+            if rule is not None:
+                self.rules.append(rule)
+        # Checked in reverse so the first hit is the last matching rule
+        self.rules.reverse()
+        self.has_directory_rules = any(directory_only for _, _, directory_only in self.rules)
+
+    def is_ignored(self, relative_path, is_dir=False):
+        for regex, negate, directory_only in self.rules:
+            if directory_only and not is_dir:
+                continue
+            if regex.match(relative_path):
+                return not negate
+        return False
+
+    def ignored_names(self, path, names):
+        """The names in the directory `path` that are ignored."""
+        if not self.rules:
+            return set()
+        relative = os.path.relpath(path, self.root)
+        if relative.startswith(".."):
+            return set()
+        prefix = "" if relative == "." else relative.replace(os.sep, "/") + "/"
+        ignored = set()
+        for name in names:
+            is_dir = self.has_directory_rules and os.path.isdir(os.path.join(path, name))
+            if self.is_ignored(prefix + name, is_dir):
+                ignored.add(name)
+        return ignored
+
+
+def compile_rule(pattern):
+    pattern = pattern.rstrip("\n").rstrip()
+    if not pattern or pattern.startswith("#"):
+        return None
+    negate = pattern.startswith("!")
+    if negate:
+        pattern = pattern[1:]
+    elif pattern.startswith("\\"):
+        # \# and \! are literal
+        pattern = pattern[1:]
+    directory_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    if not pattern:
+        return None
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    regex = translate(pattern)
+    if not anchored:
+        regex = "(?:.*/)?" + regex
+    return re.compile(regex + "$"), negate, directory_only
+
+
+def translate(pattern):
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2:]:
+            end = pattern.index("]", i + 2)
+            contents = pattern[i + 1:end]
+            if contents.startswith("!"):
+                contents = "^" + contents[1:]
+            parts.append("[" + contents.replace("\\", "\\\\") + "]")
+            i = end + 1
+        elif pattern[i] == "\\" and i + 1 < len(pattern):
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(parts)
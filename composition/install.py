@@ -3,18 +3,16 @@ import logging
 import os.path
 import re
 import sys
-import traceback
 
-import jinja2 as jinja2
-from jinja2 import Template
+from composition import directory, storage, api, rendering, tracing
+from composition.models import DEFAULT_PARALLEL
 
-from composition import directory, storage, api
-from composition.models import Context
-from composition.storage import get_yaml
 
-
-def install_application(template="template.yaml", values=None, application_id=None, manual_values=None, always_pull=None):
-    directory.handle_install(template, values, application_id, manual_values, always_pull=always_pull)
+def install_application(template="template.yaml", values=None, application_id=None, manual_values=None, always_pull=None,
+                        parallel=DEFAULT_PARALLEL, max_depth=None, pull_parallel=4, wait_timeout=None, single_project=False):
+    directory.handle_install(template, values, application_id, manual_values, always_pull=always_pull,
+                             parallel=parallel, max_depth=max_depth, pull_parallel=pull_parallel,
+                             wait_timeout=wait_timeout, single_project=single_project)
 
 
 def consolidate_values(values, manual_values):
@@ -31,7 +29,7 @@ def consolidate_values(values, manual_values):
             logging.error(f"Values file {val_path} does not exist.")
             sys.exit(1)
         # Load the values file
-        loaded_values = get_yaml(val_path)
+        loaded_values = storage.get_cached_yaml(val_path)
         if loaded_values is None:
             logging.error("Could not load {val_path}, is it empty or invalid?")
             sys.exit(1)
@@ -71,66 +69,89 @@ def merge(dict_1, dict_2):
     return result
 
 
-def generate_config_maps(template_dir, all_values):
-    config_strs = []
-    config_files = directory.find_file_paths("*.configmap", base=template_dir)
-    logging.debug(f"Config maps found: {config_files}")
-    for conf in config_files:
-        # The path is local so get the filename
-        string = generate_template_str(conf, all_values)
-        config_strs.append({"filename": conf, "content": string})
-    return config_strs
+def get_template_files(template_dir, template_file, tree):
+    """The templates of a sub-app by the sub path they are rendered to, its docker-compose file and then its own
+    config maps (nested sub-apps render theirs)."""
+    files = {"docker-compose.yaml": os.path.join(template_dir, template_file)}
+    for conf in tree.configmaps.get(os.path.abspath(template_dir), []):
+        files[os.path.relpath(conf, template_dir)] = conf
+    logging.debug(f"Templates found: {list(files.values())}")
+    return files
 
 
 def generate_template_str(template_file, values):
-    with open(template_file) as f:
-        template = Template(f.read())
-    try:
-       return template.render(values)
-    except jinja2.exceptions.TemplateError as e:
-        logging.error("Error when rendering template.")
-        logging.error(f"Message: {e.message}")
-        if Context.verbose:
-            logging.error(traceback.format_exc())
-        else:
-            logging.error("Enable --verbose flag for more details.")
-        sys.exit(1)
+    return rendering.render(template_file, values)
+
 
-def generate_template(template_dir, template_file, app_details, application_id, values, manual_values, always_pull):
-    template_file = os.path.join(template_dir, template_file)
+def generate_template(template_dir, template_file, app_details, application_id, all_values, tree):
     if "name" not in app_details or "version" not in app_details:
         logging.error(f"Invalid app.yaml at {template_dir}.")
         logging.error("Must have a name and version.")
         return
-    app_name = app_details["name"]
-    logging.info(f"Generating template for {app_name}.")
-    all_values = consolidate_values(values, manual_values)
-    logging.debug(f"Values to apply: {all_values}")
-    # First generate configmap files
-    config_strs = generate_config_maps(template_dir, all_values)
-    # generate the docker-compose file
-    output_str = generate_template_str(template_file, all_values)
+    logging.info(f"Generating template for {app_details['name']}.")
+    rendered = render_subapp(template_dir, template_file, app_details, all_values, tree)
+    return store_subapp(template_dir, template_file, app_details, application_id, rendered, tree)
+
+
+def store_subapp(template_dir, template_file, app_details, application_id, rendered, tree):
+    """Writes a sub-app rendered by render_subapp to the application's storage."""
+    templates = get_template_files(template_dir, template_file, tree)
+    rendered = dict(rendered)
+    output_str = rendered.pop("docker-compose.yaml")
+    config_strs = [{"filename": templates[subpath], "content": content} for subpath, content in rendered.items()]
     # Save the template in the temp folders, returns the path of the output compose
     compose_path = os.path.join(template_dir, template_file)
+    path = storage.write_compose(application_id, output_str, app_details, compose_path, template_dir, config_strs,
+                                 tree=tree)
+    # The sub-app is started later on, once everything has been rendered
+    return to_subapp(app_details, template_dir, path)
+
+
+def render_subapp(template_dir, template_file, app_details, all_values, tree):
+    """Renders a sub-app's docker-compose file and config maps in memory, returning them by sub path. The value keys
+    each template uses, and a digest of its inputs, are recorded in app_details. Any template whose inputs are the same
+    as those already recorded is not rendered again and is None in the result."""
+    previous_inputs = app_details.get("inputs") or {}
+    rendered = {}
+    app_details["values_used"] = {}
+    app_details["inputs"] = {}
+    for subpath, template in get_template_files(template_dir, template_file, tree).items():
+        keys, digest = rendering.get_inputs(template, all_values)
+        app_details["values_used"][subpath] = keys
+        app_details["inputs"][subpath] = digest
+        if previous_inputs.get(subpath) == digest:
+            rendered[subpath] = None
+        else:
+            with tracing.span("render", subapp=app_details["name"], file=subpath):
+                rendered[subpath] = generate_template_str(template, all_values)
+    return rendered
+
 
-    path = storage.write_compose(application_id, output_str, app_details, compose_path, template_dir, config_strs)
+def to_subapp(app_details, template_dir, path):
+    return {
+        "name": app_details["name"],
+        "guid": app_details["guid"],
+        "directory": template_dir,
+        "path": path,
+        "app_details": app_details
+    }
 
-    handle_always_pull(always_pull, app_details, path)
 
-    logging.info(f"Starting services for {app_name}, this could take some time.")
+def start_subapp(subapp):
+    logging.info(f"Starting services for {subapp['name']}, this could take some time.")
     # docker-compose up on the template
-    api.compose_up(app_name, path, application_id)
+    return api.compose_up(subapp["name"], subapp["path"])
 
 
-def handle_always_pull(always_pull, app_details, path):
+def should_pull(always_pull, app_details):
     if always_pull is None:
         if "alwaysPull" in app_details and app_details["alwaysPull"]:
-            logging.info("Always pull is set to true in app config.")
-            api.compose_pull(path)
-        else:
-            logging.info("Always pull is set to false in app config. Continuing.")
-    elif always_pull and always_pull.lower().strip() == "true":
-        logging.info("Always pull has been overridden manually and is enabled.")
-        api.compose_pull(path)
-    else:
-        logging.info("Always pull has been overridden manually and is disabled.")
+            logging.info(f"Always pull is set to true in app config for {app_details['name']}.")
+            return True
+        logging.info(f"Always pull is set to false in app config for {app_details['name']}. Continuing.")
+        return False
+    if always_pull and always_pull.lower().strip() == "true":
+        logging.info(f"Always pull has been overridden manually and is enabled for {app_details['name']}.")
+        return True
+    logging.info(f"Always pull has been overridden manually and is disabled for {app_details['name']}.")
+    return False
@@ -1,15 +1,16 @@
 import logging
+import sys
 import time
-import humanize
 
-from composition.models import Context, Application
+from composition.models import Context, Application, APPLICATION_LABEL
 
 
-def setup_column_logging():
+def setup_column_logging(live=False):
     root = logging.getLogger()
     hdlr = root.handlers[0]
+    containers = "%(containers)-11s " if live else ""
     fmt = logging.Formatter(
-        '%(app_id)-15s %(version)-10s %(time)-10s %(status)-10s %(app_name)-23s %(compose_name)-20s')
+        f'%(app_id)-15s %(version)-10s %(time)-10s %(status)-10s {containers}%(app_name)-23s %(compose_name)-20s')
     hdlr.setFormatter(fmt)
 
 
@@ -20,11 +21,41 @@ def setup_default_logging_format():
     hdlr.setFormatter(fmt)
 
 
-def list_applications(quiet):
+def get_live_status(apps):
+    """The status of each app's containers right now, as {app id: (status, "running/total")}. Every container composer
+    has installed is listed with one query, however many applications there are."""
+    from composition.backend import get_backend
+    containers = get_backend().containers(APPLICATION_LABEL)
+    if containers is None:
+        logging.error("Could not list the running containers.")
+        sys.exit(1)
+    counts = {}
+    for container in containers:
+        application_id = container["labels"].get(APPLICATION_LABEL)
+        running, total = counts.get(application_id, (0, 0))
+        counts[application_id] = (running + (container["state"] == "running"), total + 1)
+    live = {}
+    for app in apps:
+        running, total = counts.get(app.id, (0, 0))
+        if total == 0:
+            status = "MISSING"
+        elif running == total:
+            status = "RUNNING"
+        elif running == 0:
+            status = "EXITED"
+        else:
+            status = "PARTIAL"
+        live[app.id] = (status, f"{running}/{total}")
+    return live
+
+
+def list_applications(quiet, live=False):
+    import humanize
     # Get the list of apps before any logging changes
     apps = Context.get_applications()
+    live_status = get_live_status(apps) if live and not quiet else {}
     if not quiet:
-        setup_column_logging()
+        setup_column_logging(live)
         # Print the headings
         logging.info("", extra={
             "app_id": "APP ID",
@@ -32,6 +63,7 @@ def list_applications(quiet):
             "time": "UPTIME",
             "app_name": "APP NAME",
             "status": "STATUS",
+            "containers": "CONTAINERS",
             "compose_name": "COMPOSE"
         })
 
@@ -42,9 +74,10 @@ def list_applications(quiet):
     else:
         for app in apps:  # type: Application
             time_delta = time.time() - app.start_timestamp
+            status, containers = live_status.get(app.id, (app.status.name, ""))
             # Utilise logging to set reasonable columns
             logging.info("", extra={"app_id": app.id, "version": app.version, "app_name": app.app_name,
-                                    "time": humanize.naturaldelta(time_delta), "status": app.status.name,
-                                    "compose_name": app.compose_name}
+                                    "time": humanize.naturaldelta(time_delta), "status": status,
+                                    "containers": containers, "compose_name": app.compose_name}
                          )
     setup_default_logging_format()
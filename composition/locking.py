@@ -0,0 +1,130 @@
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+class FileLock:
+    """A lock shared between composer processes using fcntl.flock on a lock file. Within a process it is a re-entrant
+    (per thread) readers-writer lock, so shared holders in different threads hold it at the same time and code holding
+    it can call functions which take it as well. A thread holding it shared can't then take it exclusively."""
+
+    def __init__(self, path):
+        self.path = path
+        self.condition = threading.Condition()
+        # Held while the lock file is opened (and flocked) or closed
+        self.file_lock = threading.Lock()
+        self.owner = None
+        self.depth = 0
+        # thread id -> depth, of the threads holding it shared
+        self.readers = {}
+        self.waiting_writers = 0
+        self.file = None
+
+    def acquire(self, shared=False):
+        me = threading.get_ident()
+        with self.condition:
+            if self.owner == me:
+                # Shared inside exclusive is still exclusive
+                self.depth += 1
+                return
+            if me in self.readers:
+                if not shared:
+                    raise RuntimeError(f"Can't take {self.path} exclusively while holding it shared.")
+                self.readers[me] += 1
+                return
+            if shared:
+                # Waiting writers go first, so a stream of shared holders can't starve them
+                while self.owner is not None or self.waiting_writers:
+                    self.condition.wait()
+                self.readers[me] = 1
+            else:
+                self.waiting_writers += 1
+                try:
+                    while self.owner is not None or self.readers:
+                        self.condition.wait()
+                finally:
+                    self.waiting_writers -= 1
+                self.owner = me
+                self.depth = 1
+        try:
+            with self.file_lock:
+                if self.file is None:
+                    self.file = open(self.path, "a")
+                    try:
+                        flock(self.file, shared)
+                    except BaseException:
+                        self.file.close()
+                        self.file = None
+                        raise
+        except BaseException:
+            self.release()
+            raise
+
+    def release(self):
+        me = threading.get_ident()
+        with self.condition:
+            if self.owner == me:
+                self.depth -= 1
+                if self.depth > 0:
+                    return
+                self.owner = None
+            else:
+                self.readers[me] -= 1
+                if self.readers[me] > 0:
+                    return
+                del self.readers[me]
+                if self.readers:
+                    return
+            with self.file_lock:
+                if self.file is not None:
+                    # Closing the file releases the flock
+                    self.file.close()
+                    self.file = None
+            self.condition.notify_all()
+
+
+def flock(f, shared):
+    try:
+        import fcntl
+    except ImportError:
+        # Not available on this platform, concurrent composer runs are not protected
+        return
+    fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+
+
+def get_lock_dir():
+    lock_dir = os.path.join(Path.home(), ".composer", "locks")
+    os.makedirs(lock_dir, exist_ok=True)
+    return lock_dir
+
+
+@contextmanager
+def locked(name, shared=False):
+    """Holds the named lock (a file in ~/.composer/locks) for the duration. Shared holders only exclude exclusive
+    ones, in this process as well as others."""
+    path = os.path.join(get_lock_dir(), f"{name}.lock")
+    with _locks_lock:
+        lock = _locks.get(path)
+        if lock is None:
+            lock = _locks[path] = FileLock(path)
+    lock.acquire(shared)
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def application_lock(application_id):
+    return locked(f"app-{application_id}")
+
+
+def registry_lock():
+    return locked("registry")
+
+
+def blobs_lock(shared=False):
+    return locked("blobs", shared)
@@ -4,10 +4,10 @@ import sys
 from composition.directory import handle_logs
 
 
-def logs(application_id_list, follow, service, application):
+def logs(application_id_list, follow, service, application, tail=None, since=None, grep=None):
     if not application_id_list:
         logging.error("Please include an id of application to view logs.")
         logging.error("e.g. composer logs moon_baboon")
         sys.exit(1)
-    for application_id in application_id_list:
-        handle_logs(application_id, follow=follow, service=service, application=application)
+    handle_logs(application_id_list, follow=follow, service=service, application=application, tail=tail, since=since,
+                grep=grep)
@@ -0,0 +1,150 @@
+import logging
+import os
+import queue
+import re
+import subprocess
+import sys
+import threading
+
+# Output is read in blocks of up to this size, always split on a line ending
+READ_SIZE = 64 * 1024
+# Blocks buffered per stream before its reader stops reading (and docker-compose blocks writing)
+BUFFERED_BLOCKS = 16
+
+
+class CommandSource:
+    """Log output from running a command."""
+
+    def __init__(self, command):
+        self.command = command
+        self.process = None
+        self.returncode = None
+
+    def chunks(self):
+        self.process = subprocess.Popen(self.command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        with self.process.stdout:
+            fd = self.process.stdout.fileno()
+            yield from iter(lambda: os.read(fd, READ_SIZE), b"")
+        self.returncode = self.process.wait()
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+
+class LogReader(threading.Thread):
+    """Reads the output of one log source into a bounded queue of blocks of whole lines. A source has chunks(),
+    yielding its output, stop() and a returncode once it has finished."""
+
+    def __init__(self, prefix, source, wakeup, grep=None):
+        super().__init__(daemon=True)
+        self.prefix = prefix
+        self.source = source
+        self.grep = grep
+        self.wakeup = wakeup
+        self.blocks = queue.Queue(maxsize=BUFFERED_BLOCKS)
+        self.returncode = None
+        self.stopped = threading.Event()
+        self.finished = threading.Event()
+
+    def run(self):
+        try:
+            self.read(self.source.chunks())
+            self.returncode = self.source.returncode
+        except OSError as e:
+            if not self.stopped.is_set():
+                logging.error(f"Could not get logs for {self.prefix}: {e}")
+            self.returncode = 1
+        finally:
+            self.finished.set()
+            self.notify()
+
+    def read(self, chunks):
+        partial = b""
+        for chunk in chunks:
+            chunk = partial + chunk
+            end = chunk.rfind(b"\n") + 1
+            if end == 0 and len(chunk) < READ_SIZE:
+                # Wait for the rest of the line, unless it is very long
+                partial = chunk
+                continue
+            if end == 0:
+                end = len(chunk)
+            partial = chunk[end:]
+            if not self.put(chunk[:end]):
+                return
+        if partial:
+            self.put(partial)
+
+    def put(self, block):
+        if self.grep is not None:
+            # Filter as early as possible so unwanted lines are never queued
+            block = b"".join(line for line in block.splitlines(keepends=True) if self.grep.search(line))
+            if not block:
+                return True
+        while not self.stopped.is_set():
+            try:
+                self.blocks.put(block, timeout=0.1)
+                self.notify()
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def notify(self):
+        with self.wakeup:
+            self.wakeup.notify()
+
+    def stop(self):
+        self.stopped.set()
+        self.source.stop()
+
+
+def stream_logs(targets, grep=None):
+    """Reads every (prefix, source) in targets at once and interleaves their output, each line prefixed with where it
+    came from. A source is either a command to run or a log source object. Only lines matching the grep regex are
+    output. Returns True if every source succeeded."""
+    wakeup = threading.Condition()
+    try:
+        pattern = re.compile(grep.encode()) if grep is not None else None
+    except re.error as e:
+        logging.error(f"Invalid --grep pattern {grep!r}: {e}")
+        sys.exit(1)
+    readers = [LogReader(prefix, CommandSource(source) if isinstance(source, list) else source, wakeup, pattern)
+               for prefix, source in targets]
+    width = max(len(reader.prefix) for reader in readers)
+    prefixes = {reader: f"{reader.prefix.ljust(width)} | ".encode() for reader in readers}
+    new_line_prefixes = {reader: b"\n" + prefix for reader, prefix in prefixes.items()}
+    out = sys.stdout.buffer
+    for reader in readers:
+        reader.start()
+    try:
+        while True:
+            # One block is taken from each stream in turn, and each round is written to stdout at once
+            chunks = []
+            for reader in readers:
+                try:
+                    block = reader.blocks.get_nowait()
+                except queue.Empty:
+                    continue
+                if block.endswith(b"\n"):
+                    block = block[:-1]
+                chunks.append(prefixes[reader])
+                chunks.append(block.replace(b"\n", new_line_prefixes[reader]))
+                chunks.append(b"\n")
+            if chunks:
+                out.write(b"".join(chunks))
+                out.flush()
+                continue
+            if all(reader.finished.is_set() and reader.blocks.empty() for reader in readers):
+                break
+            with wakeup:
+                wakeup.wait(timeout=0.1)
+    except KeyboardInterrupt:
+        logging.info("Stopping logs.")
+        for reader in readers:
+            reader.stop()
+        for reader in readers:
+            reader.join(timeout=5)
+        return True
+    return all(reader.returncode == 0 for reader in readers)
@@ -0,0 +1,156 @@
+import copy
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+from composition import directory, install, pull, scheduler, storage
+from composition.models import DEFAULT_PARALLEL, RESERVED_DIRECTORIES
+from composition.backend import get_backend
+from composition.tree import AppTree
+
+# The app tree, set in each rendering process
+_tree = None
+
+
+def install_manifest(manifest_path, template="template.yaml", always_pull=None, parallel=DEFAULT_PARALLEL, max_depth=None,
+                     pull_parallel=4, processes=None):
+    """Installs every instance listed in a manifest of the app in the current directory. The app is discovered
+    once, the instances are rendered across a pool of processes and then brought up at most `parallel` at a time.
+
+    The manifest is a list of instances (or a mapping with an `instances` list), each with an `id` and optionally
+    `values` files and `set` values, e.g.
+        instances:
+          - id: shop-eu
+            values: [values.yaml, eu.yaml]
+            set: [replicas=3]
+    """
+    instances = load_manifest(manifest_path)
+    get_backend().check()
+    directory.get_app_details(template)
+    # Walk the app directory and read every app.yaml once for all of the instances
+    tree = AppTree(os.getcwd(), storage.get_ignore_matcher(), max_depth=max_depth)
+    app_roots = []
+    for app_root in tree.app_roots:
+        app_details = directory.get_subapp_details(template, Path(app_root, "app.yaml"), tree)
+        if app_details is None:
+            continue
+        if "name" not in app_details or "version" not in app_details:
+            logging.error(f"Invalid app.yaml at {app_root}.")
+            logging.error("Must have a name and version.")
+            sys.exit(1)
+        app_roots.append((app_root, app_details))
+    jobs = [(instance["id"], template, app_roots,
+             install.consolidate_values(instance["values"], instance["set"])) for instance in instances]
+
+    start = time.time()
+    results = {instance["id"]: {"application_id": instance["id"], "result": "RENDER FAILED", "subapps": 0,
+                                "duration": 0.0} for instance in instances}
+    logging.info(f"Rendering {len(jobs)} instances of {app_roots[0][1]['name'] if app_roots else 'the app'}.")
+    subapps_by_id = {}
+    for application_id, rendered in render_instances(jobs, tree, processes):
+        if rendered is None:
+            continue
+        subapps_by_id[application_id] = [
+            install.store_subapp(app_root, template, app_details, application_id, files, tree)
+            for app_root, app_details, files in rendered
+        ]
+        results[application_id]["subapps"] = len(rendered)
+    render_time = time.time() - start
+
+    # Images shared by the instances are only pulled once
+    pull.prepull([subapp for subapps in subapps_by_id.values() for subapp in subapps], always_pull,
+                 parallel=pull_parallel)
+
+    def start_instance(application_id):
+        instance_start = time.time()
+        # The instances are what run in parallel, so each starts its own sub-apps one at a time
+        started = scheduler.start_subapps(subapps_by_id[application_id], application_id, install.start_subapp,
+                                          parallel=1, parent_directory=os.getcwd())
+        results[application_id]["result"] = "INSTALLED" if started else "FAILED"
+        results[application_id]["duration"] = render_time + time.time() - instance_start
+
+    with ThreadPoolExecutor(max_workers=max(parallel, 1)) as executor:
+        list(executor.map(start_instance, subapps_by_id))
+    print_summary(list(results.values()))
+    if any(result["result"] != "INSTALLED" for result in results.values()):
+        sys.exit(1)
+
+
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        logging.error(f"Manifest {manifest_path} does not exist.")
+        sys.exit(1)
+    manifest = storage.get_yaml(manifest_path)
+    if isinstance(manifest, dict):
+        manifest = manifest.get("instances")
+    if not isinstance(manifest, list) or not manifest:
+        logging.error(f"Manifest {manifest_path} must have a list of instances.")
+        sys.exit(1)
+    instances = []
+    for entry in manifest:
+        if not isinstance(entry, dict) or not entry.get("id"):
+            logging.error(f"Every instance in {manifest_path} needs an id: {entry}")
+            sys.exit(1)
+        values = entry.get("values") or ["values.yaml"]
+        manual_values = entry.get("set") or []
+        instances.append({
+            "id": str(entry["id"]),
+            "values": [values] if isinstance(values, str) else values,
+            "set": [manual_values] if isinstance(manual_values, str) else manual_values,
+        })
+    ids = [instance["id"] for instance in instances]
+    duplicates = sorted({application_id for application_id in ids if ids.count(application_id) > 1})
+    if duplicates:
+        logging.error(f"Instance ids must be unique, found duplicates: {', '.join(duplicates)}")
+        sys.exit(1)
+    taken = [application_id for application_id in ids
+             if application_id in RESERVED_DIRECTORIES or os.path.exists(storage.get_compose_loc(application_id))]
+    if taken:
+        logging.error(f"Applications already installed (or reserved): {', '.join(taken)}")
+        sys.exit(1)
+    return instances
+
+
+def render_instances(jobs, tree, processes=None):
+    """Renders the sub-apps of every instance, yielding (application_id, [(app_root, app_details, files)]) with None
+    in place of the list for any instance which failed to render."""
+    processes = min(processes or os.cpu_count() or 1, len(jobs))
+    if processes <= 1:
+        init_worker(tree)
+        yield from map(render_instance, jobs)
+        return
+    # Rendering is CPU bound, every process shares the compiled templates through the bytecode cache
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_worker, initargs=(tree,)) as executor:
+        yield from executor.map(render_instance, jobs)
+
+
+def init_worker(tree):
+    global _tree
+    _tree = tree
+
+
+def render_instance(job):
+    application_id, template, app_roots, all_values = job
+    try:
+        rendered = []
+        for app_root, app_details in app_roots:
+            # Every instance records its own guid, hashes etc.
+            app_details = copy.deepcopy(app_details)
+            rendered.append((app_root, app_details,
+                             install.render_subapp(app_root, template, app_details, all_values, _tree)))
+        return application_id, rendered
+    except SystemExit:
+        # The error has already been logged
+        logging.error(f"Could not render {application_id}.")
+        return application_id, None
+
+
+def print_summary(results):
+    logging.info("")
+    logging.info(f"{'APP ID':<23} {'RESULT':<14} {'SUB-APPS':<9} TIME")
+    for result in results:
+        logging.info(f"{result['application_id']:<23} {result['result']:<14} {result['subapps']:<9} "
+                     f"{result['duration']:.1f}s")
@@ -1,51 +1,91 @@
-import json
 import logging
 import os
 import time
 from enum import Enum
-from pathlib import Path
 
-import petname
+# Folders in ~/.composer used by composer itself rather than by an installed application
+RESERVED_DIRECTORIES = {"cache", "blobs", "locks"}
+# Stamped onto every service composer installs, so all of its containers can be found with a single query
+APPLICATION_LABEL = "io.composer.application"
+SUBAPP_LABEL = "io.composer.subapp"
+# The service's name in its own sub-app, for services merged into a single project (see project.py)
+SERVICE_NAME_LABEL = "io.composer.service"
+# The service's name in its compose project, set by docker-compose (and the engine backend)
+SERVICE_LABEL = "com.docker.compose.service"
+# How many sub-apps are started (or restarted) at the same time unless told otherwise
+DEFAULT_PARALLEL = 4
 
 
 class Context:
-    _applications = []
     verbose = False
+    # The container runtime backend chosen on the command line, see backend.get_backend
+    backend = None
 
     @staticmethod
-    def add_application(app):
-        Context._applications.append(app)
+    def get_applications():
+        # Listing only reads the registry index, see `composer reindex` if it gets out of sync
+        from composition import registry
+        return [Context.to_application(row) for row in registry.list_all()]
 
     @staticmethod
-    def get_applications():
-        Context.refresh_applications()
-        return Context._applications
+    def get_application(application_id):
+        from composition import registry
+        row = registry.get(application_id)
+        return Context.to_application(row) if row is not None else None
 
     @staticmethod
-    def refresh_applications():
-        Context._applications = []
-        application_path = os.path.join(Path.home(), ".composer")
-        subfolders = [f.path for f in os.scandir(application_path) if f.is_dir()]
-        configs = []
-        for folder in subfolders:
-            config_path = os.path.join(folder, "config.json")
-            if not os.path.exists(config_path):
-                logging.error(f"Path: {folder}, does not have a config.json.")
-                logging.error("To remedy this you will likely want to delete the above folder.")
-            else:
-                with open(config_path, "r") as f:
-                    configs.append(json.loads(f.read()))
-        for config in configs:
-            main_compose = config["apps"][0]
-            Context._applications.append(
-                Application(
-                    main_compose["compose_name"],
-                    main_compose["name"],
-                    main_compose["timestamp"],
-                    main_compose["version"],
-                    config["application_id"],
-                    Status(config["status"]))
-            )
+    def to_application(row):
+        return Application(row["compose_name"], row["name"], row["timestamp"], row["version"], row["application_id"],
+                           Status(row["status"]))
+
+
+class SubApp:
+    """One sub-app record of an installed application, `details` is the record as stored in config.json."""
+    __slots__ = ("guid", "name", "version", "compose_name", "timestamp", "details")
+
+    def __init__(self, details):
+        self.guid = details["guid"]
+        self.name = details["name"]
+        self.version = details.get("version")
+        self.compose_name = details.get("compose_name")
+        self.timestamp = details.get("timestamp")
+        self.details = details
+
+
+class AppConfig:
+    """An installed application's config.json, parsed once and shared by everything a command does with it. Sub-apps
+    are in install order (the parent first) and indexed by guid. `project` is set for applications installed as a
+    single project, mapping each sub-app's services to their merged names."""
+    __slots__ = ("application_id", "location", "status", "subapps", "by_guid", "project")
+
+    def __init__(self, location, config):
+        self.application_id = config["application_id"]
+        self.location = location
+        self.status = Status(config["status"])
+        self.subapps = [SubApp(details) for details in config["apps"]]
+        self.by_guid = {subapp.guid: subapp for subapp in self.subapps}
+        self.project = config.get("project")
+
+    def get(self, guid):
+        return self.by_guid[guid]
+
+    def compose_location(self, subapp):
+        return os.path.join(self.location, subapp.guid)
+
+    def teardown_order(self):
+        # The parent is brought down last
+        return list(reversed(self.subapps))
+
+    def select(self, application=None):
+        """The sub-apps in teardown order, only those named `application` if it is given."""
+        return [subapp for subapp in self.teardown_order() if application is None or subapp.name == application]
+
+    def project_services(self, subapps, service=None):
+        """The merged names of the sub-apps' services in a single project, only those originally named `service` if
+        it is given."""
+        services = self.project["services"]
+        return [merged for subapp in subapps for name, merged in services.get(subapp.guid, {}).items()
+                if service is None or name == service]
 
 
 class Action(str, Enum):
@@ -59,6 +99,7 @@ class Status(str, Enum):
 
 
 def generate_name():
+    import petname
     return petname.Generate()
 
 
@@ -0,0 +1,185 @@
+"""Single project installs (`install --single-project`). Every sub-app's stored compose file is merged into one
+docker-compose.yaml for the whole application, which is then brought up, down etc. with a single docker-compose call.
+
+Services, volumes, networks, configs and secrets are prefixed with their sub-app's name. Each sub-app's services share
+a network of their own on which they keep their original names, relative paths point into each sub-app's stored copy
+and dependsOn between sub-apps becomes depends_on between their services. The merged name of every service is
+recorded in config.json under "project"."""
+import logging
+import os
+import re
+
+from composition import api, scheduler, storage
+from composition.backend import get_backend
+from composition.models import SERVICE_NAME_LABEL, Status
+
+PROJECT_FILE = "docker-compose.yaml"
+# Top level sections whose entries belong to a sub-app
+PREFIXED_SECTIONS = ("volumes", "networks", "configs", "secrets")
+
+
+def get_project_path(application_id):
+    return os.path.join(storage.get_compose_loc(application_id), PROJECT_FILE)
+
+
+def start_project(application_id, subapps, parent_directory=None):
+    """Merges the sub-apps and brings them all up at once. Returns True if they started."""
+    path = write_project(application_id, subapps, parent_directory)
+    if get_backend().name == "engine":
+        logging.warning("The engine backend ignores networks, services will only be reachable by their merged names.")
+    logging.info(f"Starting services for all {len(subapps)} sub-apps of {application_id}, this could take some time.")
+    if not api.compose_up(application_id, path):
+        storage.update_status(application_id, Status.ERROR)
+        return False
+    return True
+
+
+def write_project(application_id, subapps, parent_directory=None):
+    compose, services = merge_subapps(subapps, parent_directory)
+    path = get_project_path(application_id)
+    storage.write_file(path, storage.to_yaml(compose))
+    storage.set_project(application_id, {"services": services})
+    return path
+
+
+def get_prefixes(subapps):
+    prefixes = {}
+    for subapp in subapps:
+        prefix = re.sub(r"[^a-z0-9_-]", "-", subapp["name"].lower()).strip("-_") or "app"
+        if prefix in prefixes.values():
+            # Sub-apps can share a name
+            prefix = f"{prefix}-{subapp['guid'][:8]}"
+        prefixes[subapp["guid"]] = prefix
+    return prefixes
+
+
+def merge_subapps(subapps, parent_directory=None):
+    """The merged compose file of the sub-apps, and the merged names of their services by guid."""
+    prefixes = get_prefixes(subapps)
+    composes = {subapp["guid"]: storage.get_yaml(subapp["path"]) or {} for subapp in subapps}
+    services = {guid: {name: f"{prefixes[guid]}-{name}" for name in (compose.get("services") or {})}
+                for guid, compose in composes.items()}
+    versions = [compose["version"] for compose in composes.values() if "version" in compose]
+    merged = {"version": versions[0]} if versions else {}
+    merged["services"] = {}
+    dependencies = scheduler.get_dependencies(subapps, parent_directory)
+    for subapp in subapps:
+        guid = subapp["guid"]
+        compose = composes[guid]
+        directory = os.path.dirname(subapp["path"])
+        renames = {section: {name: f"{prefixes[guid]}-{name}" for name in (compose.get(section) or {})}
+                   for section in PREFIXED_SECTIONS}
+        # The sub-app's own default network, rather than one shared by the whole project
+        renames["networks"].setdefault("default", f"{prefixes[guid]}-default")
+        merged.setdefault("networks", {})[renames["networks"]["default"]] = {}
+        for section in PREFIXED_SECTIONS:
+            for name, details in (compose.get(section) or {}).items():
+                merged.setdefault(section, {})[renames[section][name]] = merge_resource(name, details, directory)
+        # Every service waits for those of the sub-apps this one depends on
+        required = [merged_name for other in dependencies[guid] for merged_name in services[other].values()]
+        for name, service in (compose.get("services") or {}).items():
+            merged["services"][services[guid][name]] = merge_service(name, service or {}, services[guid], renames,
+                                                                      directory, required)
+    return merged, services
+
+
+def merge_resource(name, details, directory):
+    details = dict(details or {})
+    if details.get("external") and "name" not in details:
+        # External resources have to keep the name they already exist under
+        details["name"] = name
+    if "file" in details:
+        details["file"] = resolve_path(directory, details["file"])
+    return details
+
+
+def merge_service(name, service, own_services, renames, directory, required):
+    service = dict(service)
+
+    def own(service_name):
+        return own_services.get(service_name, service_name)
+
+    depends_on = service.get("depends_on") or []
+    if isinstance(depends_on, dict):
+        depends_on = {own(other): condition for other, condition in depends_on.items()}
+        depends_on.update({other: {"condition": "service_started"} for other in required if other not in depends_on})
+    else:
+        depends_on = [own(other) for other in depends_on]
+        depends_on += [other for other in required if other not in depends_on]
+    if depends_on:
+        service["depends_on"] = depends_on
+    if "links" in service:
+        # The alias keeps the name the service knew the other by
+        service["links"] = [f"{own(link.split(':')[0])}:{link.split(':', 1)[-1]}" for link in service["links"]]
+    if "volumes_from" in service:
+        service["volumes_from"] = [entry if entry.startswith("container:") else
+                                   ":".join([own(entry.split(":")[0])] + entry.split(":")[1:])
+                                   for entry in service["volumes_from"]]
+    network_mode = service.get("network_mode")
+    if isinstance(network_mode, str) and network_mode.startswith("service:"):
+        service["network_mode"] = f"service:{own(network_mode[len('service:'):])}"
+    if network_mode is None:
+        networks = service.get("networks") or ["default"]
+        if isinstance(networks, list):
+            networks = {network: None for network in networks}
+        service["networks"] = {renames["networks"].get(network, network): with_alias(config, name)
+                               for network, config in networks.items()}
+    if "volumes" in service:
+        service["volumes"] = [merge_volume(volume, renames, directory) for volume in service["volumes"]]
+    for section, default_target in (("configs", "/{}"), ("secrets", "{}")):
+        if section in service:
+            service[section] = [merge_reference(entry, renames[section], default_target) for entry in service[section]]
+    if "env_file" in service:
+        env_files = service["env_file"]
+        service["env_file"] = resolve_path(directory, env_files) if isinstance(env_files, str) else \
+            [resolve_path(directory, env_file) for env_file in env_files]
+    if isinstance(service.get("build"), str):
+        service["build"] = resolve_path(directory, service["build"])
+    elif isinstance(service.get("build"), dict):
+        service["build"] = dict(service["build"], context=resolve_path(directory, service["build"].get("context", ".")))
+    labels = service.get("labels") or {}
+    if isinstance(labels, list):
+        labels = dict(label.split("=", 1) if "=" in label else (label, "") for label in labels)
+    service["labels"] = {**labels, SERVICE_NAME_LABEL: name}
+    return service
+
+
+def with_alias(config, alias):
+    config = dict(config or {})
+    config["aliases"] = [*(config.get("aliases") or []), alias]
+    return config
+
+
+def merge_volume(volume, renames, directory):
+    if isinstance(volume, dict):
+        volume = dict(volume)
+        if volume.get("type") == "bind" and "source" in volume:
+            volume["source"] = resolve_path(directory, volume["source"])
+        elif volume.get("type", "volume") == "volume" and "source" in volume:
+            volume["source"] = renames["volumes"].get(volume["source"], volume["source"])
+        return volume
+    parts = volume.split(":")
+    if len(parts) == 1:
+        # An anonymous volume
+        return volume
+    if parts[0].startswith((".", "/", "~")):
+        parts[0] = resolve_path(directory, parts[0])
+    else:
+        parts[0] = renames["volumes"].get(parts[0], parts[0])
+    return ":".join(parts)
+
+
+def merge_reference(entry, renames, default_target):
+    # Renaming would move a config or secret given only by name, so its original target is kept
+    if isinstance(entry, str):
+        return {"source": renames.get(entry, entry), "target": default_target.format(entry)}
+    entry = dict(entry)
+    entry.setdefault("target", default_target.format(entry["source"]))
+    entry["source"] = renames.get(entry["source"], entry["source"])
+    return entry
+
+
+def resolve_path(directory, path):
+    if path.startswith("~") or os.path.isabs(path):
+        return path
+    return os.path.normpath(os.path.join(directory, path))
@@ -0,0 +1,64 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from composition import install, storage, tracing
+from composition.backend import get_backend
+
+
+def prepull(subapps, always_pull, parallel=4):
+    """Pulls every image used by the sub-apps which should always pull, before any of them are started. Each image is
+    only pulled once however many sub-apps use it, and up to `parallel` are pulled at the same time. Failures are
+    only warned about, as the image may be local only."""
+    paths = [subapp["path"] for subapp in subapps if install.should_pull(always_pull, subapp["app_details"])]
+    images = collect_images(paths)
+    if not images:
+        return []
+    logging.info(f"Pulling {len(images)} images. Will ignore failures of local images.")
+    backend = get_backend()
+    with ThreadPoolExecutor(max_workers=max(parallel, 1)) as executor:
+        results = list(executor.map(lambda image: pull_image(backend, image), images))
+    print_summary(results)
+    return results
+
+
+def collect_images(paths):
+    """The unique images of every service in the rendered compose files, in the order they are first used."""
+    images = {}
+    for path in paths:
+        compose = storage.get_yaml(path) or {}
+        for service in (compose.get("services") or {}).values():
+            # Images which are built are not pulled
+            if isinstance(service, dict) and service.get("image") and "build" not in service:
+                images.setdefault(normalise_image(str(service["image"])), None)
+    return list(images)
+
+
+def normalise_image(image):
+    # busybox and busybox:latest are the same image
+    if "@" in image or ":" in image.rsplit("/", 1)[-1]:
+        return image
+    return f"{image}:latest"
+
+
+def pull_image(backend, image):
+    start = time.time()
+    with tracing.span("pull", image=image):
+        if "@" in image and backend.image_exists(image):
+            # Pinned by digest, so what is already here can't be out of date
+            result = "CACHED"
+        elif backend.pull_image(image):
+            result = "PULLED"
+        else:
+            result = "FAILED"
+    return {"image": image, "result": result, "duration": time.time() - start}
+
+
+def print_summary(results):
+    width = max(23, max(len(result["image"]) for result in results))
+    logging.info(f"{'IMAGE':<{width}} {'RESULT':<8} TIME")
+    for result in results:
+        logging.info(f"{result['image']:<{width}} {result['result']:<8} {result['duration']:.1f}s")
+    counts = {name: sum(1 for result in results if result["result"] == name)
+              for name in ("PULLED", "CACHED", "FAILED")}
+    logging.info(f"{counts['PULLED']} pulled, {counts['CACHED']} already present, {counts['FAILED']} failed.")
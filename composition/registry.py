@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+from composition import locking
+from composition.models import RESERVED_DIRECTORIES, Status
+
+# One row per installed application, taken from the parent app record in its config.json
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS applications (
+    application_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    version TEXT NOT NULL,
+    compose_name TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    status TEXT NOT NULL
+)
+"""
+
+
+def get_registry_path():
+    return os.path.join(Path.home(), ".composer", "registry.db")
+
+
+@contextmanager
+def connect():
+    import sqlite3
+    # SQLite serialises the writes, the lock also covers creating and rebuilding the index from disk
+    with locking.registry_lock():
+        path = get_registry_path()
+        is_new = not os.path.exists(path)
+        conn = sqlite3.connect(path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                conn.execute(SCHEMA)
+                if is_new:
+                    # First use (or the index was deleted), build it from what is on disk
+                    rebuild_from_disk(conn)
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+
+def add(application_id, app_details, status):
+    with connect() as conn:
+        conn.execute("INSERT OR REPLACE INTO applications VALUES (?, ?, ?, ?, ?, ?)",
+                     (application_id, app_details["name"], str(app_details["version"]), app_details["compose_name"],
+                      app_details["timestamp"], Status(status).value))
+
+
+def set_status(application_id, status):
+    with connect() as conn:
+        conn.execute("UPDATE applications SET status = ? WHERE application_id = ?",
+                     (Status(status).value, application_id))
+
+
+def remove(application_id):
+    with connect() as conn:
+        conn.execute("DELETE FROM applications WHERE application_id = ?", (application_id,))
+
+
+def get(application_id):
+    with connect() as conn:
+        row = conn.execute("SELECT * FROM applications WHERE application_id = ?", (application_id,)).fetchone()
+    return dict(row) if row is not None else None
+
+
+def list_all():
+    with connect() as conn:
+        rows = conn.execute("SELECT * FROM applications ORDER BY timestamp").fetchall()
+    return [dict(row) for row in rows]
+
+
+def rebuild():
+    with connect() as conn:
+        return rebuild_from_disk(conn)
+
+
+def rebuild_from_disk(conn):
+    conn.execute("DELETE FROM applications")
+    application_path = os.path.join(Path.home(), ".composer")
+    count = 0
+    for folder in os.scandir(application_path):
+        if not folder.is_dir() or folder.name in RESERVED_DIRECTORIES:
+            continue
+        config_path = os.path.join(folder.path, "config.json")
+        if not os.path.exists(config_path):
+            logging.error(f"Path: {folder.path}, does not have a config.json.")
+            logging.error("To remedy this you will likely want to delete the above folder.")
+            continue
+        with open(config_path, "r") as f:
+            config = json.loads(f.read())
+        main_compose = config["apps"][0]
+        conn.execute("INSERT OR REPLACE INTO applications VALUES (?, ?, ?, ?, ?, ?)",
+                     (config["application_id"], main_compose["name"], str(main_compose["version"]),
+                      main_compose["compose_name"], main_compose["timestamp"], config["status"]))
+        count += 1
+    return count
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import logging
+import os
+import sys
+import traceback
+
+import jinja2
+from jinja2 import meta
+
+from composition import storage
+from composition.models import Context
+
+# The number of compiled templates kept in memory by each environment
+TEMPLATE_CACHE_SIZE = 400
+# Pieces of template output gathered before each write when streaming
+STREAM_BUFFER_SIZE = 64
+
+_environments = {}
+# Source hash -> the variables and templates a template references
+_analyses = {}
+
+
+def get_environment(root):
+    """The shared Jinja environment for an app directory. Templates are loaded relative to the root, so
+    {% include %} and {% import %} work between any of the app's files, compiled templates are kept in an LRU and
+    their bytecode is cached under ~/.composer/cache/jinja between runs."""
+    root = os.path.abspath(root)
+    environment = _environments.get(root)
+    if environment is None:
+        environment = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(root),
+            bytecode_cache=jinja2.FileSystemBytecodeCache(storage.get_cache_dir("jinja")),
+            cache_size=TEMPLATE_CACHE_SIZE,
+            auto_reload=True
+        )
+        _environments[root] = environment
+    return environment
+
+
+def get_template_name(template_file, root=None):
+    """The environment root and template name a template file is loaded with."""
+    if root is None:
+        root = os.getcwd()
+    path = os.path.abspath(template_file)
+    name = os.path.relpath(path, root)
+    if name.startswith(".."):
+        # Outside of the app directory, so load it from where it is
+        root, name = os.path.dirname(path), os.path.basename(path)
+    return root, name.replace(os.sep, "/")
+
+
+def get_template(template_file, root=None):
+    root, name = get_template_name(template_file, root)
+    return get_environment(root).get_template(name)
+
+
+def render(template_file, values, root=None):
+    try:
+        return get_template(template_file, root).render(values)
+    except jinja2.exceptions.TemplateError as e:
+        handle_template_error(e)
+
+
+def render_to(template_file, values, out, root=None):
+    """Like render, but the output is written to the file out as it is generated instead of being built up into one
+    string, so huge generated files (e.g. thousands of services from a loop) never have to be held in memory."""
+    try:
+        stream = get_template(template_file, root).stream(values)
+        stream.enable_buffering(STREAM_BUFFER_SIZE)
+        stream.dump(out)
+    except jinja2.exceptions.TemplateError as e:
+        handle_template_error(e)
+
+
+def get_inputs(template_file, values, root=None):
+    """The top level value keys a template uses (None if they can't be known) and a digest of everything its output
+    depends on: its source, the source of anything it includes, imports or extends, and the values it uses."""
+    keys, source_hashes = get_dependencies(template_file, root)
+    used = values if keys is None else {key: values[key] for key in keys if key in values}
+    digest = hashlib.sha256(json.dumps([source_hashes, used], sort_keys=True, default=str).encode()).hexdigest()
+    return keys, digest
+
+
+def get_dependencies(template_file, root=None):
+    """Works out which top level values a template reads from its AST, following any templates it references.
+    Returns the sorted keys (or None when a template is chosen at render time, so it could read anything) and the
+    hashes of every template source involved."""
+    root, name = get_template_name(template_file, root)
+    environment = get_environment(root)
+    keys = set()
+    source_hashes = []
+    seen = set()
+    to_visit = [name]
+    while to_visit:
+        name = to_visit.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        source_hash, analysis = analyse(environment, name)
+        source_hashes.append(source_hash)
+        if keys is not None:
+            keys.update(analysis["variables"])
+        for reference in analysis["references"]:
+            if reference is None:
+                keys = None
+            else:
+                to_visit.append(reference)
+    if keys is None:
+        return None, source_hashes
+    return sorted(keys - environment.globals.keys()), source_hashes
+
+
+def analyse(environment, name):
+    try:
+        source, _, _ = environment.loader.get_source(environment, name)
+    except jinja2.exceptions.TemplateNotFound:
+        # Only an error if it is actually rendered, e.g. it may be behind an if or "ignore missing"
+        return f"missing:{name}", {"variables": [], "references": []}
+    source_hash = hashlib.sha256(source.encode()).hexdigest()
+    analysis = _analyses.get(source_hash)
+    if analysis is not None:
+        return source_hash, analysis
+    # Parsing is most of the cost of compiling, so the analysis is cached by content between runs as well
+    cache_path = os.path.join(storage.get_cache_dir("dependencies"), source_hash + ".json")
+    try:
+        with open(cache_path, "r") as f:
+            analysis = json.loads(f.read())
+    except (OSError, ValueError):
+        try:
+            ast = environment.parse(source, name)
+        except jinja2.exceptions.TemplateError as e:
+            handle_template_error(e)
+        analysis = {
+            "variables": sorted(meta.find_undeclared_variables(ast)),
+            "references": list(meta.find_referenced_templates(ast)),
+        }
+        storage.write_file(cache_path, json.dumps(analysis))
+    _analyses[source_hash] = analysis
+    return source_hash, analysis
+
+
+def handle_template_error(e):
+    logging.error("Error when rendering template.")
+    logging.error(f"Message: {e.message}")
+    if Context.verbose:
+        logging.error(traceback.format_exc())
+    else:
+        logging.error("Enable --verbose flag for more details.")
+    sys.exit(1)
@@ -0,0 +1,101 @@
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from composition import storage
+from composition.models import DEFAULT_PARALLEL, Status
+
+
+def get_dependencies(subapps, parent_directory):
+    """Map each sub-app guid to the set of guids it has to wait for.
+    Dependencies come from the optional dependsOn list (app.yaml names) and the parent app always waits for all
+    of its sub-apps."""
+    guids_by_name = {}
+    for subapp in subapps:
+        guids_by_name.setdefault(subapp["name"], set()).add(subapp["guid"])
+    dependencies = {}
+    for subapp in subapps:
+        guid = subapp["guid"]
+        if subapp["directory"] == parent_directory:
+            dependencies[guid] = {s["guid"] for s in subapps if s["guid"] != guid}
+            continue
+        depends_on = subapp["app_details"].get("dependsOn") or []
+        if isinstance(depends_on, str):
+            depends_on = [depends_on]
+        dependencies[guid] = set()
+        for name in depends_on:
+            if name not in guids_by_name:
+                logging.error(f"Application {subapp['name']} depends on {name}, which could not be found.")
+                sys.exit(1)
+            dependencies[guid] |= guids_by_name[name] - {guid}
+    check_for_cycles(subapps, dependencies)
+    return dependencies
+
+
+def check_for_cycles(subapps, dependencies):
+    remaining = {guid: set(deps) for guid, deps in dependencies.items()}
+    while remaining:
+        ready = [guid for guid, deps in remaining.items() if not deps]
+        if not ready:
+            names = sorted(s["name"] for s in subapps if s["guid"] in remaining)
+            logging.error(f"Circular dependsOn found between applications: {', '.join(names)}")
+            sys.exit(1)
+        for guid in ready:
+            del remaining[guid]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+
+def start_subapps(subapps, application_id, start, parallel=DEFAULT_PARALLEL, parent_directory=None):
+    """Run start(subapp) for every sub-app on a pool of at most `parallel` workers, only starting a sub-app once
+    everything it depends on has started successfully. Returns True if every sub-app started."""
+    by_guid = {s["guid"]: s for s in subapps}
+    pending = get_dependencies(subapps, parent_directory)
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(parallel, 1)) as executor:
+        running = {}
+        while pending or running:
+            for guid in [g for g, deps in pending.items() if not deps]:
+                del pending[guid]
+                running[executor.submit(start, by_guid[guid])] = guid
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                guid = running.pop(future)
+                if _succeeded(future, by_guid[guid]):
+                    for deps in pending.values():
+                        deps.discard(guid)
+                else:
+                    failed.append(guid)
+                    failed.extend(skip_dependents(guid, pending, by_guid))
+    if failed:
+        storage.update_status(application_id, Status.ERROR)
+        names = ", ".join(by_guid[guid]["name"] for guid in failed)
+        logging.error(f"Failed to start: {names}")
+    return not failed
+
+
+def skip_dependents(failed_guid, pending, by_guid):
+    # Anything waiting on a failed sub-app will never be started, nor will anything waiting on those
+    skipped = []
+    to_check = [failed_guid]
+    while to_check:
+        guid = to_check.pop()
+        for other in [g for g, deps in pending.items() if guid in deps]:
+            del pending[other]
+            logging.error(f"Not starting {by_guid[other]['name']} as {by_guid[guid]['name']} failed to start.")
+            skipped.append(other)
+            to_check.append(other)
+    return skipped
+
+
+def _succeeded(future, subapp):
+    try:
+        return future.result()
+    except SystemExit:
+        # Whatever exited has already logged why, only this sub-app has failed
+        return False
+    except Exception as e:
+        logging.error(f"Unexpected error starting {subapp['name']}: {e}")
+        return False
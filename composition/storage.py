@@ -1,33 +1,77 @@
+import copy
 import errno
+import hashlib
 import json
 import logging
 import os.path
+import pickle
 import shutil
 import sys
 import tempfile
 import time
 import uuid
+from contextlib import contextmanager
 from os.path import join
 from pathlib import Path
-import yaml
 
-from composition.models import Status
+from composition import locking, registry, tracing
+from composition.blobs import BlobStore, copy_links
+from composition.ignore import IgnoreMatcher
+from composition.tree import AppTree
+from composition.models import AppConfig, Status, APPLICATION_LABEL, SUBAPP_LABEL
+
+_blob_store = None
+_yaml_cache = {}
+# config.json location -> (signature, AppConfig)
+_app_configs = {}
 
 
 def get_yaml(loc):
+    import yaml
+    # The libyaml loader is much faster, but is not always available
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
     val = None
     with open(loc, "r") as stream:
         try:
-            val = yaml.safe_load(stream)
+            val = yaml.load(stream, Loader=loader)
         except yaml.YAMLError as exc:
             print(exc)
     return val
 
 
+def get_cached_yaml(loc):
+    """Like get_yaml, but the parsed result is cached (in memory and under ~/.composer/cache/values) against the
+    file's path, modification time and size so unchanged values files are only parsed once."""
+    loc = os.path.abspath(loc)
+    stat = os.stat(loc)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _yaml_cache.get(loc)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    cache_path = os.path.join(get_cache_dir("values"), hashlib.sha256(loc.encode()).hexdigest() + ".pickle")
+    try:
+        with open(cache_path, "rb") as f:
+            cached = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+        cached = None
+    if cached is not None and cached[0] == loc and cached[1] == signature:
+        val = cached[2]
+    else:
+        val = get_yaml(loc)
+        if val is not None:
+            temp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+            with open(temp_path, "wb") as f:
+                pickle.dump((loc, signature, val), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, cache_path)
+    _yaml_cache[loc] = (signature, val)
+    return val
+
+
 def create_storage_if_not_exist():
     storage_path = os.path.join(Path.home(), ".composer")
     if not os.path.exists(storage_path):
-        os.mkdir(storage_path)
+        # Another composer may be creating it at the same time
+        os.makedirs(storage_path, exist_ok=True)
     if not os.path.isdir(storage_path):
         logging.error(f"Path: {storage_path} used for local storage is already in use.")
         logging.error("Please remove the file there and try again. Exiting.")
@@ -37,6 +81,32 @@ def create_storage_if_not_exist():
         sys.exit(1)
 
 
+def get_cache_dir(*subdirectories):
+    cache_path = os.path.join(Path.home(), ".composer", "cache", *subdirectories)
+    os.makedirs(cache_path, exist_ok=True)
+    return cache_path
+
+
+def write_file(path, content):
+    with atomic_writer(path) as f:
+        f.write(content)
+
+
+@contextmanager
+def atomic_writer(path):
+    """A file to write the new content of path to, which only replaces path once it is complete."""
+    # Write to a temporary file first so readers never see a half written file
+    temp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(temp_path, "x") as f:
+            yield f
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
 def is_writeable(path):
     # Temp file is automatically deleted
     try:
@@ -53,71 +123,246 @@ def is_writeable(path):
 def update_status(application_id, status: Status):
     application_path = os.path.join(Path.home(), ".composer", application_id)
     config_path = os.path.join(application_path, "config.json")
-    if not os.path.exists(config_path):
-        logging.error(f"Config path does not exist {config_path}")
-        sys.exit(1)
-    with open(config_path, "r") as f:
-        json_out = json.loads(f.read())
-    json_out["status"] = status
-    with open(config_path, "w") as f:
-        f.write(json.dumps(json_out))
+    with locking.application_lock(application_id):
+        if not os.path.exists(config_path):
+            logging.error(f"Config path does not exist {config_path}")
+            sys.exit(1)
+        json_out = get_app_config(application_id)
+        json_out["status"] = status
+        write_app_config(application_id, json_out)
+    registry.set_status(application_id, status)
+
+
+def set_project(application_id, project):
+    """Records how the application's sub-apps were merged into a single project, see project.py."""
+    with locking.application_lock(application_id):
+        config = get_app_config(application_id)
+        config["project"] = project
+        write_app_config(application_id, config)
 
 
 def append_to_app_config(app_details, application_id):
     application_path = os.path.join(Path.home(), ".composer", application_id)
     config_path = os.path.join(application_path, "config.json")
-    # If the config file does not already exist
-    if not os.path.exists(config_path):
-        with open(config_path, "w") as f:
-            f.write(json.dumps({
+    # Other installs may be adding to the same application, so the read and write must not interleave
+    with locking.application_lock(application_id):
+        # If the config file does not already exist
+        if not os.path.exists(config_path):
+            write_app_config(application_id, {
                 "application_id": application_id,
                 "status": Status.RUNNING,
                 "apps": [
                     app_details
                 ]
-            }))
-    # If the config file already exists
-    else:
-        # Read the file and update it
-        with open(config_path, "r") as f:
-            json_out = json.loads(f.read())
-        json_out["apps"].append(app_details)
-        # Overwrite the existing config
-        with open(config_path, "w") as f:
-            f.write(json.dumps(json_out))
+            })
+            # The first app is the parent, which is what the registry lists
+            registry.add(application_id, app_details, Status.RUNNING)
+        # If the config file already exists
+        else:
+            # Read the file and update it
+            json_out = get_app_config(application_id)
+            json_out["apps"].append(app_details)
+            # Replace the existing config
+            write_app_config(application_id, json_out)
 
 
-def write_compose(application_id, output_str, app_details, compose_path, template_dir, config_strs):
+def write_compose(application_id, output_str, app_details, compose_path, template_dir, config_strs, tree=None):
     application_path = get_compose_loc(application_id)
-    if not os.path.exists(application_path):
-        os.mkdir(application_path)
+    os.makedirs(application_path, exist_ok=True)
     # Use a UUID as we can have multiple composes per app and we don't want them to overlap
     guid = str(uuid.uuid4())
+    output_str = add_labels(output_str, application_id, guid)
+    rendered = get_rendered_files(output_str, template_dir, config_strs)
     # Add to the config
     app_details["guid"] = guid
     app_details["timestamp"] = time.time()
     app_details["compose_name"] = compose_path
-    append_to_app_config(app_details, application_id)
+    # Hashes of the rendered files, so an upgrade can tell which sub-apps have changed
+    app_details["hashes"] = {subpath: hash_content(content) for subpath, content in rendered.items()}
+    with tracing.span("register", subapp=app_details["name"]):
+        append_to_app_config(app_details, application_id)
     compose_path = get_compose_path(application_path, guid)
-    # Copy all files from current directory
-    # Unless they are in .composer_ignore
-    ignore_contents = get_ignore_contents()
-    shutil.copytree(template_dir, compose_path,
-                    ignore=ignore_patterns_override(*ignore_contents))
-    path = os.path.join(compose_path, "docker-compose.yaml")
-    with open(path, "w") as f:
-        f.write(output_str)
-    # now write the config maps replacing the existing ones
+    # Link all files from current directory from the blob store
+    # Unless they are in .composerignore, or are about to be rendered
+    if tree is None:
+        tree = AppTree(template_dir, get_ignore_matcher())
+    with tracing.span("copy", subapp=app_details["name"]):
+        get_blob_store().materialise_tree(template_dir, compose_path, tree, skip=list(rendered),
+                                          copy=get_writable_mounts(output_str))
+        # The rendered files are always written fresh, replacing rather than writing through any links
+        for subpath, content in rendered.items():
+            write_file(os.path.join(compose_path, subpath), content)
+    return os.path.join(compose_path, "docker-compose.yaml")
+
+
+def update_compose(application_id, app_details, rendered):
+    """Rewrites the rendered files (by sub path) of an installed sub-app which differ from the hashes recorded when
+    they were last written, leaving the rest untouched. A file which is None was not rendered again as nothing it
+    uses has changed. Returns True if any file was changed."""
+    compose_path = get_compose_path(get_compose_loc(application_id), app_details["guid"])
+    old_hashes = app_details.get("hashes") or {}
+    hashes = {}
+    changed = False
+    for subpath, content in rendered.items():
+        if content is None:
+            hashes[subpath] = old_hashes[subpath]
+            continue
+        if subpath == "docker-compose.yaml":
+            content = add_labels(content, application_id, app_details["guid"])
+        hashes[subpath] = hash_content(content)
+        if old_hashes.get(subpath) == hashes[subpath]:
+            continue
+        path = os.path.join(compose_path, subpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_file(path, content)
+        if subpath == "docker-compose.yaml":
+            # Anything newly mounted writable must stop sharing its blob
+            copy_links(compose_path, get_writable_mounts(content))
+        changed = True
+    for subpath in old_hashes.keys() - hashes.keys():
+        # A config map which has since been removed
+        path = os.path.join(compose_path, subpath)
+        if os.path.exists(path):
+            os.unlink(path)
+        changed = True
+    app_details["hashes"] = hashes
+    return changed
+
+
+def add_labels(output_str, application_id, guid):
+    """Stamps the application id and sub-app guid onto every service of a rendered compose file, so `list --live`
+    can find all of composer's containers at once. Anything that isn't a compose file is left as it is."""
+    import yaml
+    try:
+        # The node tree rather than the values, so every other scalar is written back as it was (yes stays yes)
+        compose = yaml.compose(output_str, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+    except yaml.YAMLError:
+        return output_str
+    services = get_node(compose, "services")
+    if not isinstance(services, yaml.MappingNode):
+        return output_str
+    for _, service in services.value:
+        if not isinstance(service, yaml.MappingNode):
+            continue
+        labels = [(key, value) for key, value in label_nodes(get_node(service, "labels"))
+                  if key.value not in (APPLICATION_LABEL, SUBAPP_LABEL)]
+        labels += [(str_node(APPLICATION_LABEL), str_node(application_id)), (str_node(SUBAPP_LABEL), str_node(guid))]
+        service.value = [(key, value) for key, value in service.value if key.value != "labels"]
+        service.value.append((str_node("labels"), yaml.MappingNode("tag:yaml.org,2002:map", labels)))
+    return yaml.serialize(compose, Dumper=getattr(yaml, "CSafeDumper", yaml.SafeDumper), allow_unicode=True)
+
+
+def get_node(node, key):
+    """The value node of a key in a mapping node, including from anything merged into it with <<."""
+    import yaml
+    if not isinstance(node, yaml.MappingNode):
+        return None
+    for key_node, value in reversed(node.value):
+        if key_node.value == key:
+            return value
+    for key_node, value in node.value:
+        if key_node.tag == "tag:yaml.org,2002:merge":
+            for merged in value.value if isinstance(value, yaml.SequenceNode) else [value]:
+                found = get_node(merged, key)
+                if found is not None:
+                    return found
+    return None
+
+
+def label_nodes(labels):
+    # Labels are either a mapping or a list of key=value. Copied, as they may be shared with other services by an anchor
+    import yaml
+    if isinstance(labels, yaml.MappingNode):
+        return [(copy.copy(key), copy.copy(value)) for key, value in labels.value]
+    if isinstance(labels, yaml.SequenceNode):
+        return [(str_node(key), str_node(value)) for key, _, value in
+                (str(label.value).partition("=") for label in labels.value if isinstance(label, yaml.ScalarNode))]
+    return []
+
+
+def str_node(value):
+    import yaml
+    return yaml.ScalarNode("tag:yaml.org,2002:str", value)
+
+
+def get_writable_mounts(output_str):
+    """The relative paths in a sub-app's directory which its compose file bind mounts without :ro."""
+    import yaml
+    try:
+        compose = yaml.load(output_str, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+    except yaml.YAMLError:
+        return []
+    if not isinstance(compose, dict) or not isinstance(compose.get("services"), dict):
+        return []
+    mounts = []
+    for service in compose["services"].values():
+        for volume in (service.get("volumes") if isinstance(service, dict) else None) or []:
+            if isinstance(volume, dict):
+                if volume.get("type") != "bind" or volume.get("read_only"):
+                    continue
+                source = volume.get("source")
+            else:
+                parts = str(volume).split(":")
+                if len(parts) < 2 or (len(parts) > 2 and "ro" in parts[2].split(",")):
+                    continue
+                source = parts[0]
+            # Only relative paths are in the sub-app's directory, anything else is a named volume or elsewhere
+            if not isinstance(source, str) or not source.startswith("."):
+                continue
+            relative = os.path.normpath(source)
+            if relative != ".." and not relative.startswith(".." + os.sep):
+                mounts.append(relative)
+    return mounts
+
+
+def to_yaml(value):
+    import yaml
+    return yaml.dump(value, Dumper=getattr(yaml, "CSafeDumper", yaml.SafeDumper), sort_keys=False, allow_unicode=True)
+
+
+def get_rendered_files(output_str, template_dir, config_strs):
+    # Each config map keeps its sub path in the target directory
+    rendered = {"docker-compose.yaml": output_str}
     for configmap in config_strs:
-        f = configmap["filename"]
-        # This ensures the subpath is maintained in the target directory
-        correct_subpath = Path(f).relative_to(template_dir)
-        content = configmap["content"]
-        conf_path = os.path.join(compose_path, correct_subpath)
-        # Write new file
-        with open(conf_path, "w") as f:
-            f.write(content)
-    return path
+        rendered[str(Path(configmap["filename"]).relative_to(template_dir))] = configmap["content"]
+    return rendered
+
+
+def hash_content(content):
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def get_app_config(application_id):
+    with open(os.path.join(get_compose_loc(application_id), "config.json"), "r") as f:
+        return json.loads(f.read())
+
+
+def load_app_config(location):
+    """The AppConfig of the application installed at location. It is only parsed again once the file has been
+    replaced, so every handler in a command shares the one read."""
+    config_path = os.path.join(location, "config.json")
+    stat = os.stat(config_path)
+    # config.json is always replaced rather than written in place, so a new inode means new content
+    signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = _app_configs.get(config_path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    with open(config_path, "rb") as f:
+        app_config = AppConfig(location, json.loads(f.read()))
+    _app_configs[config_path] = (signature, app_config)
+    return app_config
+
+
+def write_app_config(application_id, config):
+    # Replaced in one go, so a crash part way through never leaves a truncated config
+    write_file(os.path.join(get_compose_loc(application_id), "config.json"), json.dumps(config))
+
+
+def get_blob_store():
+    global _blob_store
+    if _blob_store is None:
+        _blob_store = BlobStore()
+    return _blob_store
 
 
 def get_compose_path(application_path, guid):
@@ -130,7 +375,9 @@ def get_compose_loc(application_id):
 
 def remove(application_id):
     location = os.path.join(Path.home(), ".composer", application_id)
-    shutil.rmtree(location)
+    with locking.application_lock(application_id):
+        shutil.rmtree(location)
+        registry.remove(application_id)
     logging.info(f"Application: '{application_id}' uninstalled.")
 
 
@@ -138,24 +385,10 @@ def get_ignore_contents():
     ignore_file = join(os.getcwd(), ".composerignore")
     if not os.path.exists(ignore_file):
         return []
-    with open(ignore_file, 'rb') as f:
-        return f.readlines()
-
-
-def ignore_patterns_override(*patterns):
-    """Function that can be used as copytree() ignore parameter.
-    Patterns is a sequence of glob-style patterns
-    that are used to exclude files/directories"""
-
-    def _ignore_patterns(path, names):
-        ignored_names = []
-        for pattern in patterns:
-            for path in Path(os.getcwd()).rglob(pattern):
-                ignored_names.append(str(path))
-        for f in names:
-            for pattern in patterns:
-                if os.path.abspath(join(path, f)) == pattern:
-                    ignored_names.append(f)
-        return set(ignored_names)
-
-    return _ignore_patterns
+    with open(ignore_file, 'r') as f:
+        return f.read().splitlines()
+
+
+def get_ignore_matcher():
+    # Patterns in .composerignore are relative to the directory composer is run from
+    return IgnoreMatcher(get_ignore_contents(), os.getcwd())
@@ -1,31 +1,38 @@
 import logging
 import os
 import sys
-import traceback
-
-import jinja2
-from jinja2 import Template
+from pathlib import Path
 
+from composition import directory, install, rendering, storage
 from composition.install import consolidate_values
-from composition.models import Context
+from composition.tree import AppTree
 
 
-def template(template_file="template.yaml", values=None, manual_values=None):
+def template(template_file="template.yaml", values=None, manual_values=None, output_dir=None):
     if manual_values is None:
         manual_values = []
     all_values = consolidate_values(values, manual_values)
-    # Use the values to generate the template
-    with open(template_file) as f:
-        template = Template(f.read())
-    try:
-        output_str = template.render(all_values)
-    except jinja2.exceptions.TemplateError as e:
-        logging.error("Error when rendering template.")
-        logging.error(f"Message: {e.message}")
-        if Context.verbose:
-            logging.error(traceback.format_exc())
-        else:
-            logging.error("Enable --verbose flag for more details.")
-        sys.exit(1)
-    # Using print ensure its works with stdout properly
-    print(f"{output_str}")
+    if output_dir is not None:
+        template_tree(template_file, all_values, output_dir)
+        return
+    # The output is streamed to stdout rather than built up in memory
+    rendering.render_to(template_file, all_values, sys.stdout)
+    sys.stdout.write("\n")
+
+
+def template_tree(template_file, all_values, output_dir):
+    """Renders the docker-compose file and config maps of every sub-app under the current directory in one pass,
+    writing each of them to the same relative path under output_dir."""
+    tree = AppTree(os.getcwd(), storage.get_ignore_matcher())
+    count = 0
+    for app_root in tree.app_roots:
+        if directory.get_subapp_details(template_file, Path(app_root, "app.yaml"), tree) is None:
+            continue
+        target_dir = os.path.join(output_dir, os.path.relpath(app_root, tree.root))
+        for subpath, template in install.get_template_files(app_root, template_file, tree).items():
+            path = os.path.join(target_dir, subpath)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with storage.atomic_writer(path) as f:
+                rendering.render_to(template, all_values, f)
+            count += 1
+    logging.info(f"Rendered {count} files to {output_dir}.")
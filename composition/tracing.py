@@ -0,0 +1,104 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+# Returned by span() while tracing is off, so disabled spans cost one call and one check
+_NOOP = nullcontext()
+_enabled = False
+_spans = []
+_spans_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ("name", "args", "start", "duration", "thread")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.start = 0.0
+        self.duration = 0.0
+        self.thread = threading.get_native_id()
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.duration = time.perf_counter() - self.start
+        with _spans_lock:
+            _spans.append(self)
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def is_enabled():
+    return _enabled
+
+
+def span(name, **args):
+    """Times a phase of work, e.g. `with tracing.span("render", subapp=name):`. A `subapp` argument groups the
+    phase under that sub-app in the timings breakdown."""
+    if not _enabled:
+        return _NOOP
+    return Span(name, args)
+
+
+def get_spans():
+    with _spans_lock:
+        return list(_spans)
+
+
+def print_timings():
+    """Logs the total time of each phase for every sub-app, and for the work done for the application as a whole."""
+    phases = {}
+    rows = {}
+    for s in get_spans():
+        phases.setdefault(s.name, None)
+        row = rows.setdefault(s.args.get("subapp", "(application)"), {})
+        row[s.name] = row.get(s.name, 0.0) + s.duration
+    if not rows:
+        return
+    width = max(23, max(len(name) for name in rows))
+    logging.info("")
+    logging.info(f"{'SUB-APP':<{width}} " + " ".join(f"{phase.upper():>9}" for phase in phases))
+    for name, row in rows.items():
+        cells = " ".join(f"{row[phase]:>8.3f}s" if phase in row else f"{'-':>9}" for phase in phases)
+        logging.info(f"{name:<{width}} {cells}")
+
+
+def write_trace(path):
+    """Writes the spans in Chrome's trace event format, for chrome://tracing or https://ui.perfetto.dev"""
+    pid = os.getpid()
+    events = [{
+        "name": s.name,
+        "cat": "composer",
+        "ph": "X",
+        "ts": s.start * 1e6,
+        "dur": s.duration * 1e6,
+        "pid": pid,
+        "tid": s.thread,
+        "args": {key: str(value) for key, value in s.args.items()},
+    } for s in get_spans()]
+    with open(path, "w") as f:
+        f.write(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+    logging.info(f"Trace written to {path}")
+
+
+def report(timings, trace_path):
+    global _enabled
+    try:
+        if timings:
+            print_timings()
+        if trace_path is not None:
+            write_trace(trace_path)
+    finally:
+        # Start afresh for the next command run by this process (see composerd)
+        _enabled = False
+        with _spans_lock:
+            _spans.clear()
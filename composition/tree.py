@@ -0,0 +1,91 @@
+import logging
+import os
+
+# Never looked inside when discovering applications, they are still copied with the app
+SKIPPED_DIRECTORIES = {".git", "node_modules"}
+
+
+class AppTree:
+    """Index of an app directory built from a single walk at the start of an install. Records every (non-ignored)
+    directory and file, the directories which are app roots (contain an app.yaml), and for each directory the
+    nearest app root that owns it. Sub-apps deeper than max_depth are treated as plain directories."""
+
+    def __init__(self, root, ignore=None, max_depth=None):
+        self.root = os.path.abspath(root)
+        self.app_roots = []
+        # directory -> (sub-directories, files), in walk order so parents come first
+        self.directories = {}
+        # directory -> the app root it belongs to
+        self.owners = {}
+        # app root -> its own config maps, not those of nested sub-apps
+        self.configmaps = {}
+        # directory -> its sub-directories in SKIPPED_DIRECTORIES, which are not indexed
+        self.skipped = {}
+        self.ignore = ignore
+        self.walk(ignore, max_depth)
+
+    def walk(self, ignore, max_depth):
+        for directory, dirs, files in self.walk_disk(self.root, ignore):
+            self.skipped[directory] = [d for d in dirs if d in SKIPPED_DIRECTORIES]
+            dirs[:] = [d for d in dirs if d not in SKIPPED_DIRECTORIES]
+            self.directories[directory] = (list(dirs), files)
+            relative = os.path.relpath(directory, self.root)
+            depth = 0 if relative == "." else relative.count(os.sep) + 1
+            owner = self.owners.get(os.path.dirname(directory))
+            if "app.yaml" in files:
+                if max_depth is None or depth <= max_depth:
+                    owner = directory
+                    self.app_roots.append(directory)
+                    self.configmaps[directory] = []
+                else:
+                    logging.debug(f"Skipping {directory}, it is deeper than the max depth of {max_depth}.")
+            self.owners[directory] = owner
+            if owner is not None:
+                self.configmaps[owner].extend(os.path.join(directory, f) for f in files if f.endswith(".configmap"))
+
+    def owner(self, path):
+        """The app root that a file or directory in the tree belongs to."""
+        path = os.path.abspath(path)
+        if path not in self.directories:
+            path = os.path.dirname(path)
+        return self.owners.get(path)
+
+    def has_file(self, directory, name):
+        return name in self.directories.get(os.path.abspath(directory), ((), ()))[1]
+
+    def walk_from(self, directory, include_skipped=False):
+        """Like os.walk for a directory in the tree, but from the index rather than the disk. With include_skipped,
+        directories such as node_modules are walked on disk as well, for copying the app."""
+        directory = os.path.abspath(directory)
+        prefix = directory + os.sep
+        for path, (dirs, files) in list(self.directories.items()):
+            if path == directory or path.startswith(prefix):
+                if not include_skipped or not self.skipped.get(path):
+                    yield path, dirs, files
+                    continue
+                yield path, dirs + self.skipped[path], files
+                for skipped in self.skipped[path]:
+                    yield from self.walk_disk(os.path.join(path, skipped), self.ignore)
+
+    @staticmethod
+    def walk_disk(root, ignore):
+        # Linked directories are followed, but not into a directory they are already inside, which would never end
+        inside = {}
+        for directory, dirs, files in os.walk(root, followlinks=True):
+            ignored = ignore.ignored_names(directory, dirs + files) if ignore is not None else set()
+            above = inside.pop(directory, frozenset()) | {file_id(directory)}
+            dirs[:] = [d for d in dirs if d not in ignored and not is_loop(os.path.join(directory, d), above)]
+            inside.update((os.path.join(directory, d), above) for d in dirs)
+            yield directory, dirs, [f for f in files if f not in ignored]
+
+
+def file_id(path):
+    stat = os.stat(path)
+    return stat.st_dev, stat.st_ino
+
+
+def is_loop(path, above):
+    if os.path.islink(path) and file_id(path) in above:
+        logging.debug(f"Not following {path}, it links to a directory it is inside.")
+        return True
+    return False
@@ -1,25 +1,69 @@
 import logging
+import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from composition import directory, storage
-from composition.models import Context
+from composition import blobs, directory, locking, storage
+from composition.models import Context, RESERVED_DIRECTORIES
 
 
-def uninstall_application(application_id_list, force, all):
+def uninstall_application(application_id_list, force, all, parallel=4):
     if all:
-        for app in Context.get_applications():
-            application_id = app.id
-            logging.info(f"Uninstalling {application_id}")
-            directory.handle_delete(application_id, force=force)
-            storage.remove(application_id)
-        return
-
-    if not application_id_list:
+        application_id_list = [app.id for app in Context.get_applications()]
+    elif not application_id_list:
         logging.error("Please include an id to delete.")
         logging.error("e.g. composer uninstall moon_baboon")
         sys.exit(1)
-    for application_id in application_id_list:
-        logging.info(f"Uninstalling {application_id}")
-        directory.handle_delete(application_id, force=force)
+    # Keep the order but only delete each application once
+    application_id_list = list(dict.fromkeys(application_id_list))
+    results = delete_applications(application_id_list, force, parallel)
+    # Files are shared between installs, only now unused ones can be removed
+    blobs.prune()
+    print_summary(results)
+    if any(result["result"] in ("NOT FOUND", "FAILED") for result in results):
+        sys.exit(1)
+
+
+def delete_applications(application_id_list, force, parallel=4):
+    """Tear down several applications at once. Each application's composes are still brought down one at a time in
+    reverse order (parent last) and its storage is only removed after all of them have finished."""
+    with ThreadPoolExecutor(max_workers=max(parallel, 1)) as executor:
+        return list(executor.map(lambda application_id: delete_application(application_id, force),
+                                 application_id_list))
+
+
+def delete_application(application_id, force):
+    start = time.time()
+    # Anything else is not an application, e.g. composer's own folders or somewhere outside ~/.composer entirely
+    if not is_application_id(application_id) or \
+            not os.path.exists(os.path.join(storage.get_compose_loc(application_id), "config.json")):
+        logging.error(f"Could not find application {application_id}")
+        return {"application_id": application_id, "result": "NOT FOUND", "duration": time.time() - start}
+    logging.info(f"Uninstalling {application_id}")
+    with locking.application_lock(application_id):
+        try:
+            config = storage.load_app_config(storage.get_compose_loc(application_id))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # Without its config nothing can be brought down, so nothing is removed either
+            logging.error(f"Could not read the config of {application_id}: {e}")
+            return {"application_id": application_id, "result": "FAILED", "duration": time.time() - start}
+        try:
+            result = "DELETED" if directory.bring_down(config, application_id, force) else "DELETED (WITH ERRORS)"
+        except Exception as e:
+            logging.error(f"Unexpected error bringing down {application_id}: {e}")
+            result = "DELETED (WITH ERRORS)"
         storage.remove(application_id)
+    return {"application_id": application_id, "result": result, "duration": time.time() - start}
+
+
+def is_application_id(application_id):
+    return bool(application_id) and application_id not in RESERVED_DIRECTORIES | {".", ".."} and \
+        os.sep not in application_id and (os.altsep is None or os.altsep not in application_id)
+
 
+def print_summary(results):
+    logging.info("")
+    logging.info(f"{'APP ID':<23} {'RESULT':<22} TIME")
+    for result in results:
+        logging.info(f"{result['application_id']:<23} {result['result']:<22} {result['duration']:.1f}s")
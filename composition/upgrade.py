@@ -0,0 +1,128 @@
+import logging
+import os
+import shutil
+import sys
+from pathlib import Path
+
+from composition import api, directory, install, locking, project, pull, registry, scheduler, storage, wait
+from composition.models import DEFAULT_PARALLEL, Status, RESERVED_DIRECTORIES
+from composition.backend import get_backend
+from composition.tree import AppTree
+
+# Details in config.json which belong to the install rather than to app.yaml
+INSTALL_DETAILS = ("guid", "timestamp", "compose_name", "hashes", "inputs")
+
+
+def upgrade_application(application_id, template="template.yaml", values=None, manual_values=None, always_pull=None,
+                        parallel=DEFAULT_PARALLEL, max_depth=None, pull_parallel=4, wait_timeout=None):
+    """Re-renders an installed application with new values and only restarts the sub-apps whose rendered
+    docker-compose file or config maps have changed. Sub-apps which are new are installed, and those which no longer
+    exist are brought down. With a wait_timeout it then waits up to that many seconds for the services of the
+    restarted sub-apps to be running (and healthy)."""
+    if values is None:
+        values = ["values.yaml"]
+    if manual_values is None:
+        manual_values = []
+    if application_id in RESERVED_DIRECTORIES:
+        logging.error(f"Could not find application {application_id}")
+        sys.exit(1)
+    location = directory.get_compose_path(application_id)
+    get_backend().check()
+    directory.get_app_details(template)
+    # Nothing else can change the application while it is being upgraded
+    with locking.application_lock(application_id):
+        config = storage.get_app_config(application_id)
+        records = list(config["apps"])
+        # Installed with --single-project, so everything is restarted from one merged compose file
+        single_project = config.get("project") is not None
+        # A start which failed may have left the new files in place, so nothing would look changed
+        failed = config["status"] != Status.RUNNING
+        tree = AppTree(os.getcwd(), storage.get_ignore_matcher(), max_depth=max_depth)
+        all_values = install.consolidate_values(values, manual_values)
+        logging.debug(f"Values to apply: {all_values}")
+
+        subapps = []
+        changed = set()
+        new_subapps = []
+        kept = []
+        for app_root in tree.app_roots:
+            app_details = directory.get_subapp_details(template, Path(app_root, "app.yaml"), tree)
+            if app_details is None:
+                continue
+            record = find_record(records, os.path.join(app_root, template), app_details["name"])
+            if record is None:
+                new_subapps.append((app_root, app_details))
+                continue
+            records.remove(record)
+            # Keep what the install recorded, but take everything else from the current app.yaml
+            app_details.update({key: record[key] for key in INSTALL_DETAILS if key in record})
+            # Only the templates whose source or values have changed are rendered again
+            rendered = install.render_subapp(app_root, template, app_details, all_values, tree)
+            if storage.update_compose(application_id, app_details, rendered) or failed:
+                changed.add(app_details["guid"])
+            else:
+                logging.info(f"{app_details['name']} is unchanged.")
+            kept.append(app_details)
+            subapps.append(install.to_subapp(app_details, app_root,
+                                             os.path.join(location, app_details["guid"], "docker-compose.yaml")))
+
+        # Anything left over is no longer part of the application
+        for record in reversed(records):
+            logging.info(f"Removing {record['name']}, it is no longer part of the application.")
+            compose_location = os.path.join(location, record["guid"])
+            if single_project:
+                services = list(config["project"]["services"].get(record["guid"], {}).values())
+                if services:
+                    api.cmd(location, ["rm", "--stop", "--force", *services])
+            else:
+                api.compose_down(compose_location, application_id)
+            shutil.rmtree(compose_location)
+        # config.json is only rewritten if something in it has changed, the status only once everything has started
+        if kept != config["apps"] or new_subapps:
+            config["apps"] = kept
+            storage.write_app_config(application_id, config)
+            if kept:
+                registry.add(application_id, kept[0], config["status"])
+        for app_root, app_details in new_subapps:
+            logging.info(f"Installing new sub-app {app_details['name']}.")
+            subapp = install.generate_template(app_root, template, app_details, application_id, all_values, tree)
+            if subapp is not None:
+                changed.add(subapp["guid"])
+                subapps.append(subapp)
+        if new_subapps and not kept:
+            registry.add(application_id, new_subapps[0][1], config["status"])
+
+        if not changed:
+            if single_project and records:
+                # Drop the removed sub-apps from the merged file
+                project.write_project(application_id, subapps, parent_directory=os.getcwd())
+            logging.info(f"No sub-apps of {application_id} have changed, nothing to restart.")
+            return
+        pull.prepull([subapp for subapp in subapps if subapp["guid"] in changed], always_pull, parallel=pull_parallel)
+        if single_project:
+            # docker-compose only recreates the services whose configuration has changed
+            started = project.start_project(application_id, subapps, parent_directory=os.getcwd())
+        else:
+            # Every sub-app goes through the scheduler so dependsOn is respected, but unchanged ones are left alone
+            started = scheduler.start_subapps(
+                subapps, application_id, lambda subapp: subapp["guid"] not in changed or install.start_subapp(subapp),
+                parallel=parallel, parent_directory=os.getcwd())
+        if not started:
+            sys.exit(1)
+        if failed:
+            storage.update_status(application_id, Status.RUNNING)
+    # Waiting happens outside the lock, the upgrade itself is done
+    restarted = [subapp for subapp in subapps if subapp["guid"] in changed]
+    if wait_timeout is not None and not wait.wait_for_application(application_id, restarted, wait_timeout):
+        storage.update_status(application_id, Status.ERROR)
+        sys.exit(1)
+    logging.info(f"Successfully upgraded {application_id}, restarted {len(changed)} of {len(subapps)} sub-apps.")
+
+
+def find_record(records, compose_name, name):
+    # Sub-apps are matched by where their template is, or by name if the application has been moved
+    for record in records:
+        if record["compose_name"] == compose_name:
+            return record
+    matches = [record for record in records if record["name"] == name]
+    return matches[0] if len(matches) == 1 else None
@@ -0,0 +1,166 @@
+import json
+import logging
+import queue
+import re
+import threading
+import time
+
+from composition import storage
+from composition.backend import get_backend
+from composition.models import APPLICATION_LABEL, SUBAPP_LABEL, SERVICE_NAME_LABEL, SERVICE_LABEL
+
+# e.g. "Up 5 seconds (health: starting)" or "Exited (1) 3 seconds ago" from docker ps
+HEALTH_PATTERN = re.compile(r"\((healthy|unhealthy|health: starting)\)")
+EXIT_CODE_PATTERN = re.compile(r"^Exited \((-?\d+)\)")
+
+READY = "ready"
+
+
+class Readiness:
+    """Whether each service of an application's sub-apps is ready: running, and healthy if it has a healthcheck. A
+    service which exits with 0 (e.g. a one off migration) counts as ready, any other exit or becoming unhealthy fails
+    the whole application."""
+
+    def __init__(self, subapps):
+        # (guid, service) -> READY or what it is waiting for
+        self.services = {}
+        self.names = {}
+        self.healthchecks = set()
+        for subapp in subapps:
+            compose = storage.get_yaml(subapp["path"]) or {}
+            for service, details in (compose.get("services") or {}).items():
+                key = (subapp["guid"], service)
+                self.services[key] = "not created"
+                self.names[key] = f"{subapp['name']}/{service}"
+                healthcheck = details.get("healthcheck") if isinstance(details, dict) else None
+                if healthcheck and not healthcheck.get("disable"):
+                    self.healthchecks.add(key)
+        self.failure = None
+
+    def is_ready(self):
+        return all(state == READY for state in self.services.values())
+
+    def waiting_for(self):
+        return [f"{self.names[key]} ({state})" for key, state in self.services.items() if state != READY]
+
+    def from_container(self, container):
+        """Takes in a container as listed by ComposeBackend.containers."""
+        key = self.get_key(container["labels"])
+        if key is None:
+            return
+        status = container.get("status") or ""
+        if container["state"] == "running":
+            health = HEALTH_PATTERN.search(status)
+            self.set_health(key, health.group(1) if health else None)
+        elif container["state"] in ("exited", "dead"):
+            exit_code = EXIT_CODE_PATTERN.match(status)
+            self.set_exited(key, exit_code.group(1) if exit_code else "unknown")
+        else:
+            self.services[key] = container["state"]
+
+    def from_event(self, event):
+        """Takes in a container event from ComposeBackend.events."""
+        attributes = (event.get("Actor") or {}).get("Attributes") or {}
+        key = self.get_key(attributes)
+        if key is None:
+            return
+        action = event.get("Action") or event.get("status") or ""
+        if action == "start":
+            self.services[key] = "starting" if key in self.healthchecks else READY
+        elif action.startswith("health_status:"):
+            self.set_health(key, action.split(":", 1)[1].strip())
+        elif action == "die":
+            self.set_exited(key, attributes.get("exitCode", "unknown"))
+
+    def get_key(self, labels):
+        # Services merged into a single project are labelled with their original name
+        key = (labels.get(SUBAPP_LABEL), labels.get(SERVICE_NAME_LABEL) or labels.get(SERVICE_LABEL))
+        # Only the services of the sub-apps being waited for
+        return key if key in self.services else None
+
+    def set_health(self, key, health):
+        if health == "unhealthy":
+            self.fail(key, "is unhealthy")
+        elif health == "healthy" or (health is None and key not in self.healthchecks):
+            self.services[key] = READY
+        else:
+            self.services[key] = "starting"
+
+    def set_exited(self, key, exit_code):
+        if exit_code == "0":
+            self.services[key] = READY
+        else:
+            self.fail(key, f"exited with code {exit_code}")
+
+    def fail(self, key, reason):
+        self.services[key] = reason
+        if self.failure is None:
+            self.failure = f"{self.names[key]} {reason}"
+
+
+def wait_for_application(application_id, subapps, timeout):
+    """Blocks until every service of the sub-apps is ready, returning True, or returns False as soon as one of them
+    fails or once timeout seconds have passed. The containers are listed once and then followed through docker's
+    event stream rather than by polling each of them."""
+    readiness = Readiness(subapps)
+    label = f"{APPLICATION_LABEL}={application_id}"
+    backend = get_backend()
+    deadline = time.time() + timeout
+    # Everything up to now is in the listing, anything after that is in the events
+    since = time.time()
+    containers = backend.containers(label)
+    if containers is None:
+        return False
+    for container in containers:
+        readiness.from_container(container)
+    if not readiness.is_ready() and readiness.failure is None:
+        logging.info(f"Waiting up to {timeout}s for {len(readiness.waiting_for())} services to be ready.")
+        follow_events(backend.events(label, since), readiness, deadline, int(since * 1e9))
+    if readiness.failure is not None:
+        logging.error(f"{application_id} failed to start: {readiness.failure}")
+        return False
+    if not readiness.is_ready():
+        logging.error(f"Timed out after {timeout}s waiting for: {', '.join(readiness.waiting_for())}")
+        return False
+    logging.info(f"All {len(readiness.services)} services of {application_id} are ready.")
+    return True
+
+
+def follow_events(source, readiness, deadline, since_ns):
+    events = queue.Queue()
+    reader = threading.Thread(target=read_events, args=(source, events), daemon=True)
+    reader.start()
+    try:
+        while not readiness.is_ready() and readiness.failure is None:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            try:
+                event = events.get(timeout=remaining)
+            except queue.Empty:
+                return
+            if event is None:
+                logging.error("The docker event stream ended unexpectedly.")
+                return
+            # The listing already covers anything from before it was taken
+            if event.get("timeNano", since_ns) >= since_ns:
+                readiness.from_event(event)
+    finally:
+        source.stop()
+        reader.join(timeout=5)
+
+
+def read_events(source, events):
+    partial = b""
+    try:
+        for chunk in source.chunks():
+            lines = (partial + chunk).split(b"\n")
+            partial = lines.pop()
+            for line in lines:
+                if line.strip():
+                    try:
+                        events.put(json.loads(line))
+                    except ValueError:
+                        logging.debug(f"Ignoring unexpected event output: {line}")
+    finally:
+        events.put(None)
@@ -0,0 +1,38 @@
+"""Generates synthetic composer apps of a given size for tests and benchmarks."""
+import os
+
+
+def generate_app(root, subapps=1, depth=1, configmaps=1, files=1, values=10):
+    """Writes an app to root with a parent and `subapps` sub-apps, nested up to `depth` directories deep. Every app
+    has `configmaps` config maps and `files` plain files, and values.yaml has `values` keys which are spread across
+    the templates. Returns root."""
+    os.makedirs(root, exist_ok=True)
+    keys = [f"key_{i}" for i in range(values)]
+    write_app(root, "parent", keys, configmaps, files)
+    for i in range(subapps):
+        # Spread the sub-apps over every level up to depth
+        level = i % max(depth, 1) + 1
+        path = os.path.join(root, *[f"level{n}" for n in range(1, level)], f"sub{i}")
+        write_app(path, f"sub{i}", keys[i::subapps + 1] or keys[:1], configmaps, files)
+    with open(os.path.join(root, "values.yaml"), "w") as f:
+        f.writelines(f"{key}: value-{key}\n" for key in keys)
+    return root
+
+
+def write_app(path, name, keys, configmaps, files):
+    os.makedirs(path, exist_ok=True)
+    write(os.path.join(path, "app.yaml"), f"name: {name}\nversion: 1.0.0\nalwaysPull: false\n")
+    environment = "".join(f"      {key.upper()}: \"{{{{ {key} }}}}\"\n" for key in keys)
+    write(os.path.join(path, "template.yaml"),
+          f"services:\n  {name}:\n    image: busybox\n    environment:\n{environment}")
+    for i in range(configmaps):
+        write(os.path.join(path, "config", f"config{i}.configmap"),
+              "".join(f"{key}={{{{ {key} }}}}\n" for key in keys[i::configmaps] or keys[:1]))
+    for i in range(files):
+        write(os.path.join(path, "files", f"file{i}.txt"), f"static file {i} of {name}\n" * 10)
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""A stand-in for docker-compose so composer can be tested and benchmarked without docker. It is configured through
+environment variables:
+    FAKE_COMPOSE_LATENCY       seconds every command takes (default 0)
+    FAKE_COMPOSE_LOG_LINES     lines printed per service by `logs` (default 3)
+    FAKE_COMPOSE_FAILURE_RATE  chance (0 to 1) of up/down/pull failing (default 0)
+    FAKE_COMPOSE_CALLS         file every command line is appended to (optional)
+Use install() to put it on a PATH as `docker-compose`."""
+import os
+import random
+import stat
+import sys
+import time
+
+
+def install(bin_dir, latency=0.0, log_lines=3, failure_rate=0.0, calls=None):
+    """Writes a docker-compose executable into bin_dir which runs this fake with the given settings."""
+    os.makedirs(bin_dir, exist_ok=True)
+    path = os.path.join(bin_dir, "docker-compose")
+    settings = {"FAKE_COMPOSE_LATENCY": latency, "FAKE_COMPOSE_LOG_LINES": log_lines,
+                "FAKE_COMPOSE_FAILURE_RATE": failure_rate}
+    if calls is not None:
+        settings["FAKE_COMPOSE_CALLS"] = calls
+    exports = "".join(f"export {name}=\"${{{name}:-{value}}}\"\n" for name, value in settings.items())
+    with open(path, "w") as f:
+        f.write(f"#!/bin/sh\n{exports}exec \"{sys.executable}\" \"{os.path.abspath(__file__)}\" \"$@\"\n")
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
+def get_services(compose_path):
+    # Good enough for composer's own output, without needing yaml
+    services = []
+    in_services = False
+    with open(compose_path) as f:
+        for line in f:
+            if line.startswith("services:"):
+                in_services = True
+            elif in_services and line[:1] not in (" ", "\n", "#"):
+                in_services = False
+            elif in_services and line.startswith("  ") and not line.startswith("   ") and line.strip().endswith(":"):
+                services.append(line.strip()[:-1])
+    return services or ["service"]
+
+
+def main(args):
+    calls = os.environ.get("FAKE_COMPOSE_CALLS")
+    if calls:
+        with open(calls, "a") as f:
+            f.write(" ".join(args) + "\n")
+    if args[:1] == ["version"]:
+        print("Docker Compose version v2.0.0-fake")
+        return 0
+    time.sleep(float(os.environ.get("FAKE_COMPOSE_LATENCY", 0)))
+    compose_path = args[args.index("-f") + 1] if "-f" in args else "docker-compose.yaml"
+    command = [arg for arg in args if not arg.startswith("-") and arg != compose_path]
+    if command[:1] in (["up"], ["down"], ["pull"]):
+        if random.random() < float(os.environ.get("FAKE_COMPOSE_FAILURE_RATE", 0)):
+            sys.stderr.write(f"Error: fake failure of {command[0]}\n")
+            return 1
+        return 0
+    if command[:1] == ["logs"]:
+        services = command[1:] or get_services(compose_path)
+        width = max(len(service) for service in services)
+        lines = int(os.environ.get("FAKE_COMPOSE_LOG_LINES", 3))
+        out = sys.stdout
+        for i in range(lines):
+            for service in services:
+                out.write(f"{service.ljust(width)}  | log line {i} of {lines}\n")
+        out.flush()
+        return 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,37 @@
+import os
+from unittest.mock import patch
+
+from composition import directory, storage
+from composition.models import Status
+
+
+def install_app(application_id, names):
+    os.makedirs(storage.get_compose_loc(application_id))
+    for i, name in enumerate(names):
+        storage.append_to_app_config({"name": name, "version": "1.0.0", "guid": f"guid-{i}", "timestamp": 1.0,
+                                      "compose_name": f"/tmp/{name}/template.yaml"}, application_id)
+
+
+def test_config_is_parsed_once_per_change():
+    storage.create_storage_if_not_exist()
+    install_app("moon_baboon", ["parent", "first", "second"])
+    location = storage.get_compose_loc("moon_baboon")
+    with patch("composition.storage.json.loads", wraps=storage.json.loads) as mock_loads:
+        config = storage.load_app_config(location)
+        assert [subapp.name for subapp in config.teardown_order()] == ["second", "first", "parent"]
+        assert directory.get_application_guids(location) == ["guid-2", "guid-1", "guid-0"]
+        assert directory.get_name_from_guid(location, "guid-1") == "first"
+        assert mock_loads.call_count == 1
+    assert not hasattr(config.get("guid-0"), "__dict__")
+
+    storage.update_status("moon_baboon", Status.ERROR)
+    assert storage.load_app_config(location).status == Status.ERROR
+
+
+@patch("composition.api.compose_logs")
+def test_logs_for_one_subapp(mock_compose_logs):
+    storage.create_storage_if_not_exist()
+    install_app("moon_baboon", ["parent", "first", "second"])
+    directory.handle_logs(["moon_baboon"], application="first")
+    targets = mock_compose_logs.call_args.args[0]
+    assert targets == [("moon_baboon/first", os.path.join(storage.get_compose_loc("moon_baboon"), "guid-1"))]
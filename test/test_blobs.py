@@ -0,0 +1,107 @@
+import errno
+import os
+
+from composition import blobs, storage
+from composition.blobs import BlobStore
+from composition.tree import AppTree
+
+
+def make_source(root):
+    os.makedirs(root / "data")
+    (root / "a.txt").write_text("shared\n")
+    (root / "b.txt").write_text("shared\n")
+    (root / "data" / "app.db").write_text("database\n")
+    return root
+
+
+def no_reflinks(store):
+    store.use_reflink = False
+    return store
+
+
+def count_reads(monkeypatch):
+    reads = []
+    hash_file = blobs.hash_file
+    monkeypatch.setattr(blobs, "hash_file", lambda path: reads.append(path) or hash_file(path))
+    return reads
+
+
+def blob_count():
+    return sum(len(files) for _, _, files in os.walk(blobs.get_blob_dir()))
+
+
+def test_identical_files_are_stored_once(tmp_path):
+    source = make_source(tmp_path / "source")
+    store = no_reflinks(BlobStore())
+    store.materialise_tree(str(source), str(tmp_path / "one"), AppTree(str(source)))
+    store.materialise_tree(str(source), str(tmp_path / "two"), AppTree(str(source)))
+    assert blob_count() == 2
+    blob = os.stat(blobs.get_blob_path(blobs.hash_file(str(source / "a.txt"))))
+    for copy in ("one", "two"):
+        for name in ("a.txt", "b.txt"):
+            assert os.stat(tmp_path / copy / name).st_ino == blob.st_ino
+        assert (tmp_path / copy / "data" / "app.db").read_text() == "database\n"
+
+
+def test_writable_paths_are_copied(tmp_path):
+    source = make_source(tmp_path / "source")
+    store = no_reflinks(BlobStore())
+    store.materialise_tree(str(source), str(tmp_path / "one"), AppTree(str(source)), copy=["data"])
+    assert os.stat(tmp_path / "one" / "data" / "app.db").st_nlink == 1
+    assert os.stat(tmp_path / "one" / "a.txt").st_nlink > 1
+
+    assert storage.get_writable_mounts("services:\n  web:\n    volumes:\n      - ./data:/data\n"
+                                       "      - ./a.txt:/a.txt:ro\n      - logs:/logs\n      - /etc:/host\n"
+                                       "      - {type: bind, source: ./b.txt, target: /b}\n"
+                                       "      - {type: bind, source: ./c, target: /c, read_only: true}\n") == \
+        ["data", "b.txt"]
+    # Mounted writable by an upgrade, after it was linked
+    blobs.copy_links(str(tmp_path / "one"), ["a.txt"])
+    assert os.stat(tmp_path / "one" / "a.txt").st_nlink == 1
+    assert (tmp_path / "one" / "a.txt").read_text() == "shared\n"
+
+
+def test_blob_written_through_a_link_is_replaced(tmp_path):
+    source = make_source(tmp_path / "source")
+    store = no_reflinks(BlobStore())
+    store.materialise_tree(str(source), str(tmp_path / "one"), AppTree(str(source)))
+    with open(tmp_path / "one" / "a.txt", "a") as f:
+        f.write("changed by a container\n")
+    store.materialise_tree(str(source), str(tmp_path / "two"), AppTree(str(source)))
+    assert (tmp_path / "two" / "a.txt").read_text() == "shared\n"
+    assert (tmp_path / "two" / "b.txt").read_text() == "shared\n"
+
+
+def test_reinstall_reads_nothing_again(tmp_path, monkeypatch):
+    source = make_source(tmp_path / "source")
+    store = no_reflinks(BlobStore())
+    reads = count_reads(monkeypatch)
+    store.materialise_tree(str(source), str(tmp_path / "one"), AppTree(str(source)))
+    assert len(reads) == 3
+    reads.clear()
+    # A fresh store, as in the next composer run
+    no_reflinks(BlobStore()).materialise_tree(str(source), str(tmp_path / "two"), AppTree(str(source)))
+    assert reads == []
+
+
+def test_prune_keeps_blobs_which_are_copied(tmp_path, monkeypatch):
+    source = make_source(tmp_path / "source")
+
+    def link(source, target):
+        raise OSError(errno.EXDEV, "Cross-device link")
+
+    # As if the store were on another filesystem, so every blob has a single link
+    monkeypatch.setattr(blobs.os, "link", link)
+    monkeypatch.setattr(storage, "_blob_store", None)
+    store = no_reflinks(storage.get_blob_store())
+    for application_id in ("one", "two"):
+        store.materialise_tree(str(source), os.path.join(storage.get_compose_loc(application_id), "guid"),
+                               AppTree(str(source)))
+    assert blob_count() == 2
+    assert blobs.prune() == 0
+
+    storage.remove("one")
+    assert blobs.prune() == 0
+    storage.remove("two")
+    assert blobs.prune() == 2
+    assert blob_count() == 0
@@ -0,0 +1,48 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import fake_compose
+from composition import registry, storage
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLE = os.path.join(REPO, "examples", "basic_application")
+INSTALLS = 8
+
+
+def run_all(commands, env, cwd):
+    processes = [subprocess.Popen(command, env=env, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                 for command in commands]
+    outputs = [process.communicate(timeout=120)[0].decode() for process in processes]
+    for process, output in zip(processes, outputs):
+        assert process.returncode == 0, output
+
+
+def test_concurrent_installs(tmp_path):
+    bin_dir = tmp_path / "bin"
+    fake_compose.install(str(bin_dir), latency=0.05)
+    app = tmp_path / "app"
+    shutil.copytree(EXAMPLE, app)
+    env = dict(os.environ, PATH=f"{bin_dir}{os.pathsep}{os.environ['PATH']}", PYTHONPATH=REPO)
+
+    run_all([[sys.executable, "-m", "composition.composer", "install", "-i", f"app{i}", "-p", "false"]
+             for i in range(INSTALLS)], env, app)
+    assert sorted(row["application_id"] for row in registry.list_all()) == [f"app{i}" for i in range(INSTALLS)]
+    for i in range(INSTALLS):
+        assert len(storage.get_app_config(f"app{i}")["apps"]) == 1
+
+    # Many processes adding records to the same application must not lose any of them
+    script = ("import sys; from composition import storage\n"
+              "for n in range(20):\n"
+              "    storage.append_to_app_config({'name': f'{sys.argv[1]}-{n}', 'guid': f'{sys.argv[1]}-{n}'}, 'app0')\n")
+    run_all([[sys.executable, "-c", script, f"writer{i}"] for i in range(INSTALLS)], env, app)
+    names = [record["name"] for record in storage.get_app_config("app0")["apps"]]
+    assert len(names) == 1 + 20 * INSTALLS
+
+    run_all([[sys.executable, "-m", "composition.composer", "delete", f"app{i}"] for i in range(INSTALLS)], env, app)
+    assert registry.list_all() == []
+    composer_home = os.path.join(os.environ["HOME"], ".composer")
+    assert not [name for name in os.listdir(composer_home) if name.startswith("app")]
+    # The last uninstall pruned every blob
+    assert not any(files for _, _, files in os.walk(os.path.join(composer_home, "blobs")))
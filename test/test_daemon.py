@@ -0,0 +1,75 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import fake_compose
+from apptree import generate_app
+from composition import client
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_client(*args, **env):
+    return subprocess.run([sys.executable, "-c", "from composition.client import main; main()", *args],
+                          capture_output=True, text=True, env={**os.environ, "PYTHONPATH": ROOT, **env})
+
+
+@pytest.fixture
+def daemon(composer_home, tmp_path):
+    log_path = tmp_path / "composerd.log"
+    with open(log_path, "w") as log:
+        process = subprocess.Popen([sys.executable, "-c", "from composition.daemon import main; main()"],
+                                   stdout=log, stderr=subprocess.STDOUT,
+                                   env={**os.environ, "PYTHONPATH": ROOT})
+    deadline = time.time() + 10
+    while not os.path.exists(client.get_socket_path()) and time.time() < deadline:
+        time.sleep(0.05)
+    yield log_path
+    process.terminate()
+    process.wait(timeout=10)
+    assert not os.path.exists(client.get_socket_path())
+
+
+def test_commands_are_served_by_the_daemon(daemon):
+    out = run_client("version")
+    assert out.returncode == 0
+    assert "composer version" in out.stderr
+    out = run_client("subapps", "missing")
+    assert out.returncode == 1
+    assert "Could not find application missing" in out.stdout + out.stderr
+    log = daemon.read_text()
+    assert "composer version exited with 0" in log
+    assert "composer subapps missing exited with 1" in log
+
+
+def test_commands_run_in_process_without_the_daemon(daemon):
+    out = run_client("version", COMPOSER_NO_DAEMON="1")
+    assert out.returncode == 0
+    assert "composer version" in out.stderr
+    assert "composer version exited" not in daemon.read_text()
+
+
+def test_commands_run_side_by_side(daemon, tmp_path):
+    # Only the client's PATH has this docker-compose, which takes a while for every command
+    fake_compose.install(str(tmp_path / "bin"), latency=1.5)
+    app = generate_app(str(tmp_path / "app"), subapps=1)
+    path = f"{tmp_path / 'bin'}{os.pathsep}{os.environ['PATH']}"
+    install = subprocess.Popen([sys.executable, "-c", "from composition.client import main; main()", "install",
+                                "--id", "shop"], cwd=app, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                               env={**os.environ, "PYTHONPATH": ROOT, "PATH": path})
+    time.sleep(1)
+    start = time.time()
+    assert run_client("list").returncode == 0
+    assert time.time() - start < 1.5
+    output, _ = install.communicate(timeout=30)
+    assert install.returncode == 0, output
+    assert "composer install --id shop exited with 0" in daemon.read_text()
+
+
+def test_client_environment_is_used(daemon, tmp_path):
+    out = run_client("-b", "engine", "list", "--live", DOCKER_HOST=f"unix://{tmp_path / 'other.sock'}")
+    assert out.returncode == 1
+    assert f"Cannot reach the Docker daemon at {tmp_path / 'other.sock'}" in out.stdout + out.stderr
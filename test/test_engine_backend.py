@@ -0,0 +1,229 @@
+import http.client
+import json
+import socketserver
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from composition import engine as engine_client
+from composition.engine import EngineClient, EngineConnectionError
+from composition.engine_backend import EngineBackend, PROJECT_LABEL, get_environment, parse_port
+from composition.models import SERVICE_LABEL
+
+COMPOSE = """
+services:
+  web:
+    image: nginx:1.25
+    command: nginx -g 'daemon off;'
+    ports: ["8080:80"]
+    volumes: ["./html:/usr/share/nginx/html:ro", "data:/data"]
+    environment:
+      MODE: test
+    depends_on: [db]
+  db:
+    image: postgres
+"""
+
+
+class FakeEngine(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        super().__init__(path, EngineHandler)
+        self.containers = {}
+        self.networks = {}
+        self.requests = []
+        self.connections = 0
+
+
+class EngineHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def address_string(self):
+        return "fake"
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=None, content_type="application/json"):
+        content = json.dumps(body).encode() if content_type == "application/json" else body or b""
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def handle_request(self, method):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length)) if length else None
+        self.server.requests.append((method, url.path))
+        containers = self.server.containers
+        parts = url.path.strip("/").split("/")
+        if url.path == "/containers/json":
+            labels = json.loads(query["filters"])["label"]
+            self.reply(200, [c for c in containers.values()
+                             if all(c["Labels"].get(k) == v for k, v in (label.split("=") for label in labels))])
+        elif url.path == "/containers/create":
+            container_id = f"id-{len(containers)}"
+            containers[container_id] = {"Id": container_id, "Names": [query["name"]], "State": "created",
+                                        "Labels": body["Labels"], "Config": body}
+            self.reply(201, {"Id": container_id})
+        elif parts[0] == "containers" and parts[-1] == "start":
+            containers[parts[1]]["State"] = "running"
+            self.reply(204, b"", "text/plain")
+        elif parts[0] == "containers" and parts[-1] == "stop":
+            containers[parts[1]]["State"] = "exited"
+            self.reply(204, b"", "text/plain")
+        elif parts[0] == "containers" and method == "DELETE":
+            del containers[parts[1]]
+            self.reply(204, b"", "text/plain")
+        elif parts[0] == "containers" and parts[-1] == "json":
+            self.reply(200, {"Id": parts[1], "Config": {"Tty": False}})
+        elif parts[0] == "containers" and parts[-1] == "logs":
+            frames = b"".join(struct.pack(">BxxxL", stream, len(line)) + line
+                              for stream, line in [(1, b"one\ntw"), (2, b"o\n"), (1, b"three\n")])
+            self.reply(200, frames, "application/vnd.docker.raw-stream")
+        elif url.path == "/networks" and method == "GET":
+            self.reply(200, list(self.server.networks.values()))
+        elif url.path == "/networks/create":
+            self.server.networks[body["Name"]] = {"Id": body["Name"], "Name": body["Name"], "Labels": body["Labels"]}
+            self.reply(201, {"Id": body["Name"]})
+        elif parts[0] == "networks" and method == "DELETE":
+            del self.server.networks[parts[1]]
+            self.reply(204, b"", "text/plain")
+        else:
+            self.reply(404, {"message": f"no route for {url.path}"})
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+
+@pytest.fixture
+def engine(tmp_path):
+    server = FakeEngine(str(tmp_path / "docker.sock"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def compose_path(tmp_path):
+    app = tmp_path / "moon_baboon"
+    app.mkdir()
+    (app / "docker-compose.yaml").write_text(COMPOSE)
+    return str(app / "docker-compose.yaml")
+
+
+def test_up_creates_and_starts_in_dependency_order(engine, compose_path, tmp_path):
+    backend = EngineBackend(EngineClient(engine.server_address))
+    assert backend.up(compose_path)
+    containers = list(engine.containers.values())
+    assert [c["Labels"][SERVICE_LABEL] for c in containers] == ["db", "web"]
+    assert all(c["State"] == "running" and c["Labels"][PROJECT_LABEL] == "moon_baboon" for c in containers)
+    web = containers[1]["Config"]
+    assert web["Cmd"] == ["nginx", "-g", "daemon off;"]
+    assert web["HostConfig"]["Binds"] == [f"{tmp_path}/moon_baboon/html:/usr/share/nginx/html:ro",
+                                          "moon_baboon_data:/data"]
+    assert web["HostConfig"]["PortBindings"] == {"80/tcp": [{"HostIp": "", "HostPort": "8080"}]}
+    assert "moon_baboon_default" in engine.networks
+    # Every request shares one keep-alive connection
+    assert engine.connections == 1
+
+
+def test_up_again_leaves_running_containers(engine, compose_path):
+    backend = EngineBackend(EngineClient(engine.server_address))
+    assert backend.up(compose_path)
+    engine.requests.clear()
+    assert backend.up(compose_path)
+    assert not any(path.endswith(("/create", "/start")) for _, path in engine.requests)
+
+
+def test_down_removes_containers_and_network(engine, compose_path):
+    backend = EngineBackend(EngineClient(engine.server_address))
+    assert backend.up(compose_path)
+    assert backend.down(compose_path, force=True)
+    assert engine.containers == {}
+    assert engine.networks == {}
+
+
+def test_logs_are_demultiplexed(engine, compose_path, capsys):
+    backend = EngineBackend(EngineClient(engine.server_address))
+    assert backend.up(compose_path)
+    assert backend.logs([("moon_baboon", compose_path, ["web"])])
+    assert capsys.readouterr().out.splitlines() == ["moon_baboon | web | one", "moon_baboon | web | two",
+                                                    "moon_baboon | web | three"]
+
+
+def test_up_refuses_to_build(engine, tmp_path):
+    path = tmp_path / "docker-compose.yaml"
+    path.write_text("services:\n  app:\n    build: .\n")
+    assert not EngineBackend(EngineClient(engine.server_address)).up(str(path))
+
+
+def test_compose_values_are_translated(tmp_path):
+    (tmp_path / ".env").write_text("# comment\nA=1\nB=2\n")
+    service = {"env_file": ".env", "environment": ["B=3", "C=4"]}
+    assert get_environment(str(tmp_path), service) == ["A=1", "B=3", "C=4"]
+    assert parse_port("127.0.0.1:53:53/udp") == ("127.0.0.1", "53", "53/udp")
+    assert parse_port(9000) == ("", "", "9000/tcp")
+
+
+def test_unreachable_daemon_is_reported(tmp_path, caplog):
+    backend = EngineBackend(EngineClient(str(tmp_path / "missing.sock")))
+    compose_path = tmp_path / "moon_baboon" / "docker-compose.yaml"
+    compose_path.parent.mkdir()
+    compose_path.write_text(COMPOSE)
+    assert not backend.up(str(compose_path))
+    assert not backend.down(str(compose_path))
+    assert backend.containers("io.composer.application") is None
+    assert not backend.image_exists("nginx")
+    assert not backend.logs([("moon_baboon", str(compose_path), None)])
+    assert f"Cannot reach the Docker daemon at {tmp_path / 'missing.sock'}" in caplog.text
+
+
+class BrokenConnection:
+    def __init__(self, error):
+        self.error = error
+
+    def request(self, *args, **kwargs):
+        raise self.error
+
+    def close(self):
+        pass
+
+
+def test_only_safe_requests_are_retried(tmp_path, monkeypatch):
+    created = []
+    monkeypatch.setattr(engine_client, "UnixHTTPConnection", lambda path: created.append(path) or BrokenConnection(
+        ConnectionRefusedError()))
+    client = EngineClient(str(tmp_path / "docker.sock"))
+    # Timing out after sending a create might mean it was created, so it isn't sent again
+    client.pool.put(BrokenConnection(TimeoutError()))
+    with pytest.raises(EngineConnectionError):
+        client.request("POST", "/containers/create")
+    assert created == []
+    client.pool.put(BrokenConnection(TimeoutError()))
+    with pytest.raises(EngineConnectionError):
+        client.request("GET", "/containers/json")
+    assert len(created) == 1
+    # A keep-alive connection closed by the daemon never delivered the request
+    client.pool.put(BrokenConnection(http.client.RemoteDisconnected()))
+    with pytest.raises(EngineConnectionError):
+        client.request("POST", "/containers/create")
+    assert len(created) == 2
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+import fake_compose
+from apptree import generate_app
+from composition import cli_backend, directory
+from composition.models import Context, Status
+from composition.tree import AppTree
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    root = generate_app(str(tmp_path / "app"), subapps=3, depth=2, configmaps=2, files=2, values=12)
+    monkeypatch.chdir(root)
+    monkeypatch.setattr(cli_backend, "_compose_binary", None)
+    return root
+
+
+def use_fake(tmp_path, monkeypatch, **settings):
+    fake_compose.install(str(tmp_path / "bin"), **settings)
+    monkeypatch.setenv("PATH", f"{tmp_path / 'bin'}{os.pathsep}{os.environ['PATH']}")
+
+
+def test_generated_app_shape(app):
+    tree = AppTree(app)
+    assert len(tree.app_roots) == 4
+    assert all(len(tree.configmaps[root]) == 2 for root in tree.app_roots)
+
+
+def test_install_and_logs(app, tmp_path, monkeypatch, capfd):
+    use_fake(tmp_path, monkeypatch, log_lines=5)
+    directory.handle_install(application_id="fleet", always_pull="false")
+    directory.handle_logs(["fleet"], application="sub0")
+    assert capfd.readouterr().out.count("log line") == 5
+
+
+def test_failing_up_is_reported(app, tmp_path, monkeypatch):
+    use_fake(tmp_path, monkeypatch, failure_rate=1.0)
+    with pytest.raises(SystemExit):
+        directory.handle_install(application_id="fleet", always_pull="false")
+    assert Context.get_application("fleet").status == Status.ERROR
@@ -0,0 +1,40 @@
+import os
+
+from composition.ignore import IgnoreMatcher
+from composition.tree import AppTree
+
+
+def test_gitignore_semantics():
+    matcher = IgnoreMatcher([
+        "# a comment",
+        "",
+        "*.log",
+        "!keep.log",
+        "/build",
+        "docs/*.md",
+        "**/tmp/**",
+        "cache/",
+    ], "/root")
+    assert matcher.is_ignored("debug.log")
+    assert matcher.is_ignored("sub/dir/debug.log")
+    assert not matcher.is_ignored("sub/keep.log")
+    assert matcher.is_ignored("build", is_dir=True)
+    assert not matcher.is_ignored("sub/build", is_dir=True)
+    assert matcher.is_ignored("docs/readme.md")
+    assert not matcher.is_ignored("docs/nested/readme.md")
+    assert matcher.is_ignored("a/tmp/b/file.txt")
+    assert matcher.is_ignored("sub/cache", is_dir=True)
+    assert not matcher.is_ignored("sub/cache", is_dir=False)
+    assert not matcher.is_ignored("template.yaml")
+
+
+def test_tree_walk_prunes_ignored_directories(tmp_path):
+    source = os.path.join(tmp_path, "source")
+    for path in ["template.yaml", "build/out/index.js", "sub/app.log", "sub/keep.log", "sub/values.yaml"]:
+        os.makedirs(os.path.dirname(os.path.join(source, path)), exist_ok=True)
+        open(os.path.join(source, path), "w").close()
+    tree = AppTree(source, IgnoreMatcher(["build/", "*.log", "!keep.log"], source))
+    indexed = sorted(os.path.relpath(os.path.join(d, f), source) for d, (_, files) in tree.directories.items()
+                     for f in files)
+    assert indexed == ["sub/keep.log", "sub/values.yaml", "template.yaml"]
+    assert not any(os.path.relpath(d, source).startswith("build") for d in tree.directories)
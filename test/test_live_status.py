@@ -0,0 +1,103 @@
+import json
+import logging
+import os
+import sys
+
+import yaml
+
+import fake_compose
+from apptree import generate_app
+from composition import backend, cli_backend, directory, list_apps, registry, storage
+from composition.backend import ComposeBackend
+from composition.models import APPLICATION_LABEL, SUBAPP_LABEL, SERVICE_LABEL
+
+
+class FakeBackend(ComposeBackend):
+    def __init__(self, containers):
+        self.queries = []
+        self.found = containers
+
+    def containers(self, label):
+        self.queries.append(label)
+        return self.found
+
+
+def container(application_id, state):
+    return {"state": state, "labels": {APPLICATION_LABEL: application_id, SUBAPP_LABEL: "guid"}}
+
+
+def test_services_are_labelled():
+    output = storage.add_labels("services:\n  web:\n    image: busybox\n    labels:\n      - team=shop\n"
+                                "  db:\n    image: postgres\n", "moon", "guid-1")
+    compose = yaml.safe_load(output)
+    assert compose["services"]["web"]["labels"] == {"team": "shop", APPLICATION_LABEL: "moon", SUBAPP_LABEL: "guid-1"}
+    assert compose["services"]["db"]["labels"] == {APPLICATION_LABEL: "moon", SUBAPP_LABEL: "guid-1"}
+    assert storage.add_labels("not: [a compose", "moon", "guid-1") == "not: [a compose"
+
+
+def test_installed_compose_files_are_labelled(tmp_path, monkeypatch):
+    monkeypatch.chdir(generate_app(str(tmp_path / "app"), subapps=1))
+    monkeypatch.setattr(cli_backend, "_compose_binary", None)
+    fake_compose.install(str(tmp_path / "bin"))
+    monkeypatch.setenv("PATH", f"{tmp_path / 'bin'}{os.pathsep}{os.environ['PATH']}")
+    directory.handle_install(application_id="shop", always_pull="false")
+    config = storage.load_app_config(storage.get_compose_loc("shop"))
+    for subapp in config.teardown_order():
+        compose = storage.get_yaml(os.path.join(config.compose_location(subapp), "docker-compose.yaml"))
+        for service in compose["services"].values():
+            assert service["labels"] == {APPLICATION_LABEL: "shop", SUBAPP_LABEL: subapp.guid}
+
+
+def test_live_status_uses_one_query(monkeypatch, caplog):
+    storage.create_storage_if_not_exist()
+    for application_id in ("up", "partial", "down", "gone"):
+        os.makedirs(storage.get_compose_loc(application_id))
+        storage.append_to_app_config({"name": application_id, "version": "1.0.0", "guid": "guid", "timestamp": 1.0,
+                                      "compose_name": "/tmp/template.yaml"}, application_id)
+    registry.rebuild()
+    fake = FakeBackend([container("up", "running"), container("up", "running"), container("partial", "running"),
+                        container("partial", "exited"), container("down", "exited")])
+    monkeypatch.setitem(backend._backends, "cli", fake)
+    with caplog.at_level(logging.INFO):
+        list_apps.list_applications(quiet=False, live=True)
+    assert fake.queries == [APPLICATION_LABEL]
+    rows = {record.app_id: (record.status, record.containers) for record in caplog.records}
+    assert rows["up"] == ("RUNNING", "2/2")
+    assert rows["partial"] == ("PARTIAL", "1/2")
+    assert rows["down"] == ("EXITED", "0/1")
+    assert rows["gone"] == ("MISSING", "0/0")
+
+
+def test_docker_ps_labels_are_parsed():
+    parsed = cli_backend.parse_ps_line("exited\tExited (0) 2 seconds ago\tmoon\tguid-1\t\tweb")
+    assert parsed == {"state": "exited", "status": "Exited (0) 2 seconds ago",
+                      "labels": {APPLICATION_LABEL: "moon", SUBAPP_LABEL: "guid-1", SERVICE_LABEL: "web"}}
+
+
+FAKE_DOCKER = """import json, re, sys
+labels = json.loads(sys.argv[1])
+template = sys.argv[-1].replace("{{.State}}", "running").replace("{{.Status}}", "Up 1 second")
+template = template.replace("{{.Labels}}", ",".join(f"{k}={v}" for k, v in labels.items()))
+print(re.sub(r'{{.Label "([^"]+)"}}', lambda match: labels.get(match.group(1), ""), template))
+"""
+
+
+def test_docker_ps_labels_with_commas(tmp_path, monkeypatch):
+    labels = {"traefik.http.routers.web.rule": "Host(`a`,`b`)", APPLICATION_LABEL: "moon", SUBAPP_LABEL: "guid-1"}
+    docker = tmp_path / "docker"
+    docker.write_text(f"#!/bin/sh\nexec {sys.executable} {tmp_path / 'docker.py'} '{json.dumps(labels)}' \"$@\"\n")
+    docker.chmod(0o755)
+    (tmp_path / "docker.py").write_text(FAKE_DOCKER)
+    monkeypatch.setattr(cli_backend, "_docker_binary", str(docker))
+    containers = cli_backend.CliBackend().containers(APPLICATION_LABEL)
+    assert containers == [{"state": "running", "status": "Up 1 second",
+                           "labels": {APPLICATION_LABEL: "moon", SUBAPP_LABEL: "guid-1"}}]
+
+
+def test_labelling_leaves_everything_else_as_it_was():
+    output = storage.add_labels("x-common: &common\n  labels:\n    team: shop\nservices:\n  web:\n    <<: *common\n"
+                                "    environment:\n      FLAG: yes\n      DEBUG: off\n      MODE: 0644\n", "123", "guid-1")
+    assert "FLAG: yes\n" in output and "DEBUG: off\n" in output and "MODE: 0644\n" in output
+    compose = yaml.safe_load(output)
+    assert compose["services"]["web"]["labels"] == {"team": "shop", APPLICATION_LABEL: "123", SUBAPP_LABEL: "guid-1"}
+    assert compose["x-common"]["labels"] == {"team": "shop"}
@@ -0,0 +1,56 @@
+import threading
+import time
+
+import pytest
+
+from composition import locking
+
+
+def test_shared_holders_run_at_the_same_time():
+    holding = threading.Barrier(3, timeout=5)
+
+    def hold():
+        with locking.blobs_lock(shared=True):
+            # Only passes once every thread is inside the lock together
+            holding.wait()
+
+    threads = [threading.Thread(target=hold) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not holding.broken
+
+
+def test_exclusive_waits_for_shared_holders():
+    order = []
+    inside = threading.Event()
+
+    def hold_shared():
+        with locking.blobs_lock(shared=True):
+            inside.set()
+            time.sleep(0.2)
+            order.append("shared")
+
+    thread = threading.Thread(target=hold_shared)
+    thread.start()
+    inside.wait(5)
+    with locking.blobs_lock():
+        order.append("exclusive")
+    thread.join()
+    assert order == ["shared", "exclusive"]
+
+
+def test_reentry():
+    with locking.blobs_lock():
+        with locking.blobs_lock(shared=True), locking.blobs_lock():
+            pass
+    with locking.blobs_lock(shared=True):
+        with locking.blobs_lock(shared=True):
+            pass
+        with pytest.raises(RuntimeError):
+            with locking.blobs_lock():
+                pass
+    # Everything was released
+    with locking.blobs_lock():
+        pass
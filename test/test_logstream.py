@@ -0,0 +1,44 @@
+import sys
+
+import pytest
+
+from composition.logstream import stream_logs
+
+
+def producer(count):
+    return [sys.executable, "-c", f"for i in range({count}): print(f'line {{i}}')"]
+
+
+def test_streams_are_interleaved_with_prefixes(capsys):
+    assert stream_logs([("app/first", producer(3000)), ("app/second-app", producer(5))])
+    messages = capsys.readouterr().out.splitlines()
+    assert len(messages) == 3005
+    assert "app/first      | line 2999" in messages
+    assert "app/second-app | line 4" in messages
+
+
+def test_grep_filters_lines(capsys):
+    assert stream_logs([("app/first", producer(20)), ("app/second", producer(20))], grep=r"line 1\d")
+    assert len(capsys.readouterr().out.splitlines()) == 20
+
+
+def test_failed_command_is_reported():
+    assert not stream_logs([("app/failing", [sys.executable, "-c", "import sys; sys.exit(3)"])])
+
+
+def test_invalid_grep_is_a_usage_error():
+    from click.testing import CliRunner
+    from composition.composer import logs_cmd
+    result = CliRunner().invoke(logs_cmd, ["moon_baboon", "--grep", "("])
+    assert result.exit_code == 2
+    assert "not a valid regular expression" in result.output
+    with pytest.raises(SystemExit):
+        stream_logs([("app/first", producer(1))], grep="(")
+
+
+def test_invalid_since_is_a_usage_error():
+    from click.testing import CliRunner
+    from composition.composer import logs_cmd
+    result = CliRunner().invoke(logs_cmd, ["moon_baboon", "--since", "yesterday"])
+    assert result.exit_code == 2
+    assert "not a timestamp" in result.output
@@ -0,0 +1,51 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from composition import registry, storage
+from composition.cli_backend import CliBackend
+from composition.manifest import install_manifest
+
+FILES = {
+    "app.yaml": "name: shop\nversion: 1.0.0\n",
+    "template.yaml": "services:\n  shop:\n    image: shop:{{ tag }}\n    environment:\n      REGION: {{ region }}\n",
+    "values.yaml": "tag: 1.0\nregion: us\n",
+    "eu.yaml": "region: eu\n",
+    "db/app.yaml": "name: db\nversion: 1.0.0\n",
+    "db/template.yaml": "services:\n  db:\n    image: postgres\n",
+}
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    app = tmp_path / "app"
+    for path, content in FILES.items():
+        os.makedirs(os.path.dirname(app / path), exist_ok=True)
+        (app / path).write_text(content)
+    (app / "fleet.yaml").write_text("instances:\n  - id: shop-us\n  - id: shop-eu\n    values: [values.yaml, eu.yaml]\n"
+                                    "  - id: shop-beta\n    set: [tag=2.0]\n")
+    monkeypatch.chdir(app)
+    # docker-compose itself is never run
+    monkeypatch.setattr(CliBackend, "check", lambda self: None)
+    storage.create_storage_if_not_exist()
+    return app
+
+
+@patch("composition.api.compose_up", return_value=True)
+def test_every_instance_is_installed(mock_compose_up, app):
+    install_manifest("fleet.yaml", always_pull="false", processes=2)
+    assert sorted(row["application_id"] for row in registry.list_all()) == ["shop-beta", "shop-eu", "shop-us"]
+    assert mock_compose_up.call_count == 6
+    for application_id, expected in [("shop-us", "REGION: us"), ("shop-eu", "REGION: eu"), ("shop-beta", "shop:2.0")]:
+        parent = storage.get_app_config(application_id)["apps"][0]
+        with open(os.path.join(storage.get_compose_loc(application_id), parent["guid"], "docker-compose.yaml")) as f:
+            assert expected in f.read()
+
+
+@patch("composition.api.compose_up", return_value=True)
+def test_installed_ids_are_refused(mock_compose_up, app):
+    install_manifest("fleet.yaml", always_pull="false", processes=1)
+    with pytest.raises(SystemExit):
+        install_manifest("fleet.yaml", always_pull="false", processes=1)
+    assert mock_compose_up.call_count == 6
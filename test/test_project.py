@@ -0,0 +1,69 @@
+import os
+
+import fake_compose
+from apptree import generate_app
+from composition import cli_backend, directory, project, storage, upgrade
+from composition.models import SERVICE_NAME_LABEL
+
+
+def write_subapp(root, name, compose, depends_on=None):
+    path = os.path.join(root, name, "docker-compose.yaml")
+    os.makedirs(os.path.dirname(path))
+    with open(path, "w") as f:
+        f.write(compose)
+    details = {"name": name, "dependsOn": depends_on} if depends_on else {"name": name}
+    return {"name": name, "guid": f"guid-{name}", "directory": os.path.join("/apps", name), "path": path,
+            "app_details": details}
+
+
+def test_subapps_are_namespaced(tmp_path):
+    store = str(tmp_path)
+    database = write_subapp(store, "database", "services:\n  db:\n    image: postgres\n    volumes:\n"
+                                               "      - data:/var/lib/postgresql/data\n      - ./init:/init:ro\n"
+                                               "volumes:\n  data:\n")
+    web = write_subapp(store, "web", "services:\n  web:\n    image: nginx\n    depends_on: [db]\n"
+                                     "    env_file: web.env\n    networks: [front]\n"
+                                     "  db:\n    image: redis\nnetworks:\n  front:\n", depends_on=["database"])
+    compose, services = project.merge_subapps([database, web])
+
+    assert services == {"guid-database": {"db": "database-db"}, "guid-web": {"web": "web-web", "db": "web-db"}}
+    db = compose["services"]["database-db"]
+    assert db["volumes"] == ["database-data:/var/lib/postgresql/data", f"{store}/database/init:/init:ro"]
+    assert db["networks"] == {"database-default": {"aliases": ["db"]}}
+    assert db["labels"] == {SERVICE_NAME_LABEL: "db"}
+    assert "database-data" in compose["volumes"]
+    site = compose["services"]["web-web"]
+    # Its own db, and everything in the sub-app it depends on
+    assert site["depends_on"] == ["web-db", "database-db"]
+    assert site["env_file"] == f"{store}/web/web.env"
+    assert site["networks"] == {"web-front": {"aliases": ["web"]}}
+    assert compose["services"]["web-db"]["networks"] == {"web-default": {"aliases": ["db"]}}
+
+
+def test_single_project_install(tmp_path, monkeypatch):
+    monkeypatch.chdir(generate_app(str(tmp_path / "app"), subapps=2))
+    monkeypatch.setattr(cli_backend, "_compose_binary", None)
+    calls = tmp_path / "calls.txt"
+    fake_compose.install(str(tmp_path / "bin"), calls=str(calls))
+    monkeypatch.setenv("PATH", f"{tmp_path / 'bin'}{os.pathsep}{os.environ['PATH']}")
+    directory.handle_install(application_id="shop", always_pull="false", single_project=True)
+
+    project_path = project.get_project_path("shop")
+    assert calls.read_text().splitlines()[-1] == f"-f {project_path} up -d"
+    config = storage.load_app_config(storage.get_compose_loc("shop"))
+    assert config.project["services"] == {subapp.guid: {subapp.name: f"{subapp.name}-{subapp.name}"}
+                                          for subapp in config.subapps}
+
+    with open("values.yaml", "a") as f:
+        f.write("key_1: changed\n")
+    upgrade.upgrade_application("shop")
+    # Still one project, brought up with one call
+    assert calls.read_text().splitlines()[-1] == f"-f {project_path} up -d"
+    assert "sub1-sub1" in storage.get_yaml(project_path)["services"]
+
+    directory.handle_logs(["shop"], application="sub1")
+    assert calls.read_text().splitlines()[-1] == f"-f {project_path} logs sub1-sub1"
+    directory.handle_cmd("shop", ["restart"])
+    assert calls.read_text().splitlines()[-1] == f"-f {project_path} restart"
+    assert directory.handle_delete("shop")
+    assert calls.read_text().splitlines()[-1] == f"-f {project_path} down"
@@ -0,0 +1,60 @@
+import threading
+import time
+from unittest.mock import patch
+
+from composition import cli_backend, pull
+from composition.backend import ComposeBackend
+
+PINNED = "busybox@sha256:" + "a" * 64
+
+
+class FakeBackend(ComposeBackend):
+    def __init__(self):
+        self.pulled = []
+        self.running = 0
+        self.most_running = 0
+        self.lock = threading.Lock()
+
+    def image_exists(self, image):
+        return image == PINNED
+
+    def pull_image(self, image):
+        with self.lock:
+            self.pulled.append(image)
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        return image != "private/missing:1.0"
+
+
+def make_subapp(tmp_path, name, images, always_pull=True):
+    path = tmp_path / f"{name}.yaml"
+    services = "".join(f"  service{i}:\n    image: {image}\n" for i, image in enumerate(images))
+    path.write_text(f"services:\n{services}  built:\n    build: .\n    image: local/built\n")
+    return {"name": name, "path": str(path), "app_details": {"name": name, "alwaysPull": always_pull}}
+
+
+def test_images_are_pulled_once_and_concurrently(tmp_path):
+    subapps = [
+        make_subapp(tmp_path, "first", ["postgres:15", "redis", PINNED]),
+        make_subapp(tmp_path, "second", ["redis:latest", "postgres:15", "private/missing:1.0"]),
+        make_subapp(tmp_path, "third", ["nginx"], always_pull=False),
+    ]
+    backend = FakeBackend()
+    with patch("composition.pull.get_backend", return_value=backend):
+        results = pull.prepull(subapps, None, parallel=2)
+    assert sorted(backend.pulled) == ["postgres:15", "private/missing:1.0", "redis:latest"]
+    assert backend.most_running == 2
+    assert {result["image"]: result["result"] for result in results} == {
+        "postgres:15": "PULLED", "redis:latest": "PULLED", PINNED: "CACHED", "private/missing:1.0": "FAILED"}
+
+
+def test_pulls_without_docker_fail_rather_than_exit(tmp_path, monkeypatch):
+    monkeypatch.setattr(cli_backend.shutil, "which", lambda name: None)
+    monkeypatch.setattr(cli_backend, "_docker_binary", None)
+    subapps = [make_subapp(tmp_path, "first", ["redis", PINNED])]
+    with patch("composition.pull.get_backend", return_value=cli_backend.CliBackend()):
+        results = pull.prepull(subapps, None)
+    assert [result["result"] for result in results] == ["FAILED", "FAILED"]
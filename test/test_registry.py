@@ -0,0 +1,33 @@
+import os
+import shutil
+
+from composition import registry, storage
+from composition.models import Context, Status
+
+
+def install_app(application_id):
+    os.makedirs(storage.get_compose_loc(application_id))
+    storage.append_to_app_config({"name": "test-application", "version": "1.0.0", "guid": "a-guid",
+                                  "timestamp": 1677333827.98, "compose_name": "/tmp/template.yaml"}, application_id)
+
+
+def test_registry_follows_storage():
+    storage.create_storage_if_not_exist()
+    install_app("first-app")
+    install_app("second-app")
+    storage.update_status("second-app", Status.ERROR)
+    assert [app.id for app in Context.get_applications()] == ["first-app", "second-app"]
+    assert Context.get_application("second-app").status == Status.ERROR
+    storage.remove("first-app")
+    assert [app.id for app in Context.get_applications()] == ["second-app"]
+    assert Context.get_application("first-app") is None
+
+
+def test_rebuild_from_disk():
+    storage.create_storage_if_not_exist()
+    install_app("first-app")
+    # Removed behind composer's back, only a rebuild will notice
+    shutil.rmtree(storage.get_compose_loc("first-app"))
+    install_app("second-app")
+    assert registry.rebuild() == 1
+    assert [app.id for app in Context.get_applications()] == ["second-app"]
@@ -0,0 +1,60 @@
+import io
+import os
+
+from apptree import generate_app
+from composition import rendering, template_cmd
+
+
+def test_include_between_app_files(tmp_path):
+    os.makedirs(tmp_path / "shared")
+    (tmp_path / "shared" / "service.yaml").write_text("image: {{ image }}")
+    (tmp_path / "template.yaml").write_text('services:\n  web:\n    {% include "shared/service.yaml" %}\n')
+    output = rendering.render(str(tmp_path / "template.yaml"), {"image": "busybox"}, root=str(tmp_path))
+    assert output == "services:\n  web:\n    image: busybox"
+    assert rendering.get_environment(str(tmp_path)) is rendering.get_environment(str(tmp_path))
+    assert os.listdir(os.path.join(os.environ["HOME"], ".composer", "cache", "jinja"))
+
+
+def test_dependencies_follow_includes(tmp_path):
+    (tmp_path / "service.yaml").write_text("image: {{ image }}{% for port in ports %}{{ port }}{% endfor %}")
+    (tmp_path / "template.yaml").write_text('{% set name = "web" %}{{ name }}: {% include "service.yaml" %}')
+    (tmp_path / "dynamic.yaml").write_text('{% include which %}')
+    keys, _ = rendering.get_dependencies(str(tmp_path / "template.yaml"), root=str(tmp_path))
+    assert keys == ["image", "ports"]
+    # Anything could be read by a template which is picked at render time
+    assert rendering.get_dependencies(str(tmp_path / "dynamic.yaml"), root=str(tmp_path))[0] is None
+
+    template = str(tmp_path / "template.yaml")
+    _, digest = rendering.get_inputs(template, {"image": "busybox", "ports": [80], "unused": 1}, root=str(tmp_path))
+    assert rendering.get_inputs(template, {"image": "busybox", "ports": [80], "unused": 2},
+                                root=str(tmp_path))[1] == digest
+    assert rendering.get_inputs(template, {"image": "nginx", "ports": [80]}, root=str(tmp_path))[1] != digest
+
+
+def test_streamed_output_matches(tmp_path):
+    (tmp_path / "template.yaml").write_text("services:\n{% for i in range(500) %}  web{{ i }}:\n"
+                                            "    image: {{ image }}\n{% endfor %}")
+    template = str(tmp_path / "template.yaml")
+    out = io.StringIO()
+    rendering.render_to(template, {"image": "busybox"}, out, root=str(tmp_path))
+    assert out.getvalue() == rendering.render(template, {"image": "busybox"}, root=str(tmp_path))
+
+
+def test_template_output_is_not_stored(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "template.yaml").write_text("password: {{ password }}")
+    (tmp_path / "values.yaml").write_text("password: hunter2\n")
+    template_cmd.template(values=["values.yaml"])
+    assert capsys.readouterr().out == "password: hunter2\n"
+    template_cmd.template(values=["values.yaml"], manual_values=["password=changed"])
+    assert capsys.readouterr().out == "password: changed\n"
+    assert not os.path.exists(os.path.join(os.environ["HOME"], ".composer", "cache", "rendered"))
+
+
+def test_template_output_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(generate_app(str(tmp_path / "app"), subapps=2, depth=2))
+    template_cmd.template(values=["values.yaml"], output_dir=str(tmp_path / "out"))
+    rendered = sorted(str(path.relative_to(tmp_path / "out")) for path in (tmp_path / "out").rglob("*") if path.is_file())
+    assert rendered == ["config/config0.configmap", "docker-compose.yaml", "level1/sub1/config/config0.configmap",
+                        "level1/sub1/docker-compose.yaml", "sub0/config/config0.configmap", "sub0/docker-compose.yaml"]
+    assert "KEY_0: \"value-key_0\"" in (tmp_path / "out" / "sub0" / "docker-compose.yaml").read_text()
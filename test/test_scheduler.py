@@ -0,0 +1,68 @@
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+from composition.scheduler import start_subapps
+
+
+def make_subapp(name, directory, depends_on=None):
+    app_details = {"name": name, "version": "1.0.0"}
+    if depends_on is not None:
+        app_details["dependsOn"] = depends_on
+    return {"name": name, "guid": f"{name}-guid", "directory": directory, "path": "", "app_details": app_details}
+
+
+@patch("composition.scheduler.storage.update_status")
+def test_dependencies_start_first_and_parent_last(mock_update_status):
+    subapps = [
+        make_subapp("parent", "/app"),
+        make_subapp("web", "/app/web", depends_on=["db"]),
+        make_subapp("db", "/app/db"),
+        make_subapp("cache", "/app/cache"),
+    ]
+    started = []
+    lock = threading.Lock()
+
+    def start(subapp):
+        time.sleep(0.01)
+        with lock:
+            started.append(subapp["name"])
+        return True
+
+    assert start_subapps(subapps, "anId", start, parallel=4, parent_directory="/app")
+    assert started.index("db") < started.index("web")
+    assert started[-1] == "parent"
+    mock_update_status.assert_not_called()
+
+
+@patch("composition.scheduler.storage.update_status")
+def test_failure_skips_dependents_only(mock_update_status):
+    subapps = [
+        make_subapp("parent", "/app"),
+        make_subapp("web", "/app/web", depends_on=["db"]),
+        make_subapp("db", "/app/db"),
+        make_subapp("cache", "/app/cache"),
+    ]
+    started = []
+
+    def start(subapp):
+        started.append(subapp["name"])
+        return subapp["name"] != "db"
+
+    assert not start_subapps(subapps, "anId", start, parallel=2, parent_directory="/app")
+    assert sorted(started) == ["cache", "db"]
+    mock_update_status.assert_called_once()
+
+
+@patch("composition.scheduler.storage.update_status")
+def test_exit_in_a_worker_fails_the_subapp(mock_update_status):
+    subapps = [make_subapp("parent", "/app"), make_subapp("web", "/app/web")]
+
+    def start(subapp):
+        if subapp["name"] == "web":
+            sys.exit(1)
+        return True
+
+    assert not start_subapps(subapps, "anId", start, parallel=2, parent_directory="/app")
+    mock_update_status.assert_called_once()
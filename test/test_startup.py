@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+from apptree import generate_app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(*args):
+    env = dict(os.environ, HOME=tempfile.mkdtemp(), PATH=os.path.dirname(sys.executable), PYTHONPATH=ROOT)
+    return subprocess.run([sys.executable, *args], env=env, cwd=ROOT, capture_output=True, text=True)
+
+
+def test_heavy_imports_are_deferred():
+    out = run_python("-c", "import sys, composition.composer; "
+                           "print(sorted({'jinja2', 'yaml', 'petname', 'humanize'} & set(sys.modules)))")
+    assert out.stdout.strip() == "[]"
+
+
+def test_version_does_not_need_docker_compose():
+    out = run_python("-m", "composition.composer", "version")
+    assert out.returncode == 0
+    assert "composer version" in out.stderr
+
+
+def test_install_without_docker_compose_changes_nothing(tmp_path):
+    app = generate_app(str(tmp_path / "app"), subapps=1)
+    home = str(tmp_path / "home")
+    env = dict(os.environ, HOME=home, PATH=os.path.dirname(sys.executable), PYTHONPATH=ROOT)
+    out = subprocess.run([sys.executable, "-m", "composition.composer", "install", "-i", "shop"], env=env, cwd=app,
+                         capture_output=True, text=True)
+    assert out.returncode == 1
+    assert "docker-compose is not installed" in out.stdout + out.stderr
+    assert not os.path.exists(os.path.join(home, ".composer", "shop"))
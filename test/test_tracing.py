@@ -0,0 +1,44 @@
+import json
+import logging
+import os
+
+import fake_compose
+from apptree import generate_app
+from composition import cli_backend, directory, tracing
+
+
+def test_disabled_spans_record_nothing(monkeypatch):
+    monkeypatch.setattr(tracing, "_spans", [])
+    with tracing.span("render", subapp="web"):
+        pass
+    assert tracing.get_spans() == []
+
+
+def test_install_phases_are_traced(tmp_path, monkeypatch, caplog):
+    root = generate_app(str(tmp_path / "app"), subapps=2, configmaps=1, files=1)
+    monkeypatch.chdir(root)
+    monkeypatch.setattr(cli_backend, "_compose_binary", None)
+    fake_compose.install(str(tmp_path / "bin"))
+    monkeypatch.setenv("PATH", f"{tmp_path / 'bin'}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(tracing, "_enabled", True)
+    monkeypatch.setattr(tracing, "_spans", [])
+
+    directory.handle_install(application_id="traced", always_pull="false")
+
+    by_subapp = {}
+    for span in tracing.get_spans():
+        by_subapp.setdefault(span.args.get("subapp"), set()).add(span.name)
+    assert by_subapp[None] == {"discover", "values"}
+    for name in ("parent", "sub0", "sub1"):
+        assert by_subapp[name] == {"render", "register", "copy", "up"}
+
+    spans = tracing.get_spans()
+    trace_path = tmp_path / "out.json"
+    with caplog.at_level(logging.INFO):
+        tracing.report(True, str(trace_path))
+    assert "RENDER" in caplog.text and "sub1" in caplog.text
+    events = json.loads(trace_path.read_text())["traceEvents"]
+    assert len(events) == len(spans)
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in events)
+    # Reporting finishes the trace
+    assert not tracing.is_enabled() and tracing.get_spans() == []
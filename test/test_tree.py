@@ -0,0 +1,60 @@
+import os
+
+from composition.blobs import BlobStore
+from composition.ignore import IgnoreMatcher
+from composition.tree import AppTree
+
+
+def make_files(root, paths):
+    for path in paths:
+        os.makedirs(os.path.dirname(os.path.join(root, path)), exist_ok=True)
+        open(os.path.join(root, path), "w").close()
+
+
+def test_configmaps_belong_to_nearest_app(tmp_path):
+    root = str(tmp_path)
+    make_files(root, [
+        "app.yaml", "template.yaml", "config/parent.configmap",
+        "sub/app.yaml", "sub/template.yaml", "sub/sub.configmap",
+        "sub/deeper/app.yaml", "sub/deeper/deeper.configmap",
+        "node_modules/pkg/app.yaml", ".git/x.configmap", "ignored/app.yaml",
+    ])
+    tree = AppTree(root, IgnoreMatcher(["ignored/"], root))
+    assert tree.app_roots == [root, os.path.join(root, "sub"), os.path.join(root, "sub", "deeper")]
+    assert tree.configmaps[root] == [os.path.join(root, "config", "parent.configmap")]
+    assert tree.configmaps[os.path.join(root, "sub")] == [os.path.join(root, "sub", "sub.configmap")]
+    assert tree.owner(os.path.join(root, "sub", "deeper", "deeper.configmap")) == os.path.join(root, "sub", "deeper")
+    assert tree.has_file(os.path.join(root, "sub"), "template.yaml")
+
+    shallow = AppTree(root, IgnoreMatcher(["ignored/"], root), max_depth=1)
+    assert shallow.app_roots == [root, os.path.join(root, "sub")]
+    # Without its own app.yaml counted, the deeper config map now belongs to sub
+    assert os.path.join(root, "sub", "deeper", "deeper.configmap") in shallow.configmaps[os.path.join(root, "sub")]
+
+
+def test_skipped_directories_are_still_stored(tmp_path):
+    root = str(tmp_path / "app")
+    make_files(root, ["app.yaml", "template.yaml", "node_modules/pkg/index.js", "node_modules/pkg/app.yaml",
+                      ".git/HEAD", "node_modules/pkg/ignored.log"])
+    tree = AppTree(root, IgnoreMatcher(["*.log"], root))
+    assert tree.app_roots == [root]
+    store = BlobStore()
+    store.use_reflink = False
+    store.materialise_tree(root, str(tmp_path / "stored"), tree)
+    assert os.path.exists(tmp_path / "stored" / "node_modules" / "pkg" / "index.js")
+    assert os.path.exists(tmp_path / "stored" / ".git" / "HEAD")
+    assert not os.path.exists(tmp_path / "stored" / "node_modules" / "pkg" / "ignored.log")
+
+
+def test_links_back_up_the_tree_are_not_followed(tmp_path):
+    root = str(tmp_path / "app")
+    make_files(root, ["app.yaml", "sub/app.yaml", "a/file", "b/file", "shared/app.yaml"])
+    os.symlink("..", os.path.join(root, "sub", "loop"))
+    # Each links to the other, so only a chain of links leads back round
+    os.symlink("../b", os.path.join(root, "a", "to_b"))
+    os.symlink("../a", os.path.join(root, "b", "to_a"))
+    os.symlink("shared", os.path.join(root, "linked"))
+    tree = AppTree(root)
+    assert sorted(os.path.relpath(app_root, root) for app_root in tree.app_roots) == [".", "linked", "shared", "sub"]
+    assert os.path.join(root, "a", "to_b", "to_a") not in tree.directories
+    assert tree.has_file(os.path.join(root, "a", "to_b"), "file")
@@ -0,0 +1,80 @@
+import logging
+import os
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from composition import registry, storage, uninstall
+
+
+def install(*application_ids):
+    storage.create_storage_if_not_exist()
+    for application_id in application_ids:
+        os.makedirs(storage.get_compose_loc(application_id))
+        storage.append_to_app_config({"name": application_id, "version": "1.0.0", "guid": f"guid-{application_id}",
+                                      "timestamp": 1.0, "compose_name": "/tmp/template.yaml"}, application_id)
+    registry.rebuild()
+
+
+def test_applications_are_deleted_in_parallel():
+    install("one", "two", "three")
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def compose_down(path, application_id, force=False):
+        with lock:
+            running.append(application_id)
+            peak.append(len(running))
+        time.sleep(0.2)
+        with lock:
+            running.remove(application_id)
+        return True
+
+    with patch("composition.directory.api.compose_down", side_effect=compose_down):
+        results = uninstall.delete_applications(["one", "two", "three"], force=False, parallel=3)
+    assert [result["result"] for result in results] == ["DELETED"] * 3
+    assert max(peak) > 1
+    for application_id in ("one", "two", "three"):
+        assert not os.path.exists(storage.get_compose_loc(application_id))
+
+
+def test_partial_failure_and_summary(caplog):
+    install("good", "bad")
+    with patch("composition.directory.api.compose_down",
+               side_effect=lambda path, application_id, force=False: application_id == "good"):
+        with caplog.at_level(logging.INFO), pytest.raises(SystemExit) as exit_info:
+            uninstall.uninstall_application(["good", "bad", "missing", "good"], force=False, all=False)
+    assert exit_info.value.code == 1
+    rows = [record.getMessage().split() for record in caplog.records]
+    assert ["APP", "ID", "RESULT", "TIME"] in rows
+    summary = {row[0]: " ".join(row[1:-1]) for row in rows if row and row[-1].endswith("s") and row[0] != "APP"}
+    assert summary == {"good": "DELETED", "bad": "DELETED (WITH ERRORS)", "missing": "NOT FOUND"}
+    # Even with errors the application is removed
+    assert not os.path.exists(storage.get_compose_loc("bad"))
+
+
+def test_all_deleted_exits_cleanly():
+    install("one")
+    with patch("composition.directory.api.compose_down", return_value=True):
+        uninstall.uninstall_application(["one"], force=True, all=False)
+    assert not os.path.exists(storage.get_compose_loc("one"))
+
+
+def test_only_applications_are_removed():
+    install("real")
+    home = os.environ["HOME"]
+    os.makedirs(storage.get_compose_loc("empty"))
+    storage.get_cache_dir()
+    with open(os.path.join(storage.get_compose_loc("real"), "config.json"), "w") as f:
+        f.write("{not json")
+    with patch("composition.directory.api.compose_down", return_value=True) as compose_down:
+        results = uninstall.delete_applications(["..", ".", "cache", "blobs", "locks", "real/..", "empty", "real"],
+                                                force=True)
+    assert [result["result"] for result in results] == ["NOT FOUND"] * 7 + ["FAILED"]
+    compose_down.assert_not_called()
+    assert os.path.isdir(home)
+    for name in ("cache", "empty", "real"):
+        assert os.path.isdir(os.path.join(home, ".composer", name))
@@ -0,0 +1,87 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from composition import directory, install, storage
+from composition.models import Status
+from composition.upgrade import upgrade_application
+
+
+def make_app(root):
+    files = {
+        "app.yaml": "name: parent\nversion: 1.0.0\n",
+        "template.yaml": "services:\n  parent:\n    image: {{ parent_image }}\n",
+        "values.yaml": "parent_image: busybox\nsub_message: hello\n",
+        "sub/app.yaml": "name: sub\nversion: 1.0.0\n",
+        "sub/template.yaml": "services:\n  sub:\n    image: busybox\n",
+        "sub/conf/message.configmap": "{{ sub_message }}\n",
+    }
+    for path, content in files.items():
+        os.makedirs(os.path.dirname(os.path.join(root, path)), exist_ok=True)
+        with open(os.path.join(root, path), "w") as f:
+            f.write(content)
+
+
+def installed_files(application_id):
+    location = storage.get_compose_loc(application_id)
+    stats = {}
+    for path, _, files in os.walk(location):
+        for f in files:
+            stat = os.stat(os.path.join(path, f))
+            stats[os.path.relpath(os.path.join(path, f), location)] = (stat.st_ino, stat.st_mtime_ns)
+    return stats
+
+
+@patch("composition.cli_backend.CliBackend.check")
+@patch("composition.api.compose_up", return_value=True)
+def test_only_changed_subapps_are_restarted(mock_compose_up, mock_check, tmp_path, monkeypatch):
+    # Not tmp_path itself, which holds the composer home
+    app = tmp_path / "app"
+    make_app(str(app))
+    monkeypatch.chdir(app)
+    storage.create_storage_if_not_exist()
+    directory.handle_install(application_id="moon_baboon", always_pull="false")
+    assert mock_compose_up.call_count == 2
+    mock_compose_up.reset_mock()
+    before = installed_files("moon_baboon")
+
+    # Nothing has changed, so nothing is written and nothing is restarted
+    upgrade_application("moon_baboon", always_pull="false")
+    mock_compose_up.assert_not_called()
+    assert installed_files("moon_baboon") == before
+
+    with patch("composition.install.generate_template_str", wraps=install.generate_template_str) as mock_render:
+        upgrade_application("moon_baboon", manual_values=["sub_message=goodbye"], always_pull="false")
+    # Only the config map uses sub_message, so nothing else is rendered again
+    assert [os.path.basename(call.args[0]) for call in mock_render.call_args_list] == ["message.configmap"]
+    assert [call.args[0] for call in mock_compose_up.call_args_list] == ["sub"]
+    after = installed_files("moon_baboon")
+    # Apart from the new hashes in config.json, only the config map has been rewritten
+    changed = {path for path in after if after[path] != before.get(path)} - {"config.json"}
+    assert len(changed) == 1 and changed.pop().endswith(os.path.join("conf", "message.configmap"))
+    sub_guid = storage.get_app_config("moon_baboon")["apps"][1]["guid"]
+    with open(os.path.join(storage.get_compose_loc("moon_baboon"), sub_guid, "conf", "message.configmap")) as f:
+        assert f.read() == "goodbye"
+
+
+@patch("composition.cli_backend.CliBackend.check")
+@patch("composition.api.compose_up", return_value=True)
+def test_failed_upgrade_is_restarted_again(mock_compose_up, mock_check, tmp_path, monkeypatch):
+    app = tmp_path / "app"
+    make_app(str(app))
+    monkeypatch.chdir(app)
+    storage.create_storage_if_not_exist()
+    directory.handle_install(application_id="moon_baboon", always_pull="false")
+
+    mock_compose_up.return_value = False
+    with pytest.raises(SystemExit):
+        upgrade_application("moon_baboon", manual_values=["sub_message=goodbye"], always_pull="false")
+    assert storage.get_app_config("moon_baboon")["status"] == Status.ERROR
+
+    # The files are already up to date, but the sub-apps are started again rather than marked as running
+    mock_compose_up.reset_mock()
+    mock_compose_up.return_value = True
+    upgrade_application("moon_baboon", manual_values=["sub_message=goodbye"], always_pull="false")
+    assert sorted(call.args[0] for call in mock_compose_up.call_args_list) == ["parent", "sub"]
+    assert storage.get_app_config("moon_baboon")["status"] == Status.RUNNING
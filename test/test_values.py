@@ -0,0 +1,29 @@
+import os
+from unittest.mock import patch
+
+from composition import storage
+from composition.install import consolidate_values
+
+
+def test_consolidate_values(tmp_path):
+    values = tmp_path / "values.yaml"
+    values.write_text("message: hello\nurl: a-url\n")
+    override = tmp_path / "override.yaml"
+    override.write_text("message: overridden\n")
+    all_values = consolidate_values([str(values), str(override)], ["port=8080", "debug=true"])
+    assert all_values == {"message": "overridden", "url": "a-url", "port": 8080.0, "debug": True}
+
+
+def test_values_are_only_parsed_when_changed(tmp_path):
+    values = tmp_path / "values.yaml"
+    values.write_text("message: hello\n")
+    with patch("composition.storage.get_yaml", wraps=storage.get_yaml) as mock_get_yaml:
+        assert storage.get_cached_yaml(str(values)) == {"message": "hello"}
+        # Cached in memory and on disk
+        storage._yaml_cache.clear()
+        assert storage.get_cached_yaml(str(values)) == {"message": "hello"}
+        assert mock_get_yaml.call_count == 1
+        values.write_text("message: a new message\n")
+        os.utime(values, ns=(0, 0))
+        assert storage.get_cached_yaml(str(values)) == {"message": "a new message"}
+        assert mock_get_yaml.call_count == 2
@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+
+from composition import backend, wait
+from composition.backend import ComposeBackend
+from composition.models import APPLICATION_LABEL, SUBAPP_LABEL, SERVICE_LABEL
+
+
+class FakeEvents:
+    """Produces docker events as JSON lines, a little apart, then carries on until stopped like `docker events`."""
+
+    def __init__(self, events, interval=0.02):
+        self.events = events
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def chunks(self):
+        for event in self.events:
+            if self.stopped.wait(self.interval):
+                return
+            yield json.dumps(event).encode() + b"\n"
+        self.stopped.wait()
+
+    def stop(self):
+        self.stopped.set()
+
+
+class FakeBackend(ComposeBackend):
+    def __init__(self, containers, events):
+        self.listed = containers
+        self.source = FakeEvents(events)
+        self.labels = []
+
+    def containers(self, label):
+        self.labels.append(label)
+        return self.listed
+
+    def events(self, label, since):
+        self.labels.append(label)
+        return self.source
+
+
+def labels(service, guid="guid-web"):
+    return {APPLICATION_LABEL: "shop", SUBAPP_LABEL: guid, SERVICE_LABEL: service}
+
+
+def event(action, service, time_nano=None, **attributes):
+    return {"Type": "container", "Action": action, "timeNano": time_nano or time.time_ns() + 10 ** 9,
+            "Actor": {"ID": service, "Attributes": {**labels(service), **attributes}}}
+
+
+def make_subapps(tmp_path):
+    path = tmp_path / "docker-compose.yaml"
+    path.write_text("services:\n  web:\n    image: nginx\n    healthcheck:\n      test: [CMD, curl, localhost]\n"
+                    "  db:\n    image: postgres\n")
+    return [{"guid": "guid-web", "name": "web", "path": str(path)}]
+
+
+def use_backend(monkeypatch, containers, events):
+    fake = FakeBackend(containers, events)
+    monkeypatch.setitem(backend._backends, "cli", fake)
+    return fake
+
+
+def test_waits_for_start_and_health(tmp_path, monkeypatch):
+    fake = use_backend(monkeypatch, [{"state": "running", "status": "Up 1 second (health: starting)",
+                                      "labels": labels("web")}],
+                       [event("start", "db"), event("exec_start: curl localhost", "web"),
+                        event("health_status: healthy", "web")])
+    assert wait.wait_for_application("shop", make_subapps(tmp_path), timeout=10)
+    assert fake.labels == [f"{APPLICATION_LABEL}=shop"] * 2
+    assert fake.source.stopped.is_set()
+
+
+def test_nothing_to_wait_for(tmp_path, monkeypatch):
+    fake = use_backend(monkeypatch, [{"state": "running", "status": "Up 1 minute (healthy)", "labels": labels("web")},
+                                     {"state": "exited", "status": "Exited (0) 5 seconds ago", "labels": labels("db")}],
+                       [])
+    assert wait.wait_for_application("shop", make_subapps(tmp_path), timeout=10)
+    # The events were never needed
+    assert len(fake.labels) == 1
+
+
+def test_fails_fast_when_a_service_dies(tmp_path, monkeypatch):
+    use_backend(monkeypatch, [], [event("start", "web"), event("die", "db", exitCode="1")])
+    start = time.time()
+    assert not wait.wait_for_application("shop", make_subapps(tmp_path), timeout=10)
+    assert time.time() - start < 5
+
+
+def test_events_from_before_the_listing_are_ignored(tmp_path, monkeypatch):
+    use_backend(monkeypatch, [{"state": "running", "status": "Up 1 second", "labels": labels("db")}],
+                [event("die", "db", time_nano=1, exitCode="137"), event("start", "web"),
+                 event("health_status: healthy", "web")])
+    assert wait.wait_for_application("shop", make_subapps(tmp_path), timeout=10)
+
+
+def test_times_out(tmp_path, monkeypatch, caplog):
+    use_backend(monkeypatch, [], [event("start", "db"), event("start", "web")])
+    assert not wait.wait_for_application("shop", make_subapps(tmp_path), timeout=0.5)
+    assert "web/web (starting)" in caplog.text